@@ -0,0 +1,53 @@
+"""
+Embeddings falsos para correr sin descargar MiniLM.
+
+Bolsa de palabras y trigramas de caracteres proyectada con hashing a 384
+dimensiones (las de all-MiniLM-L6-v2) y normalizada: frases parecidas quedan
+cerca, así la caché semántica, el router y FAISS se comportan de forma
+razonable. `segundos_por_texto` simula el costo de inferencia del modelo real.
+"""
+import hashlib
+import re
+import time
+import unicodedata
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+DIMENSION = 384
+
+
+def _normalizar(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _indice(rasgo: str) -> int:
+    return int.from_bytes(hashlib.blake2b(rasgo.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashEmbeddings(Embeddings):
+
+    def __init__(self, dimension: int = DIMENSION, segundos_por_texto: float = 0.002):
+        self.dimension = dimension
+        self.segundos_por_texto = segundos_por_texto
+
+    def _vector(self, texto: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        palabras = re.findall(r"\w+", _normalizar(texto))
+        rasgos = palabras + [f"#{p[i:i + 3]}" for p in palabras for i in range(max(len(p) - 2, 1))]
+        for rasgo in rasgos:
+            h = _indice(rasgo)
+            vector[h % self.dimension] += 1.0 if (h >> 32) & 1 else -1.0
+        norma = np.linalg.norm(vector)
+        return (vector / norma if norma else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.segundos_por_texto:
+            time.sleep(self.segundos_por_texto * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
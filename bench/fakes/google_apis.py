@@ -0,0 +1,85 @@
+"""
+Google Places (places:searchText) y Weather (forecast/days:lookup) falsos.
+
+Las respuestas tienen la misma forma que las reales y son deterministas por
+consulta (los mismos lugares para "restaurantes en San Antonio" en cada
+corrida). Con `tasa_error` una parte de las llamadas responde 503, que
+`http_client` reintenta como con la API real.
+
+El bot se apunta aquí con PLACES_API_URL y WEATHER_API_URL.
+"""
+import hashlib
+
+from aiohttp import web
+
+from bench.fakes.servidor import ServidorFalso
+
+
+CALI = (3.4516, -76.5320)
+LUGARES_POR_BUSQUEDA = 5
+
+
+def _semilla(texto: str) -> int:
+    return int.from_bytes(hashlib.blake2b(texto.lower().encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def lugares_de(consulta: str, cantidad: int = LUGARES_POR_BUSQUEDA) -> list:
+    base = consulta.replace(" en Cali", "").strip().title() or "Lugar"
+    semilla = _semilla(consulta)
+    lugares = []
+    for i in range(cantidad):
+        desplazamiento = ((semilla >> (3 * i)) % 200 - 100) / 2000  # Hasta ~5 km alrededor del centro
+        lugares.append({
+            "id": f"fake-{semilla:x}-{i}",
+            "displayName": {"text": f"{base} {i + 1}", "languageCode": "es"},
+            "formattedAddress": f"Calle {10 + i} # {semilla % 90}-{i + 10}, Cali, Valle del Cauca",
+            "rating": round(3.5 + ((semilla >> i) % 15) / 10, 1),
+            "websiteUri": f"https://ejemplo.com/{semilla:x}/{i}",
+            "location": {"latitude": round(CALI[0] + desplazamiento, 6),
+                         "longitude": round(CALI[1] - desplazamiento, 6)},
+        })
+    return lugares
+
+
+def pronostico_de(lat: float, lng: float) -> dict:
+    semilla = _semilla(f"{lat:.3f},{lng:.3f}")
+    minima = 18 + semilla % 4
+    return {"forecastDays": [{
+        "maxTemperature": {"degrees": minima + 9, "unit": "CELSIUS"},
+        "minTemperature": {"degrees": minima, "unit": "CELSIUS"},
+        "daytimeForecast": {
+            "weatherCondition": {"description": {"text": ("Soleado", "Parcialmente nublado", "Lluvia ligera")[semilla % 3],
+                                                 "languageCode": "es"}},
+            "wind": {"speed": {"value": 5 + semilla % 10, "unit": "KILOMETERS_PER_HOUR"}},
+        },
+    }]}
+
+
+class FakeGoogleAPIs(ServidorFalso):
+    """Places y Weather en el mismo servidor; sirve como PLACES_API_URL y como WEATHER_API_URL."""
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/places:searchText", self._buscar)
+        app.router.add_get("/v1/forecast/days:lookup", self._clima)
+        return app
+
+    async def _error(self) -> web.Response:
+        return web.json_response({"error": {"code": 503, "message": "Servicio falso sobrecargado"}}, status=503)
+
+    async def _buscar(self, request: web.Request) -> web.Response:
+        cuerpo = await request.json()
+        fallar = await self._simular()
+        self._registrar("places.searchText", {"textQuery": cuerpo.get("textQuery"), "error": fallar})
+        if fallar:
+            return await self._error()
+        return web.json_response({"places": lugares_de(cuerpo.get("textQuery", ""))})
+
+    async def _clima(self, request: web.Request) -> web.Response:
+        lat = float(request.query.get("location.latitude", CALI[0]))
+        lng = float(request.query.get("location.longitude", CALI[1]))
+        fallar = await self._simular()
+        self._registrar("weather.days", {"lat": lat, "lng": lng, "error": fallar})
+        if fallar:
+            return await self._error()
+        return web.json_response(pronostico_de(lat, lng))
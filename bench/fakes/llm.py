@@ -0,0 +1,187 @@
+"""
+Gemini falso con trazas ReAct guionadas.
+
+Para el prompt del agente responde como lo haría Gemini siguiendo el formato
+ReAct: en el primer paso elige una herramienta según la pregunta (clima,
+lugares o la búsqueda de VisitCali; los saludos van directo a la respuesta) y,
+cuando ya hay una Observation, redacta la "Final Answer" a partir de ella.
+Para los demás prompts (ruta rápida, resúmenes) responde texto plano.
+
+La latencia se modela como tiempo al primer token + tiempo por token, y con
+`tasa_error` algunas llamadas fallan con un 503 como los de sobrecarga reales.
+Soporta streaming, así que la respuesta progresiva en Telegram se ejercita igual.
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+MARCADOR_REACT = "¡Comienza con `Thought:`!"
+HERRAMIENTAS = [
+    (re.compile(r"clima|llover|lluvia|temperatura|pron[oó]stico|calor", re.IGNORECASE), "clima_por_lugar"),
+    (re.compile(r"restaurante|comer|cenar|almorzar|bares?\b|hotel|hostal|caf[eé]|discoteca|bailar|rumba",
+                re.IGNORECASE), "buscar_google_places"),
+]
+HERRAMIENTA_POR_DEFECTO = "buscar_info_visitcali"
+PATRON_SALUDO = re.compile(r"^\W*(hola|buenas|buenos d[ií]as|gracias|hey|hello)\W*$", re.IGNORECASE)
+RELLENO = ("Cali", "tiene", "mucho", "para", "ofrecer", "y", "te", "recomiendo", "visitar", "con", "calma",
+           "disfrutar", "la", "salsa", "el", "río", "los", "miradores", "🌴", "💃", "según", "tu", "plan")
+PALABRAS_POR_CHUNK = 3
+TOKENS_POR_PALABRA = 1.3
+
+
+def _texto(messages: List[BaseMessage]) -> str:
+    return "\n".join(m.content if isinstance(m.content, str) else str(m.content) for m in messages)
+
+
+def _entre(texto: str, inicio: str, fin: str) -> str:
+    a = texto.find(inicio)
+    if a < 0:
+        return ""
+    a += len(inicio)
+    b = texto.find(fin, a)
+    return texto[a:b if b >= 0 else None].strip()
+
+
+class FakeReActLLM(BaseChatModel):
+    """Chat model de LangChain sin red, con latencia, errores y respuestas deterministas."""
+
+    latencia_primer_token: float = 0.4  # segundos
+    segundos_por_token: float = 0.01
+    tasa_error: float = 0.0
+    palabras_respuesta: int = 60
+    semilla: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default_factory=lambda: {"llamadas": 0, "errores": 0, "tokens": 0, "segundos": 0.0,
+                                                        "por_tipo": {}})
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.semilla)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-react"
+
+    # --- Guion ---
+
+    def guion(self, prompt: str) -> tuple:
+        """Retorna (tipo de llamada, texto de la respuesta)."""
+        if MARCADOR_REACT in prompt:
+            pregunta = _entre(prompt, "Pregunta:\n", MARCADOR_REACT)
+            pasos = prompt.split(MARCADOR_REACT, 1)[1]
+            if "Observation:" in pasos:
+                observacion = pasos.rsplit("Observation:", 1)[1].split("\nThought:", 1)[0]
+                return "react_respuesta", f"Thought: Tengo la información.\nFinal Answer: {self._redactar(pregunta, observacion)}"
+            if PATRON_SALUDO.match(pregunta):
+                return "react_respuesta", f"Thought: Es un saludo.\nFinal Answer: {self._redactar(pregunta, '¡Hola! 👋')}"
+            herramienta = next((h for patron, h in HERRAMIENTAS if patron.search(pregunta)), HERRAMIENTA_POR_DEFECTO)
+            return "react_herramienta", f"Thought: Necesito buscar.\nAction: {herramienta}\nAction Input: {pregunta}"
+        if "Mantienes la memoria de CAL-E" in prompt:
+            return "resumen", "El usuario pregunta por planes en Cali: salsa, comida típica y clima."
+        pregunta = _entre(prompt, "Pregunta:\n", "\n\nRespuesta:") or prompt[-200:]
+        contexto = _entre(prompt, "Información:\n", "\n\nHistorial:")
+        return "texto", self._redactar(pregunta, contexto)
+
+    def _redactar(self, pregunta: str, contexto: str) -> str:
+        # Determinista por pregunta, para que la caché semántica vea siempre la misma respuesta
+        rng = random.Random(int.from_bytes(hashlib.blake2b(pregunta.encode("utf-8"), digest_size=4).digest(), "big"))
+        base = " ".join(contexto.split()[:40])
+        palabras = base.split()
+        while len(palabras) < self.palabras_respuesta:
+            palabras.append(rng.choice(RELLENO))
+        return " ".join(palabras[:max(self.palabras_respuesta, len(base.split()))])
+
+    # --- Latencia, errores y métricas ---
+
+    def _preparar(self, messages: List[BaseMessage]) -> tuple:
+        tipo, texto = self.guion(_texto(messages))
+        with self._lock:
+            fallar = self._rng.random() < self.tasa_error
+            self._stats["llamadas"] += 1
+            self._stats["por_tipo"][tipo] = self._stats["por_tipo"].get(tipo, 0) + 1
+            if fallar:
+                self._stats["errores"] += 1
+        if fallar:
+            raise RuntimeError("503 The model is overloaded. Please try again later. (falso)")
+        return tipo, texto
+
+    def _duracion(self, texto: str) -> float:
+        return self.latencia_primer_token + len(texto.split()) * TOKENS_POR_PALABRA * self.segundos_por_token
+
+    def _contabilizar(self, texto: str, segundos: float):
+        with self._lock:
+            self._stats["tokens"] += round(len(texto.split()) * TOKENS_POR_PALABRA)
+            self._stats["segundos"] += segundos
+
+    def _trozos(self, texto: str) -> List[str]:
+        palabras = texto.split(" ")
+        return [" ".join(palabras[i:i + PALABRAS_POR_CHUNK]) + (" " if i + PALABRAS_POR_CHUNK < len(palabras) else "")
+                for i in range(0, len(palabras), PALABRAS_POR_CHUNK)]
+
+    def _resultado(self, texto: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        _, texto = self._preparar(messages)
+        duracion = self._duracion(texto)
+        time.sleep(duracion)
+        self._contabilizar(texto, duracion)
+        return self._resultado(texto)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        _, texto = self._preparar(messages)
+        duracion = self._duracion(texto)
+        await asyncio.sleep(duracion)
+        self._contabilizar(texto, duracion)
+        return self._resultado(texto)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        _, texto = self._preparar(messages)
+        inicio = time.monotonic()
+        time.sleep(self.latencia_primer_token)
+        for trozo in self._trozos(texto):
+            time.sleep(len(trozo.split()) * TOKENS_POR_PALABRA * self.segundos_por_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=trozo))
+            if run_manager:
+                run_manager.on_llm_new_token(trozo, chunk=chunk)
+            yield chunk
+        self._contabilizar(texto, time.monotonic() - inicio)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        _, texto = self._preparar(messages)
+        inicio = time.monotonic()
+        await asyncio.sleep(self.latencia_primer_token)
+        for trozo in self._trozos(texto):
+            await asyncio.sleep(len(trozo.split()) * TOKENS_POR_PALABRA * self.segundos_por_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=trozo))
+            if run_manager:
+                await run_manager.on_llm_new_token(trozo, chunk=chunk)
+            yield chunk
+        self._contabilizar(texto, time.monotonic() - inicio)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            llamadas = self._stats["llamadas"]
+            return {
+                "llamadas": llamadas,
+                "errores": self._stats["errores"],
+                "por_tipo": dict(self._stats["por_tipo"]),
+                "tokens_salida": self._stats["tokens"],
+                "latencia_media_s": round(self._stats["segundos"] / max(llamadas - self._stats["errores"], 1), 3),
+            }
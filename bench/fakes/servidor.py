@@ -0,0 +1,46 @@
+"""Base de los servidores falsos: una app aiohttp en un puerto local, con latencia y errores configurables."""
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+from aiohttp import web
+
+
+class ServidorFalso:
+    """Arranca `app()` en 127.0.0.1 (puerto 0: uno libre) y registra cada llamada con su hora (monotonic)."""
+
+    def __init__(self, latencia: float = 0.0, tasa_error: float = 0.0, semilla: int = 0):
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.llamadas: List[dict] = []
+        self._rng = random.Random(semilla)
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def iniciar(self, host: str = "127.0.0.1", puerto: int = 0) -> str:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, puerto).start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def detener(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _simular(self) -> bool:
+        """Aplica la latencia; True si esta llamada debe fallar."""
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return self._rng.random() < self.tasa_error
+
+    def _registrar(self, metodo: str, parametros: dict):
+        self.llamadas.append({"metodo": metodo, "parametros": parametros, "t": time.monotonic()})
+
+    def conteo(self) -> dict:
+        conteo = {}
+        for llamada in self.llamadas:
+            conteo[llamada["metodo"]] = conteo.get(llamada["metodo"], 0) + 1
+        return conteo
@@ -0,0 +1,154 @@
+"""
+API de bots de Telegram falsa, para probar el bot sin red.
+
+Atiende lo que usa CAL-E (getMe, sendMessage, editMessageText,
+deleteMessage, sendChatAction, getFile y la descarga del archivo,
+setWebhook...) y guarda cada llamada con su hora para medir, por ejemplo,
+cuándo vio el usuario el primer texto de una respuesta.
+
+El bot se apunta aquí con TELEGRAM_API_URL=http://127.0.0.1:8081.
+
+Uso suelto:
+    python -m bench.fakes.telegram_api --port 8081 [--latency-ms 30] [--edits-per-second 1]
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from bench.fakes.servidor import ServidorFalso
+
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "CAL-E", "username": "cale_bench_bot"}
+
+
+def mensaje_update(update_id: int, chat_id: int, texto: str, message_id: Optional[int] = None) -> dict:
+    """Update de Telegram con un mensaje de texto de un chat privado (chat_id == user_id)."""
+    usuario = {"id": chat_id, "is_bot": False, "first_name": f"Usuario {chat_id}"}
+    mensaje = {
+        "message_id": message_id or update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": usuario["first_name"]},
+        "from": usuario,
+        "text": texto,
+    }
+    if texto.startswith("/"):
+        comando = texto.split()[0]
+        mensaje["entities"] = [{"type": "bot_command", "offset": 0, "length": len(comando)}]
+    return {"update_id": update_id, "message": mensaje}
+
+
+def voz_update(update_id: int, chat_id: int, file_id: str, duracion: int, tamano: int) -> dict:
+    """Update con una nota de voz; el archivo se sirve desde `archivos` de la API falsa."""
+    update = mensaje_update(update_id, chat_id, "")
+    del update["message"]["text"]
+    update["message"]["voice"] = {"file_id": file_id, "file_unique_id": file_id, "duration": duracion,
+                                  "mime_type": "audio/ogg", "file_size": tamano}
+    return update
+
+
+class FakeTelegramAPI(ServidorFalso):
+    """Servidor aiohttp que imita la Bot API y registra las llamadas."""
+
+    def __init__(self, latencia: float = 0.0, ediciones_por_segundo: Optional[float] = None):
+        super().__init__(latencia)
+        self.ediciones_por_segundo = ediciones_por_segundo  # None: sin límite; si no, 429 con retry_after
+        self.archivos: Dict[str, bytes] = {}  # file_id -> contenido (notas de voz)
+        self._message_id = 0
+        self._ultima_edicion: Dict[int, float] = defaultdict(float)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 ** 2)
+        app.router.add_route("*", "/bot{token}/{metodo}", self._metodo)
+        app.router.add_get("/file/bot{token}/{ruta:.+}", self._archivo)
+        app.router.add_get("/_llamadas", self._listar)
+        return app
+
+    def de_chat(self, chat_id: int, metodo: Optional[str] = None) -> List[dict]:
+        return [l for l in self.llamadas
+                if l["parametros"].get("chat_id") == chat_id and (metodo is None or l["metodo"] == metodo)]
+
+    async def _parametros(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        # PTB manda cada parámetro como JSON dentro de un formulario
+        parametros = {}
+        for clave, valor in (await request.post()).items():
+            if isinstance(valor, str):
+                try:
+                    valor = json.loads(valor)
+                except ValueError:
+                    pass
+            parametros[clave] = valor
+        return parametros
+
+    def _mensaje(self, chat_id: int, texto: str, message_id: Optional[int] = None) -> dict:
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        return {"message_id": message_id, "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}, "text": texto}
+
+    async def _metodo(self, request: web.Request) -> web.Response:
+        metodo = request.match_info["metodo"]
+        parametros = await self._parametros(request)
+        await self._simular()
+        self._registrar(metodo, parametros)
+
+        chat_id = parametros.get("chat_id")
+        if metodo == "editMessageText" and self.ediciones_por_segundo:
+            ahora = time.monotonic()
+            espera = 1 / self.ediciones_por_segundo - (ahora - self._ultima_edicion[chat_id])
+            if espera > 0:
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": "Too Many Requests: retry after 1",
+                                          "parameters": {"retry_after": 1}}, status=429)
+            self._ultima_edicion[chat_id] = ahora
+
+        if metodo == "getMe":
+            resultado = BOT_USER
+        elif metodo == "sendMessage":
+            resultado = self._mensaje(chat_id, parametros.get("text", ""))
+        elif metodo == "editMessageText":
+            resultado = self._mensaje(chat_id, parametros.get("text", ""), parametros.get("message_id"))
+        elif metodo == "getFile":
+            file_id = parametros["file_id"]
+            resultado = {"file_id": file_id, "file_unique_id": file_id,
+                         "file_size": len(self.archivos.get(file_id, b"")), "file_path": f"voice/{file_id}.oga"}
+        elif metodo == "getWebhookInfo":
+            resultado = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            resultado = True  # sendChatAction, deleteMessage, setWebhook, deleteWebhook...
+        return web.json_response({"ok": True, "result": resultado})
+
+    async def _archivo(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["ruta"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        if file_id not in self.archivos:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.archivos[file_id], content_type="audio/ogg")
+
+    async def _listar(self, request: web.Request) -> web.Response:
+        return web.json_response(self.llamadas)
+
+
+async def _servir(puerto: int, latencia: float, ediciones_por_segundo: Optional[float]):
+    api = FakeTelegramAPI(latencia, ediciones_por_segundo)
+    url = await api.iniciar(puerto=puerto)
+    print(f"API de Telegram falsa en {url} (TELEGRAM_API_URL={url})")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de bots de Telegram falsa")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--edits-per-second", type=float, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_servir(args.port, args.latency_ms / 1000, args.edits_per_second))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,64 @@
+"""
+Whisper falso con el mismo contrato que `transcription.servicio`.
+
+Cada nota de voz del tráfico se genera como un WAV de silencio con un número
+de muestras único; al transcribir, ese largo identifica el texto guionado. El
+audio pasa igual por ffmpeg (`audio_decode`), así que se mide la decodificación
+real y se simula solo el modelo, con un RTF configurable.
+"""
+import io
+import threading
+import time
+import wave
+from typing import Dict
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class FakeWhisper:
+
+    def __init__(self, rtf: float = 0.15):
+        self.rtf = rtf
+        self._textos: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._clips = 0
+        self._segundos_audio = 0.0
+        self._segundos_proceso = 0.0
+
+    def registrar(self, texto: str, segundos: float) -> bytes:
+        """WAV de `segundos` de silencio cuyo largo exacto queda asociado a `texto`."""
+        with self._lock:
+            muestras = int(segundos * SAMPLE_RATE)
+            while muestras in self._textos:
+                muestras += 1
+            self._textos[muestras] = texto
+        salida = io.BytesIO()
+        with wave.open(salida, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(b"\x00\x00" * muestras)
+        return salida.getvalue()
+
+    def disponible(self) -> bool:
+        return True
+
+    def transcribir(self, audio: np.ndarray) -> str:
+        segundos = len(audio) / SAMPLE_RATE
+        time.sleep(segundos * self.rtf)
+        with self._lock:
+            self._clips += 1
+            self._segundos_audio += segundos
+            self._segundos_proceso += segundos * self.rtf
+            return self._textos.get(len(audio), "")
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "modelo": "falso",
+                "clips": self._clips,
+                "segundos_audio": round(self._segundos_audio, 1),
+                "rtf": self.rtf,
+            }
@@ -0,0 +1,164 @@
+"""
+Resumen de resultados del benchmark y comparación contra un baseline.
+
+Cada muestra es un dict con al menos `tipo`, `latencia` (segundos) y `error`;
+opcionalmente `ttft`. El resumen por tipo lleva n, errores, p50/p95/p99 de
+latencia y TTFT y el throughput de la corrida.
+
+Los baselines son el JSON del resumen guardado en `bench/baselines/`. Una
+métrica "empeora" si supera al baseline en más de `tolerancia` (relativa) y
+además en más de un mínimo absoluto, para que el ruido en valores pequeños
+(p. ej. 3 ms -> 4 ms) no cuente como regresión.
+"""
+import json
+import math
+import os
+import resource
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+TOLERANCIA = 0.15
+# Métricas comparadas: sufijo -> (más alto es peor, mínimo absoluto para contar como regresión)
+COMPARABLES = {
+    "_s": (True, 0.05),
+    "tasa_error": (True, 0.02),
+    "throughput_rps": (False, 0.05),
+    "_mb": (True, 25.0),
+}
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """Percentil con interpolación lineal (como numpy.percentile); None si no hay valores."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    abajo = math.floor(posicion)
+    arriba = min(abajo + 1, len(ordenados) - 1)
+    return ordenados[abajo] + (ordenados[arriba] - ordenados[abajo]) * (posicion - abajo)
+
+
+def _redondear(valor: Optional[float], digitos: int = 4) -> Optional[float]:
+    return None if valor is None else round(valor, digitos)
+
+
+def resumir_muestras(muestras: List[dict], duracion: float) -> dict:
+    latencias = [m["latencia"] for m in muestras if not m["error"]]
+    ttfts = [m["ttft"] for m in muestras if not m["error"] and m.get("ttft") is not None]
+    return {
+        "n": len(muestras),
+        "errores": sum(1 for m in muestras if m["error"]),
+        "tasa_error": _redondear(sum(1 for m in muestras if m["error"]) / len(muestras)) if muestras else 0.0,
+        "p50_s": _redondear(percentil(latencias, 50)),
+        "p95_s": _redondear(percentil(latencias, 95)),
+        "p99_s": _redondear(percentil(latencias, 99)),
+        "ttft_p50_s": _redondear(percentil(ttfts, 50)),
+        "ttft_p95_s": _redondear(percentil(ttfts, 95)),
+        "throughput_rps": _redondear(len(muestras) / duracion if duracion else 0.0),
+    }
+
+
+def resumir(muestras: List[dict], duracion: float) -> Dict[str, dict]:
+    """Resumen global ("total") y por tipo de evento."""
+    por_tipo = {"total": resumir_muestras(muestras, duracion)}
+    for tipo in sorted({m["tipo"] for m in muestras}):
+        por_tipo[tipo] = resumir_muestras([m for m in muestras if m["tipo"] == tipo], duracion)
+    return por_tipo
+
+
+def memoria_mb() -> dict:
+    """RSS actual y pico del proceso, en MB."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+    try:
+        with open("/proc/self/statm") as f:
+            actual = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:  # Sin /proc (macOS): ru_maxrss viene en bytes
+        pico = pico / 1024
+        actual = pico
+    return {"rss_mb": round(actual, 1), "pico_mb": round(max(pico, actual), 1)}
+
+
+# --- Baselines ---
+
+def ruta_baseline(nombre: str) -> Path:
+    path = Path(nombre)
+    return path if path.suffix == ".json" else BASELINES_DIR / f"{nombre}.json"
+
+
+def guardar_baseline(resultado: dict, nombre: str) -> Path:
+    path = ruta_baseline(nombre)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def cargar_baseline(nombre: str) -> dict:
+    with open(ruta_baseline(nombre), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _regla(metrica: str):
+    for sufijo, regla in COMPARABLES.items():
+        if metrica.endswith(sufijo):
+            return regla
+    return None
+
+
+def _comparables(resultado: dict, prefijo: str = ""):
+    """(ruta, clave, valor) de cada métrica numérica comparable, recorriendo el resultado anidado."""
+    for clave, valor in resultado.items():
+        ruta = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            yield from _comparables(valor, ruta + ".")
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool) and _regla(clave):
+            yield ruta, clave, valor
+
+
+def comparar(actual: dict, baseline: dict, tolerancia: float = TOLERANCIA) -> List[dict]:
+    """Lista de métricas de `actual` que empeoraron respecto a `baseline` (vacía si no hay regresiones)."""
+    referencia = dict((ruta, valor) for ruta, _, valor in _comparables(baseline.get("resumen", baseline)))
+    regresiones = []
+    for ruta, clave, valor in _comparables(actual.get("resumen", actual)):
+        anterior = referencia.get(ruta)
+        if anterior is None:
+            continue
+        mayor_es_peor, minimo = _regla(clave)
+        delta = valor - anterior if mayor_es_peor else anterior - valor
+        if delta > minimo and delta > abs(anterior) * tolerancia:
+            regresiones.append({"metrica": ruta, "baseline": anterior, "actual": valor,
+                                "cambio": f"{(valor - anterior) / anterior:+.0%}" if anterior else "nuevo"})
+    return regresiones
+
+
+# --- Salida ---
+
+def _ms(valor: Optional[float]) -> str:
+    return "-" if valor is None else f"{valor * 1000:.0f}"
+
+
+def imprimir(resultado: dict):
+    resumen = resultado["resumen"]
+    print(f"\n📊 {resultado.get('benchmark', 'benchmark')} | {resultado.get('duracion_s', 0):.1f}s")
+    print(f"{'tipo':<22}{'n':>6}{'err':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft50':>9}{'ttft95':>9}{'rps':>8}")
+    for tipo, fila in resumen.items():
+        if not isinstance(fila, dict) or "n" not in fila:
+            continue
+        print(f"{tipo:<22}{fila['n']:>6}{fila['errores']:>6}{_ms(fila['p50_s']):>9}{_ms(fila['p95_s']):>9}"
+              f"{_ms(fila['p99_s']):>9}{_ms(fila.get('ttft_p50_s')):>9}{_ms(fila.get('ttft_p95_s')):>9}"
+              f"{fila['throughput_rps']:>8.2f}")
+    if "memoria" in resumen:
+        print(f"Memoria: {resumen['memoria']['rss_mb']} MB (pico {resumen['memoria']['pico_mb']} MB)")
+    for nombre, valor in resultado.get("etapas", {}).items():
+        print(f"  · {nombre}: {valor}")
+
+
+def imprimir_regresiones(regresiones: List[dict], nombre: str):
+    if not regresiones:
+        print(f"\n✅ Sin regresiones frente al baseline '{nombre}'.")
+        return
+    print(f"\n❌ {len(regresiones)} regresiones frente al baseline '{nombre}':")
+    for r in regresiones:
+        print(f"  {r['metrica']}: {r['baseline']} -> {r['actual']} ({r['cambio']})")
@@ -0,0 +1,411 @@
+"""
+Benchmark de CAL-E sin red.
+
+Tres benchmarks, cada uno con p50/p95/p99, throughput, memoria y desglose por etapa:
+
+- `handlers`: reproduce una mezcla de tráfico (`bench/fixtures/trafico_mixto.jsonl`)
+  contra los handlers reales de `main.py` (`handle_message`, `handle_voice`,
+  comandos) a través de `Application.process_update`, con concurrent_updates
+  y locks por chat como en producción. Gemini, Places, Weather, Telegram y
+  Whisper son falsos con latencia y errores configurables; el índice FAISS se
+  construye con el corpus de `bench/fixtures/`. Las notas de voz pasan por
+  ffmpeg de verdad (sin ffmpeg se omiten).
+- `retriever`: latencia de FAISS, BM25 y la búsqueda híbrida (sync y async).
+- `ingest`: `src/ingest.py` completo (sin y con caché de embeddings),
+  incremental y sin cambios, en un directorio temporal. Usa el modelo de
+  embeddings real.
+
+Uso:
+    python -m bench.run handlers [--speed 2] [--llm-latency-ms 400] [--llm-error-rate 0.05]
+    python -m bench.run retriever --queries 500
+    python -m bench.run ingest
+
+Con `--save-baseline NOMBRE` el resultado se guarda en `bench/baselines/`; con
+`--compare NOMBRE` se compara contra ese baseline y el proceso termina con
+código 1 si alguna métrica empeoró más que `--tolerance`.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / "src"))
+
+from bench import report, traffic  # noqa: E402
+
+
+FIXTURES = RAIZ / "bench" / "fixtures"
+CORPUS = FIXTURES / "visitcali_muestra.jsonl"
+TRAFICO = FIXTURES / "trafico_mixto.jsonl"
+RESULTADOS = RAIZ / "bench" / "results"
+PREFIJOS_AVISO = ("🤔", "🎤")  # Avisos intermedios: no cuentan como primer texto de la respuesta
+MARCAS_ERROR = ("Lo siento", "⚠️", "🚦")
+
+
+# --- Datos de prueba ---
+
+def leer_corpus(path: Path = CORPUS) -> tuple:
+    """(textos, metadatas, ids) con el mismo formato de documento que `ingest.leer_jsonl`."""
+    from embedding_cache import hash_texto
+
+    textos, metadatas, ids = [], [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for num_linea, linea in enumerate(f, start=1):
+            if not linea.strip():
+                continue
+            data = json.loads(linea)
+            title = data["title"].replace(' - CALI ES DONDE DEBES ESTAR', '')
+            texto = f"Título: {title}\nDescripción: {data['description']}\nFuente: {data['url']}"
+            textos.append(texto)
+            metadatas.append({"source": "visitcali", "url": data["url"], "line": num_linea})
+            ids.append(hash_texto(texto))
+    return textos, metadatas, ids
+
+
+def construir_indice_fixture(embeddings, destino: Path) -> Path:
+    """Índice plano + BM25 del corpus de prueba, en el formato que carga `main.py`."""
+    import numpy as np
+    from vector_index import (MANIFEST_NAME, cadena_factory, construir_indice, crear_vector_store,
+                              guardar_vector_store, parametros_busqueda)
+
+    textos, metadatas, ids = leer_corpus()
+    vectores = np.array(embeddings.embed_documents(textos), dtype=np.float32)
+    factory = cadena_factory("flat", len(ids), vectores.shape[1])
+    search_params = parametros_busqueda("flat")
+    index = construir_indice(vectores, factory, search_params)
+    guardar_vector_store(crear_vector_store(index, textos, metadatas, ids, embeddings), destino)
+    with open(destino / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump({"index": {"type": "flat", "factory": factory, "search_params": search_params}}, f)
+    return destino
+
+
+def crear_embeddings(reales: bool):
+    if reales:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    from bench.fakes.embeddings import HashEmbeddings
+    return HashEmbeddings()
+
+
+def _muestra(tipo: str, latencia: float, error: bool, ttft: float = None, **extra) -> dict:
+    return dict(tipo=tipo, latencia=latencia, error=error, ttft=ttft, **extra)
+
+
+# --- Benchmark de handlers ---
+
+def _textos_enviados(api, chat: int, desde: float, hasta: float) -> List[tuple]:
+    """(hora, texto) de lo que el bot envió o editó en el chat dentro de la ventana."""
+    return [(llamada["t"], str(llamada["parametros"].get("text", "")))
+            for llamada in api.llamadas
+            if llamada["metodo"] in ("sendMessage", "editMessageText")
+            and llamada["parametros"].get("chat_id") == chat and desde <= llamada["t"] <= hasta]
+
+
+async def bench_handlers(args) -> dict:
+    from bench.fakes.google_apis import FakeGoogleAPIs
+    from bench.fakes.llm import FakeReActLLM
+    from bench.fakes.telegram_api import BOT_USER, FakeTelegramAPI, mensaje_update, voz_update
+    from bench.fakes.whisper import FakeWhisper
+
+    telegram_api = FakeTelegramAPI(args.telegram_latency_ms / 1000, args.edits_per_second)
+    google = FakeGoogleAPIs(args.api_latency_ms / 1000, args.api_error_rate, args.seed)
+    telegram_url = await telegram_api.iniciar()
+    google_url = await google.iniciar()
+    trabajo = Path(tempfile.mkdtemp(prefix="cale-bench-"))
+
+    # Antes de importar main: cada módulo lee su configuración al importarse
+    os.environ.update({
+        "TELEGRAM_TOKEN": f"{BOT_USER['id']}:BENCH",
+        "TELEGRAM_API_URL": telegram_url,
+        "PLACES_API_URL": google_url,
+        "WEATHER_API_URL": google_url,
+        "GOOGLE_API_KEY": "bench",
+        "GOOGLE_PLACES_API_KEY": "bench",
+        "WEATHER_API_KEY": "bench",
+        "CHAT_DB_PATH": str(trabajo / "chat_history.db"),
+        "STARTUP_MODE": "background",
+    })
+    from telegram import Update
+
+    import main
+    import database
+    import http_client
+    import telegram_stream
+    import transcription
+    import voice_pipeline
+    from concurrency import LimiteLLMMixin
+
+    class LimitedFakeReActLLM(LimiteLLMMixin, FakeReActLLM):
+        """El LLM falso con el mismo tope global de llamadas que Gemini en el bot."""
+
+    llm = LimitedFakeReActLLM(latencia_primer_token=args.llm_latency_ms / 1000,
+                              segundos_por_token=args.llm_ms_per_token / 1000,
+                              tasa_error=args.llm_error_rate, semilla=args.seed)
+    embeddings = crear_embeddings(args.real_embeddings)
+    whisper = FakeWhisper(args.whisper_rtf)
+    transcription.servicio = whisper
+
+    main.INDEX_PATH = str(construir_indice_fixture(embeddings, trabajo / "faiss_index"))
+    main.arranque.inyectar("llm", llm)
+    main.arranque.inyectar("embeddings", embeddings)
+
+    eventos = traffic.cargar(args.traffic)
+    if shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg")) is None:
+        omitidas = sum(1 for e in eventos if e["tipo"] == "voz")
+        eventos = [e for e in eventos if e["tipo"] != "voz"]
+        print(f"⚠️ ffmpeg no está instalado: se omiten {omitidas} notas de voz.")
+
+    errores_handler = {}
+
+    async def registrar_error(update, context):
+        if update is not None:
+            errores_handler[update.update_id] = repr(context.error)
+
+    application = main.build_application(with_updater=False)
+    application.add_error_handler(registrar_error)
+    await application.initialize()
+    await main.on_startup(application, retention=False)
+    await main.arranque.esperar(*main.COMPONENTES_MENSAJE)
+    print(f"🚀 Componentes listos: {main.arranque.reporte()}")
+
+    async def atender(update_id: int, evento: dict) -> dict:
+        if evento["tipo"] == "voz":
+            file_id = f"voz-{update_id}"
+            telegram_api.archivos[file_id] = whisper.registrar(evento["texto"], evento.get("segundos", 5))
+            datos = voz_update(update_id, evento["chat"], file_id, evento.get("segundos", 5),
+                               len(telegram_api.archivos[file_id]))
+        else:
+            datos = mensaje_update(update_id, evento["chat"], evento["texto"])
+        update = Update.de_json(datos, application.bot)
+        inicio = time.monotonic()
+        # Igual que el Updater: el procesador de updates decide cuántos corren a la vez
+        await application.update_processor.process_update(update, application.process_update(update))
+        return {"update_id": update_id, "evento": evento, "inicio": inicio, "fin": time.monotonic()}
+
+    print(f"▶️ Reproduciendo {len(eventos)} eventos de {args.traffic} a {args.speed}x...")
+    tareas = []
+    inicio_corrida = time.monotonic()
+    for update_id, evento in enumerate(eventos, 1):
+        espera = inicio_corrida + evento["t"] / args.speed - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        tareas.append(asyncio.create_task(atender(update_id, evento)))
+    atendidos = await asyncio.gather(*tareas)
+    duracion = time.monotonic() - inicio_corrida
+
+    # TTFT y errores a partir de lo que vio cada chat; los updates de un chat se atienden en orden,
+    # así que lo enviado después de que terminó el anterior pertenece a este
+    muestras = []
+    fin_anterior = {}
+    for atendido in sorted(atendidos, key=lambda a: a["inicio"]):
+        evento = atendido["evento"]
+        desde = max(atendido["inicio"], fin_anterior.get(evento["chat"], 0.0))
+        fin_anterior[evento["chat"]] = atendido["fin"]
+        textos = _textos_enviados(telegram_api, evento["chat"], desde, atendido["fin"])
+        respuestas = [(t, texto) for t, texto in textos if not texto.startswith(PREFIJOS_AVISO)]
+        error = atendido["update_id"] in errores_handler or any(
+            texto.startswith(MARCAS_ERROR) or "Lo siento" in texto for _, texto in respuestas)
+        ttft = respuestas[0][0] - atendido["inicio"] if respuestas else None
+        muestras.append(_muestra(evento["tipo"], atendido["fin"] - atendido["inicio"], error, ttft))
+
+    resumen = report.resumir(muestras, duracion)
+    resumen["memoria"] = report.memoria_mb()
+    etapas = {
+        "llm": llm.metricas(),
+        "router": main.arranque.valor("router").metricas(),
+        "cache_respuestas": main.arranque.valor("cache_respuestas").metricas(),
+        "stream": telegram_stream.metricas(),
+        "voz": voice_pipeline.metricas(),
+        "whisper": whisper.metricas(),
+        "http": http_client.metricas(),
+        "historial": database.history_cache_stats(),
+        "arranque": main.arranque.reporte(),
+        "telegram_api": telegram_api.conteo(),
+        "google_apis": google.conteo(),
+    }
+    if errores_handler:
+        etapas["excepciones"] = sorted(set(errores_handler.values()))
+
+    await main.on_shutdown(application)
+    await application.shutdown()
+    await telegram_api.detener()
+    await google.detener()
+    shutil.rmtree(trabajo, ignore_errors=True)
+    return {"duracion_s": round(duracion, 2), "resumen": resumen, "etapas": etapas}
+
+
+# --- Benchmark del retriever ---
+
+def _consultas(n: int) -> List[str]:
+    base = [e["texto"] for e in traffic.cargar(TRAFICO) if e["tipo"] != "comando"]
+    base += [texto.split("\n", 1)[0].replace("Título: ", "") for texto in leer_corpus()[0]]
+    return [base[i % len(base)] for i in range(n)]
+
+
+def _cronometrar(tipo: str, funcion, consultas: List[str]) -> tuple:
+    muestras = []
+    inicio = time.monotonic()
+    for consulta in consultas:
+        t = time.monotonic()
+        funcion(consulta)
+        muestras.append(_muestra(tipo, time.monotonic() - t, False))
+    return muestras, time.monotonic() - inicio
+
+
+async def bench_retriever(args) -> dict:
+    from hybrid_retriever import HybridRetriever, crear_reranker
+    from vector_index import cargar_indice_lexico, cargar_vector_store
+
+    embeddings = crear_embeddings(args.real_embeddings)
+    trabajo = Path(tempfile.mkdtemp(prefix="cale-bench-"))
+    try:
+        indice = construir_indice_fixture(embeddings, trabajo / "faiss_index")
+        retriever = HybridRetriever(vector_store=cargar_vector_store(indice, embeddings),
+                                    bm25=cargar_indice_lexico(indice), reranker=crear_reranker(), k=2)
+        consultas = _consultas(args.queries)
+        retriever.invoke(consultas[0])  # Calentamiento
+
+        inicio_total = time.monotonic()
+        resumen = {}
+        for tipo, funcion in (("densos", retriever._densos), ("lexicos", retriever._lexicos),
+                              ("hibrido", retriever.invoke)):
+            muestras, segundos = _cronometrar(tipo, funcion, consultas)
+            resumen[tipo] = report.resumir_muestras(muestras, segundos)
+
+        # Async con varias consultas a la vez, como cuando varios chats usan el agente
+        limite = asyncio.Semaphore(args.concurrency)
+        muestras = []
+
+        async def consultar(consulta: str):
+            async with limite:
+                t = time.monotonic()
+                await retriever.ainvoke(consulta)
+                muestras.append(_muestra("hibrido_async", time.monotonic() - t, False))
+
+        inicio = time.monotonic()
+        await asyncio.gather(*(consultar(c) for c in consultas))
+        resumen["hibrido_async"] = report.resumir_muestras(muestras, time.monotonic() - inicio)
+        resumen["memoria"] = report.memoria_mb()
+        return {"duracion_s": round(time.monotonic() - inicio_total, 2),
+                "resumen": resumen, "etapas": {"documentos": len(leer_corpus()[0]), "consultas": len(consultas)}}
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+
+# --- Benchmark de la ingesta ---
+
+def _ingestar(trabajo: Path, *opciones: str) -> float:
+    inicio = time.monotonic()
+    subprocess.run([sys.executable, str(RAIZ / "src" / "ingest.py"), *opciones], cwd=trabajo, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.monotonic() - inicio
+
+
+async def bench_ingest(args) -> dict:
+    if importlib.util.find_spec("langchain_huggingface") is None:
+        raise SystemExit("❌ El benchmark de ingesta usa el modelo real: pip install langchain-huggingface sentence-transformers")
+    trabajo = Path(tempfile.mkdtemp(prefix="cale-bench-ingest-"))
+    try:
+        (trabajo / "data").mkdir()
+        jsonl = trabajo / "data" / "visitcali_scraping.jsonl"
+        shutil.copy(CORPUS, jsonl)
+
+        muestras = []
+        for _ in range(args.repeat):
+            muestras.append(_muestra("completa_sin_cache", _ingestar(trabajo, "--full", "--no-cache"), False))
+            muestras.append(_muestra("completa_con_cache", _ingestar(trabajo, "--full"), False))
+        muestras.append(_muestra("sin_cambios", _ingestar(trabajo), False))
+
+        # Incremental: algunos documentos nuevos sobre el corpus ya indexado
+        with open(jsonl, 'a', encoding='utf-8') as f:
+            for i in range(args.new_docs):
+                f.write(json.dumps({"title": f"Lugar nuevo {i}", "url": f"https://www.visitcali.travel/nuevo/{i}",
+                                    "description": f"Sitio recién agregado número {i} para probar la ingesta incremental."},
+                                   ensure_ascii=False) + "\n")
+        muestras.append(_muestra("incremental", _ingestar(trabajo), False))
+
+        duracion = sum(m["latencia"] for m in muestras)
+        resumen = report.resumir(muestras, duracion)
+        resumen["memoria"] = report.memoria_mb()
+        return {"duracion_s": round(duracion, 2), "resumen": resumen,
+                "etapas": {"documentos": len(leer_corpus()[0]), "nuevos": args.new_docs}}
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+
+BENCHMARKS = {"handlers": bench_handlers, "retriever": bench_retriever, "ingest": bench_ingest}
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmarks de CAL-E sin red")
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument("--seed", type=int, default=0)
+    comunes.add_argument("--out", help="JSON con el resultado (por defecto bench/results/<benchmark>-<fecha>.json)")
+    comunes.add_argument("--save-baseline", metavar="NOMBRE", help="Guarda el resultado como baseline")
+    comunes.add_argument("--compare", metavar="NOMBRE", help="Compara contra un baseline; código 1 si hay regresiones")
+    comunes.add_argument("--tolerance", type=float, default=report.TOLERANCIA,
+                         help="Empeoramiento relativo tolerado (0.15 = 15%%)")
+    comunes.add_argument("--real-embeddings", action="store_true",
+                         help="Usa all-MiniLM-L6-v2 en vez de los embeddings falsos")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    handlers = sub.add_parser("handlers", parents=[comunes], help="Tráfico grabado contra los handlers del bot")
+    handlers.add_argument("--traffic", default=str(TRAFICO), help="Mezcla de tráfico JSONL (ver bench/traffic.py)")
+    handlers.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad de la reproducción")
+    handlers.add_argument("--llm-latency-ms", type=float, default=400, help="Tiempo al primer token del LLM")
+    handlers.add_argument("--llm-ms-per-token", type=float, default=10)
+    handlers.add_argument("--llm-error-rate", type=float, default=0.0, help="Fracción de llamadas con 503")
+    handlers.add_argument("--api-latency-ms", type=float, default=80, help="Latencia de Places y Weather")
+    handlers.add_argument("--api-error-rate", type=float, default=0.0)
+    handlers.add_argument("--telegram-latency-ms", type=float, default=30)
+    handlers.add_argument("--edits-per-second", type=float, default=None,
+                          help="Límite de ediciones por chat de la API falsa (429 al superarlo)")
+    handlers.add_argument("--whisper-rtf", type=float, default=0.15, help="Segundos de proceso por segundo de audio")
+
+    retriever = sub.add_parser("retriever", parents=[comunes], help="FAISS, BM25 y búsqueda híbrida")
+    retriever.add_argument("--queries", type=int, default=300)
+    retriever.add_argument("--concurrency", type=int, default=8)
+
+    ingest = sub.add_parser("ingest", parents=[comunes], help="src/ingest.py completo, incremental y sin cambios")
+    ingest.add_argument("--repeat", type=int, default=1)
+    ingest.add_argument("--new-docs", type=int, default=5)
+    return parser
+
+
+def main():
+    args = _parser().parse_args()
+    resultado = asyncio.run(BENCHMARKS[args.benchmark](args))
+    resultado = {"benchmark": args.benchmark, "fecha": datetime.now().isoformat(timespec="seconds"),
+                 "parametros": {k: v for k, v in vars(args).items()
+                                if k not in ("benchmark", "out", "save_baseline", "compare")},
+                 **resultado}
+    report.imprimir(resultado)
+
+    salida = Path(args.out) if args.out else RESULTADOS / f"{args.benchmark}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultado en {salida}")
+
+    if args.save_baseline:
+        print(f"📌 Baseline guardado en {report.guardar_baseline(resultado, f'{args.benchmark}-{args.save_baseline}')}")
+    if args.compare:
+        nombre = f"{args.benchmark}-{args.compare}"
+        regresiones = report.comparar(resultado, report.cargar_baseline(nombre), args.tolerance)
+        report.imprimir_regresiones(regresiones, nombre)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
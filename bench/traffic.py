@@ -0,0 +1,111 @@
+"""
+Mezclas de tráfico para el benchmark.
+
+Una mezcla es un JSONL con un evento por línea, ordenado por tiempo:
+
+    {"t": 0.8, "chat": 101, "tipo": "texto", "texto": "restaurantes en San Antonio"}
+    {"t": 1.3, "chat": 104, "tipo": "voz", "texto": "va a llover hoy?", "segundos": 6}
+    {"t": 2.0, "chat": 101, "tipo": "comando", "texto": "/olvidar"}
+
+`t` son segundos desde el inicio de la corrida. En las notas de voz `texto`
+es lo que "dice" la nota (lo devuelve el Whisper falso) y `segundos` su
+duración.
+
+Además de las mezclas guionadas de `bench/fixtures/`, se puede grabar una
+desde el historial real del bot (solo los mensajes de los usuarios, con los
+chats anonimizados):
+
+    python -m bench.traffic --from-db data/chat_history.db --out bench/fixtures/trafico_grabado.jsonl
+"""
+import argparse
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+
+TIPOS = ("texto", "voz", "comando")
+CHAT_BASE = 100  # Los chats anonimizados se numeran desde aquí
+
+
+def cargar(path) -> List[dict]:
+    """Lee una mezcla y la retorna ordenada por `t`."""
+    eventos = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for numero, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            evento = json.loads(linea)
+            if evento.get("tipo", "texto") not in TIPOS:
+                raise ValueError(f"{path}:{numero}: tipo desconocido {evento.get('tipo')!r}")
+            evento.setdefault("tipo", "texto")
+            eventos.append(evento)
+    return sorted(eventos, key=lambda e: e["t"])
+
+
+def guardar(eventos: List[dict], path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for evento in eventos:
+            f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+
+
+def desde_historial(db_path, desde: Optional[str] = None, limite: Optional[int] = None,
+                    max_pausa: float = 30.0) -> List[dict]:
+    """
+    Convierte los mensajes de usuario de `chat_history` en una mezcla.
+
+    Las pausas mayores a `max_pausa` segundos se recortan: un día de tráfico
+    real se reproduce en minutos conservando las ráfagas.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        consulta = "SELECT user_id, message, timestamp FROM chat_history WHERE role = 'user'"
+        parametros = []
+        if desde:
+            consulta += " AND timestamp >= ?"
+            parametros.append(desde)
+        consulta += " ORDER BY timestamp, id"
+        if limite:
+            consulta += " LIMIT ?"
+            parametros.append(limite)
+        filas = conn.execute(consulta, parametros).fetchall()
+    finally:
+        conn.close()
+
+    chats = {}
+    eventos = []
+    t = 0.0
+    anterior = None
+    for user_id, mensaje, timestamp in filas:
+        momento = datetime.fromisoformat(timestamp)
+        if anterior is not None:
+            t += min((momento - anterior).total_seconds(), max_pausa)
+        anterior = momento
+        chat = chats.setdefault(user_id, CHAT_BASE + len(chats) + 1)
+        tipo = "comando" if mensaje.startswith("/") else "texto"
+        eventos.append({"t": round(t, 3), "chat": chat, "tipo": tipo, "texto": mensaje})
+    return eventos
+
+
+def resumen(eventos: List[dict]) -> dict:
+    por_tipo = {}
+    for evento in eventos:
+        por_tipo[evento["tipo"]] = por_tipo.get(evento["tipo"], 0) + 1
+    return {"eventos": len(eventos), "chats": len({e["chat"] for e in eventos}),
+            "duracion_s": eventos[-1]["t"] if eventos else 0, "por_tipo": por_tipo}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graba una mezcla de tráfico desde el historial del bot")
+    parser.add_argument("--from-db", required=True, help="Base SQLite del historial (CHAT_DB_PATH)")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--since", help="Solo mensajes desde esta fecha (ISO, p. ej. 2025-01-31)")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--max-gap", type=float, default=30.0, help="Pausa máxima entre mensajes (segundos)")
+    args = parser.parse_args()
+
+    eventos = desde_historial(args.from_db, args.since, args.limit, args.max_gap)
+    guardar(eventos, args.out)
+    print(f"Mezcla guardada en {args.out}: {resumen(eventos)}")
@@ -0,0 +1,154 @@
+"""
+Caché semántica de respuestas delante de `agent_executor`.
+
+Muchas preguntas llegan casi idénticas ("qué hacer en Cali", "dónde comer
+sancocho"). Se embebe la pregunta con el mismo modelo MiniLM del RAG y, si hay
+una respuesta reciente con similitud coseno sobre el umbral, se devuelve sin
+correr el agente. No se cachean preguntas ni respuestas que dependan del clima
+o del historial del usuario, ni las que el agente armó con herramientas cuyo
+resultado cambia con la hora, ni las salidas de error o de corte del agente.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(6 * 3600)))  # segundos
+SEMANTIC_CACHE_MAX = int(os.getenv("SEMANTIC_CACHE_MAX", "500"))
+
+# Preguntas cuya respuesta cambia con el clima del día
+PATRON_CLIMA = re.compile(
+    r"\b(clima|lluvi\w*|llover|llueve|temperatura|pron[oó]stico|calor|fr[ií]o|soleado|nublado|weather|rain)\b",
+    re.IGNORECASE,
+)
+# Preguntas que se apoyan en lo que el usuario dijo antes
+PATRON_HISTORIAL = re.compile(
+    r"(^\s*¿?\s*y\s)|\b(recuerdas|te dije|me dijiste|anterior\w*|lo mismo|eso|esa|ese|esos|esas|"
+    r"otra vez|otr[oa]s? opci\w*|m[aá]s opciones|mi nombre|me llamo|prefiero|mis)\b",
+    re.IGNORECASE,
+)
+# Marcas que deja la salida de las herramientas de clima en la respuesta final
+MARCAS_CLIMA = ("°C", "☀️", "Pronóstico")
+# Salidas de AgentExecutor que no son una respuesta (corte por max_iterations/max_execution_time)
+SALIDAS_AGENTE_FALLIDAS = ("Agent stopped due to iteration limit or time limit.",)
+# Herramientas cuyo resultado cambia con la hora (clima, lugares abiertos); "_Exception" es el paso
+# que AgentExecutor agrega cuando no pudo interpretar la salida del LLM (handle_parsing_errors)
+HERRAMIENTAS_NO_CACHEABLES = {"clima_por_lugar", "buscar_google_places", "_Exception"}
+
+
+@dataclass
+class _Entrada:
+    pregunta: str
+    respuesta: str
+    creada: float
+    latencia: float  # Lo que tardó el agente en producirla (lo que se ahorra en cada acierto)
+
+
+class SemanticAnswerCache:
+    """Caché de respuestas por similitud semántica, con TTL y expulsión LRU."""
+
+    def __init__(self, embeddings_model, umbral: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: int = SEMANTIC_CACHE_TTL, max_entradas: int = SEMANTIC_CACHE_MAX):
+        self.embeddings_model = embeddings_model
+        self.umbral = umbral
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[int, _Entrada]" = OrderedDict()  # fila -> entrada, en orden LRU
+        self._vectores: Optional[np.ndarray] = None  # Se reserva al conocer la dimensión
+        self._libres = list(range(max_entradas - 1, -1, -1))
+        self._aciertos = 0
+        self._fallos = 0
+        self._omitidas = 0
+        self._segundos_ahorrados = 0.0
+
+    @staticmethod
+    def pregunta_cacheable(pregunta: str) -> bool:
+        return not PATRON_CLIMA.search(pregunta) and not PATRON_HISTORIAL.search(pregunta)
+
+    @staticmethod
+    def respuesta_cacheable(respuesta: str) -> bool:
+        return (bool(respuesta) and respuesta.strip() not in SALIDAS_AGENTE_FALLIDAS
+                and not any(marca in respuesta for marca in MARCAS_CLIMA))
+
+    def _embeber(self, pregunta: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings_model.embed_query(pregunta.strip().lower()), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def buscar(self, pregunta: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Retorna (respuesta, vector). `respuesta` es None si no hay acierto; el
+        vector se puede pasar a `guardar` para no embeber la pregunta dos veces.
+        """
+        if not self.pregunta_cacheable(pregunta):
+            with self._lock:
+                self._omitidas += 1
+            return None, None
+
+        vector = self._embeber(pregunta)
+        ahora = time.time()
+        with self._lock:
+            self._expulsar_vencidas(ahora)
+            if self._entradas:
+                filas = np.fromiter(self._entradas.keys(), dtype=np.int64)
+                similitudes = self._vectores[filas] @ vector
+                mejor = int(np.argmax(similitudes))
+                if similitudes[mejor] >= self.umbral:
+                    fila = int(filas[mejor])
+                    entrada = self._entradas[fila]
+                    self._entradas.move_to_end(fila)
+                    self._aciertos += 1
+                    self._segundos_ahorrados += entrada.latencia
+                    print(f"[CACHE] Acierto semántico ({similitudes[mejor]:.3f}) con: {entrada.pregunta!r}")
+                    return entrada.respuesta, vector
+            self._fallos += 1
+        return None, vector
+
+    def guardar(self, pregunta: str, respuesta: str, latencia: float, vector: Optional[np.ndarray] = None,
+                historial: str = "", herramientas: Iterable[str] = ()):
+        """
+        Guarda la respuesta del agente si ni la pregunta ni la respuesta dependen del contexto.
+        `historial` es el chat_history que llevó el prompt y `herramientas` las que usó el
+        agente: si hubo historial o alguna herramienta no cacheable, no se guarda.
+        """
+        if not self.pregunta_cacheable(pregunta) or not self.respuesta_cacheable(respuesta):
+            return
+        if (historial or "").strip() or HERRAMIENTAS_NO_CACHEABLES.intersection(herramientas):
+            return
+        if vector is None:
+            vector = self._embeber(pregunta)
+
+        with self._lock:
+            if self._vectores is None:
+                self._vectores = np.zeros((self.max_entradas, vector.shape[0]), dtype=np.float32)
+            if not self._libres:
+                fila_lru, _ = self._entradas.popitem(last=False)
+                self._libres.append(fila_lru)
+            fila = self._libres.pop()
+            self._vectores[fila] = vector
+            self._entradas[fila] = _Entrada(pregunta, respuesta, time.time(), latencia)
+
+    def _expulsar_vencidas(self, ahora: float):
+        vencidas = [f for f, e in self._entradas.items() if ahora - e.creada > self.ttl]
+        for fila in vencidas:
+            del self._entradas[fila]
+            self._libres.append(fila)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "omitidas": self._omitidas,
+                "tasa_aciertos": self._aciertos / consultas if consultas else 0.0,
+                "segundos_ahorrados": round(self._segundos_ahorrados, 1),
+            }
@@ -0,0 +1,51 @@
+"""
+Decodificación en memoria de notas de voz para Whisper.
+
+El OGG/Opus descargado de Telegram se pasa a ffmpeg por stdin y se lee PCM por
+stdout: una sola decodificación, directo al formato que espera Whisper (16 kHz,
+mono, float32 en [-1, 1]) y sin archivos temporales.
+"""
+import os
+import subprocess
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000  # Whisper trabaja a 16 kHz
+VOICE_MAX_SECONDS = int(os.getenv("VOICE_MAX_SECONDS", "120"))  # Notas más largas se rechazan
+VOICE_MAX_BYTES = int(os.getenv("VOICE_MAX_BYTES", str(5 * 1024 * 1024)))
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+
+
+class AudioDemasiadoLargo(ValueError):
+    """La nota supera VOICE_MAX_SECONDS o VOICE_MAX_BYTES."""
+
+
+def validar_nota(duracion: int, tamano: int = None):
+    """Rechaza la nota con los metadatos de Telegram, antes de descargarla."""
+    if duracion and duracion > VOICE_MAX_SECONDS:
+        raise AudioDemasiadoLargo(f"{duracion}s > {VOICE_MAX_SECONDS}s")
+    if tamano and tamano > VOICE_MAX_BYTES:
+        raise AudioDemasiadoLargo(f"{tamano} bytes > {VOICE_MAX_BYTES} bytes")
+
+
+def decodificar_audio(datos: bytes, max_segundos: float = VOICE_MAX_SECONDS) -> np.ndarray:
+    """
+    Decodifica `datos` (cualquier formato que entienda ffmpeg) a un array
+    float32 mono de 16 kHz. `-t` recorta a `max_segundos` por si la duración
+    declarada por el cliente no era real, así el costo por nota queda acotado.
+    """
+    comando = [
+        FFMPEG_BIN, "-hide_banner", "-loglevel", "error",
+        "-threads", "0",
+        "-i", "pipe:0",
+        "-t", str(max_segundos),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    try:
+        salida = subprocess.run(comando, input=bytes(datos), capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg no pudo decodificar el audio: {e.stderr.decode(errors='ignore').strip()}") from e
+
+    return np.frombuffer(salida, np.int16).astype(np.float32) / 32768.0
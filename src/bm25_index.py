@@ -0,0 +1,92 @@
+"""
+Índice léxico BM25 sobre los mismos documentos del índice FAISS.
+
+Se construye en la ingesta dentro de `docstore.sqlite` (las posiciones coinciden
+con las de FAISS) y se consulta directamente en SQLite, sin cargarlo en memoria.
+Complementa la búsqueda densa en consultas con nombres exactos ("Gato del Río").
+"""
+import math
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from texto import palabras
+
+
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "o", "para", "por",
+    "que", "se", "su", "sus", "un", "una", "y", "the", "of", "and", "in", "to", "fuente", "titulo",
+    "descripcion", "pdf", "pag",
+}
+
+
+def tokenizar(texto: str) -> List[str]:
+    return [t for t in palabras(texto) if t not in STOPWORDS]
+
+
+def escribir_bm25(conn: sqlite3.Connection, documentos: Iterable[Tuple[int, str]], k1: float = K1, b: float = B):
+    """Crea las tablas BM25 en `conn` a partir de (posición, texto) de cada documento."""
+    conn.executescript("""
+        DROP TABLE IF EXISTS bm25_meta;
+        DROP TABLE IF EXISTS bm25_docs;
+        DROP TABLE IF EXISTS bm25_postings;
+        CREATE TABLE bm25_meta (clave TEXT PRIMARY KEY, valor REAL NOT NULL);
+        CREATE TABLE bm25_docs (pos INTEGER PRIMARY KEY, longitud INTEGER NOT NULL);
+        CREATE TABLE bm25_postings (term TEXT NOT NULL, pos INTEGER NOT NULL, tf INTEGER NOT NULL);
+    """)
+    n_docs = 0
+    total_tokens = 0
+    for posicion, texto in documentos:
+        tokens = tokenizar(texto)
+        n_docs += 1
+        total_tokens += len(tokens)
+        conn.execute("INSERT INTO bm25_docs VALUES (?, ?)", (posicion, len(tokens)))
+        conn.executemany("INSERT INTO bm25_postings VALUES (?, ?, ?)",
+                         ((term, posicion, tf) for term, tf in Counter(tokens).items()))
+
+    # El índice se crea al final: insertar primero y ordenar después es mucho más rápido
+    conn.execute("CREATE INDEX idx_bm25_postings_term ON bm25_postings(term)")
+    conn.executemany("INSERT INTO bm25_meta VALUES (?, ?)", [
+        ("n_docs", n_docs),
+        ("avgdl", total_tokens / n_docs if n_docs else 0.0),
+        ("k1", k1),
+        ("b", b),
+    ])
+
+
+class BM25Index:
+    """Consultas BM25 de solo lectura sobre `docstore.sqlite`."""
+
+    def __init__(self, path: Path):
+        self._conn = sqlite3.connect(f"file:{Path(path).resolve().as_posix()}?mode=ro&immutable=1",
+                                     uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT clave, valor FROM bm25_meta"))
+        self.n_docs = int(meta["n_docs"])
+        self.avgdl = meta["avgdl"] or 1.0
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+
+    def buscar(self, consulta: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Retorna hasta `k` pares (posición, puntaje) ordenados de mayor a menor puntaje."""
+        puntajes = Counter()
+        with self._lock:
+            for term in set(tokenizar(consulta)):
+                postings = self._conn.execute(
+                    "SELECT p.pos, p.tf, d.longitud FROM bm25_postings p "
+                    "JOIN bm25_docs d ON d.pos = p.pos WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+                for posicion, tf, longitud in postings:
+                    norma = self.k1 * (1 - self.b + self.b * longitud / self.avgdl)
+                    puntajes[posicion] += idf * tf * (self.k1 + 1) / (tf + norma)
+        return puntajes.most_common(k)
+
@@ -0,0 +1,152 @@
+"""
+Utilidades de caché compartidas por las herramientas: TTL + LRU acotada, con
+persistencia opcional en SQLite, y coalescencia de llamadas concurrentes.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Caché en memoria con tiempo de vida y tamaño máximo (expulsa la menos usada).
+
+    Con `db_path` cada entrada se guarda también en SQLite (como JSON), de modo
+    que sobrevive a reinicios del bot. La tabla se poda (vencidas y exceso sobre
+    `max_entradas`, conservando las que vencen más tarde) al abrirla y cada
+    `podar_cada` escrituras. Es segura entre hilos.
+    """
+
+    def __init__(self, ttl: float, max_entradas: int, db_path: Optional[str] = None, tabla: str = "cache",
+                 podar_cada: int = 64):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.podar_cada = podar_cada
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+        self._tabla = tabla
+        self._conn = None
+        self._escrituras = 0  # Escrituras en SQLite desde la última poda
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabla} (clave TEXT PRIMARY KEY, valor TEXT NOT NULL, vence REAL NOT NULL)"
+            )
+            self._podar_db()
+            self._conn.commit()
+
+    def get(self, clave: Hashable, default: Any = None) -> Any:
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                vence, valor = entrada
+                if vence >= ahora:
+                    self._datos.move_to_end(clave)
+                    return valor
+                del self._datos[clave]
+
+            if self._conn is not None:
+                fila = self._conn.execute(
+                    f"SELECT valor, vence FROM {self._tabla} WHERE clave = ?", (json.dumps(clave),)
+                ).fetchone()
+                if fila and fila[1] >= ahora:
+                    valor = json.loads(fila[0])
+                    self._guardar_en_memoria(clave, fila[1], valor)
+                    return valor
+        return default
+
+    def set(self, clave: Hashable, valor: Any, ttl: Optional[float] = None):
+        vence = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._guardar_en_memoria(clave, vence, valor)
+            if self._conn is not None:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self._tabla} (clave, valor, vence) VALUES (?, ?, ?)",
+                    (json.dumps(clave), json.dumps(valor, ensure_ascii=False), vence),
+                )
+                self._escrituras += 1
+                if self._escrituras >= self.podar_cada:
+                    self._podar_db()
+                self._conn.commit()
+
+    def delete(self, clave: Hashable):
+        with self._lock:
+            self._datos.pop(clave, None)
+            if self._conn is not None:
+                self._conn.execute(f"DELETE FROM {self._tabla} WHERE clave = ?", (json.dumps(clave),))
+                self._conn.commit()
+
+    def _podar_db(self):
+        """Borra de SQLite las vencidas y las que exceden `max_entradas` (se llama con el lock tomado)."""
+        self._conn.execute(f"DELETE FROM {self._tabla} WHERE vence < ?", (time.time(),))
+        self._conn.execute(
+            f"DELETE FROM {self._tabla} WHERE clave NOT IN "
+            f"(SELECT clave FROM {self._tabla} ORDER BY vence DESC LIMIT ?)",
+            (self.max_entradas,),
+        )
+        self._escrituras = 0
+
+    def _guardar_en_memoria(self, clave, vence, valor):
+        self._datos[clave] = (vence, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas concurrentes con la misma clave: solo el primer hilo
+    ejecuta la función y los demás esperan y reciben el mismo resultado.
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+
+    def do(self, clave: Hashable, funcion: Callable[[], Any]) -> Any:
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = Future()
+                self._en_vuelo[clave] = futuro
+
+        if not propio:
+            return futuro.result()
+
+        try:
+            futuro.set_result(funcion())
+        except BaseException as e:
+            futuro.set_exception(e)
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+        return futuro.result()
+
+
+class AsyncSingleFlight:
+    """
+    Como `SingleFlight`, para corrutinas del event loop: la primera llamada
+    crea la tarea y las concurrentes con la misma clave esperan su resultado.
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+
+    async def do(self, clave: Hashable, funcion: Callable[[], Awaitable[Any]]) -> Any:
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._en_vuelo.pop(clave, None) if self._en_vuelo.get(clave) is t else None)
+        # shield: si un solo llamador se cancela, la tarea compartida sigue para los demás
+        return await asyncio.shield(tarea)
@@ -0,0 +1,166 @@
+"""
+Control de concurrencia del bot.
+
+- `ChatLocks`: los mensajes de un mismo chat se atienden en orden (uno detrás
+  de otro) sin bloquear a los demás chats, que corren en paralelo.
+- `LimiteConcurrencia` + `LimiteLLMMixin`: tope global de
+  llamadas a Gemini en curso (LLM_MAX_CONCURRENCY), sean del agente async, de
+  la ruta rápida o de hilos en segundo plano como el resumen de memoria.
+"""
+import asyncio
+import functools
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))  # Updates de Telegram procesándose a la vez
+
+
+class ChatLocks:
+    """Un asyncio.Lock por chat, creado al llegar su primer mensaje y liberado cuando nadie lo espera."""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._usuarios: Dict[Hashable, int] = defaultdict(int)
+
+    @asynccontextmanager
+    async def turno(self, chat_id: Hashable):
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._usuarios[chat_id] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._usuarios[chat_id] -= 1
+            if not self._usuarios[chat_id]:
+                del self._usuarios[chat_id]
+                del self._locks[chat_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class LimiteConcurrencia:
+    """
+    Semáforo usable con `with` (hilos) y `async with` (event loop), compartiendo el mismo cupo.
+
+    Quien espera cupo entra en una sola cola FIFO: los hilos esperan un
+    `threading.Event` y las corrutinas un futuro de su loop, así ninguna espera
+    ocupa un hilo del executor. Al liberar, el cupo pasa directo al primero de
+    la cola.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._en_curso = 0
+        self._lock = threading.Lock()
+        self._cola = deque()  # threading.Event de un hilo o (loop, futuro) de una corrutina
+
+    def _tomar_o_encolar(self, espera) -> bool:
+        with self._lock:
+            if self._en_curso < self.maximo and not self._cola:
+                self._en_curso += 1
+                return True
+            self._cola.append(espera)
+            return False
+
+    def _liberar(self):
+        with self._lock:
+            while self._cola:
+                espera = self._cola.popleft()
+                if isinstance(espera, threading.Event):
+                    espera.set()
+                    return
+                loop, futuro = espera
+                try:
+                    loop.call_soon_threadsafe(self._entregar, futuro)
+                    return
+                except RuntimeError:  # Loop cerrado: nadie va a recibir el cupo
+                    continue
+            self._en_curso -= 1
+
+    def _entregar(self, futuro: asyncio.Future):
+        """Corre en el loop de la corrutina: le pasa el cupo, o lo devuelve si ya no lo espera."""
+        if futuro.cancelled():
+            self._liberar()
+        else:
+            futuro.set_result(None)
+
+    def __enter__(self):
+        evento = threading.Event()
+        if not self._tomar_o_encolar(evento):
+            evento.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._liberar()
+        return False
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        if self._tomar_o_encolar((loop, futuro)):
+            return self
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            with self._lock:
+                en_cola = (loop, futuro) in self._cola
+                if en_cola:
+                    self._cola.remove((loop, futuro))
+            if not en_cola and futuro.done() and not futuro.cancelled():
+                self._liberar()  # El cupo llegó junto con la cancelación
+            # Si no, `_entregar` verá el futuro cancelado y devolverá el cupo
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._liberar()
+        return False
+
+
+chat_locks = ChatLocks()
+limite_llm = LimiteConcurrencia(LLM_MAX_CONCURRENCY)
+
+
+def en_orden_por_chat(handler):
+    """Decorador para handlers de Telegram: con concurrent_updates, los updates de un chat no se adelantan."""
+    @functools.wraps(handler)
+    async def envoltura(update, context):
+        chat = update.effective_chat
+        if chat is None:
+            return await handler(update, context)
+        async with chat_locks.turno(chat.id):
+            return await handler(update, context)
+    return envoltura
+
+
+class LimiteLLMMixin:
+    """Para cualquier chat model de LangChain: respeta `limite_llm` en llamadas normales y en streaming."""
+
+    def _generate(self, *args, **kwargs):
+        with limite_llm:
+            return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        async with limite_llm:
+            return await super()._agenerate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with limite_llm:
+            yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with limite_llm:
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+class LimitedChatGoogleGenerativeAI(LimiteLLMMixin, ChatGoogleGenerativeAI):
+    """ChatGoogleGenerativeAI con el tope global de llamadas en curso."""
@@ -1,98 +1,524 @@
 """
 Módulo de gestión de base de datos para el historial de conversaciones.
+
+Cada hilo reutiliza su propia conexión SQLite (modo WAL, sentencias cacheadas)
+en lugar de abrir y cerrar una por consulta. Las variantes `a*` (p. ej.
+`asave_message`) corren en un executor dedicado de un solo hilo, así el event
+loop de Telegram nunca espera al disco.
+
+Los mensajes nuevos no se escriben al momento: quedan en un buffer en memoria
+(write-behind) que un hilo vuelca con `executemany` cada
+CHAT_DB_FLUSH_INTERVAL segundos o al juntar CHAT_DB_FLUSH_SIZE mensajes.
+`get_chat_history` incluye los mensajes del usuario que aún no se volcaron.
+
+Los últimos mensajes de cada usuario activo se guardan además en una caché LRU
+en memoria (un deque acotado por usuario), así que el historial de una
+conversación en curso no vuelve a consultar SQLite.
 """
+import asyncio
+import atexit
+import os
 import sqlite3
-from typing import List, Tuple
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, List, Tuple
 
 
-def init_database():
-    """Inicializa la base de datos SQLite para el historial de conversaciones."""
-    conn = sqlite3.connect('data/chat_history.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            message TEXT NOT NULL,
-            role TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", "data/chat_history.db")
+CHAT_DB_CACHE_KB = int(os.getenv("CHAT_DB_CACHE_KB", "8192"))  # Caché de páginas por conexión
+CHAT_DB_BUSY_TIMEOUT_MS = int(os.getenv("CHAT_DB_BUSY_TIMEOUT_MS", "5000"))
+HISTORY_PRUNE_EVERY = int(os.getenv("HISTORY_PRUNE_EVERY", "20"))  # Escrituras por usuario entre podas
+HISTORY_RETENTION_INTERVAL = int(os.getenv("HISTORY_RETENTION_INTERVAL", "3600"))  # segundos
+HISTORY_KEEP_LAST = 50
+CHAT_DB_FLUSH_INTERVAL = float(os.getenv("CHAT_DB_FLUSH_INTERVAL", "1.0"))  # segundos
+CHAT_DB_FLUSH_SIZE = int(os.getenv("CHAT_DB_FLUSH_SIZE", "64"))  # Mensajes en buffer que fuerzan un volcado
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", "1000"))  # Usuarios con historial en memoria
+HISTORY_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", "20"))  # Mensajes recientes por usuario
+
+_SQL_INSERTAR = 'INSERT INTO chat_history (user_id, message, role, timestamp) VALUES (?, ?, ?, ?)'
+_SQL_HISTORIAL = '''
+    SELECT message, role, timestamp
+    FROM chat_history
+    WHERE user_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+# Borra por debajo del id del mensaje N+1 más reciente: un recorrido corto del índice (user_id, id)
+_SQL_LIMPIAR = '''
+    DELETE FROM chat_history
+    WHERE user_id = ?
+    AND id <= (
+        SELECT id FROM chat_history
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT 1 OFFSET ?
+    )
+'''
+_SQL_RETENCION = '''
+    DELETE FROM chat_history
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS posicion
+            FROM chat_history
         )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_preferences (
+        WHERE posicion > ?
+    )
+'''
+_SQL_BORRAR_USUARIO = 'DELETE FROM chat_history WHERE user_id = ?'
+_SQL_BORRAR_RESUMEN = 'DELETE FROM chat_summaries WHERE user_id = ?'
+
+# Migraciones del esquema, en orden; PRAGMA user_version guarda cuántas se aplicaron
+_MIGRACIONES = [
+    'CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history (user_id, id)',
+    '''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
             user_id INTEGER PRIMARY KEY,
-            preferences TEXT,
-            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    conn.commit()
-    conn.close()
+    ''',
+]
+
+_local = threading.local()
+_conexiones: List[sqlite3.Connection] = []
+_conexiones_lock = threading.Lock()
+# Sube en cada close_database: las conexiones por hilo de una generación anterior ya están cerradas
+_generacion = 0
+# Un solo hilo: las escrituras no compiten entre sí por el lock de SQLite
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-db")
+# Escrituras por usuario desde su última poda
+_escrituras: Dict[int, int] = {}
+_escrituras_lock = threading.Lock()
+
+
+class _BufferEscritura:
+    """
+    Mensajes pendientes de volcar a SQLite.
+
+    `buffer_lock` protege las listas en memoria (operaciones cortas, sin disco);
+    `flush_lock` serializa los volcados y los borrados que no pueden cruzarse
+    con uno. `generacion` cambia en cada volcado confirmado: un lector que la
+    ve cambiar mientras consultaba SQLite repite la lectura para no duplicar
+    ni perder mensajes.
+    """
+
+    def __init__(self):
+        self.buffer_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pendientes: List[Tuple] = []  # (user_id, message, role, timestamp)
+        self.en_vuelo: List[Tuple] = []  # Sacados del buffer, aún sin commit
+        self.podas: Dict[int, int] = {}  # user_id -> keep_last, se aplican en el próximo volcado
+        self.generacion = 0
+        self.despertar = threading.Event()
+        self.detener = threading.Event()
+        self.hilo = None
+
+    def agregar(self, filas: List[Tuple], podar: Tuple[int, int] = None):
+        with self.buffer_lock:
+            self.pendientes.extend(filas)
+            if podar:
+                self.podas[podar[0]] = podar[1]
+            lleno = len(self.pendientes) >= CHAT_DB_FLUSH_SIZE
+        if lleno:
+            self.despertar.set()
+
+    def pendientes_de(self, user_id: int) -> Tuple[int, List[Tuple]]:
+        with self.buffer_lock:
+            return self.generacion, [f for f in self.en_vuelo + self.pendientes if f[0] == user_id]
+
+    def volcar(self) -> int:
+        """Escribe todo lo pendiente en una sola transacción. Retorna cuántos mensajes escribió."""
+        with self.flush_lock:
+            with self.buffer_lock:
+                lote, self.pendientes = self.pendientes, []
+                podas, self.podas = self.podas, {}
+                self.en_vuelo = lote
+            if not lote and not podas:
+                return 0
+            try:
+                with _conexion() as conn:
+                    conn.executemany(_SQL_INSERTAR, lote)
+                    for user_id, keep_last in podas.items():
+                        conn.execute(_SQL_LIMPIAR, (user_id, user_id, keep_last))
+            except Exception:
+                # Se devuelven al buffer para el próximo intento
+                with self.buffer_lock:
+                    self.pendientes = lote + self.pendientes
+                    self.podas = {**podas, **self.podas}
+                    self.en_vuelo = []
+                raise
+            with self.buffer_lock:
+                self.en_vuelo = []
+                self.generacion += 1
+            return len(lote)
+
+    def descartar_usuario(self, user_id: int) -> int:
+        """Quita del buffer los mensajes de un usuario (llamar con `flush_lock` tomado)."""
+        with self.buffer_lock:
+            antes = len(self.pendientes)
+            self.pendientes = [f for f in self.pendientes if f[0] != user_id]
+            self.podas.pop(user_id, None)
+            return antes - len(self.pendientes)
+
+    def iniciar(self):
+        with self.buffer_lock:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, name="chat-db-flush", daemon=True)
+                self.hilo.start()
+
+    def _bucle(self):
+        while not self.detener.is_set():
+            self.despertar.wait(CHAT_DB_FLUSH_INTERVAL)
+            self.despertar.clear()
+            try:
+                self.volcar()
+            except Exception as e:
+                print(f"[ERROR] No se pudo volcar el historial a SQLite: {e}")
+
+    def cerrar(self):
+        self.detener.set()
+        self.despertar.set()
+        if self.hilo is not None:
+            self.hilo.join()
+        escritos = self.volcar()
+        if escritos:
+            print(f"[DEBUG] {escritos} mensajes pendientes volcados al cerrar")
+
+
+_buffer = _BufferEscritura()
+
+
+class _CacheHistorial:
+    """
+    LRU de usuarios -> deque con sus últimos `max_mensajes` (message, role).
+
+    Las escrituras se encolan en el buffer y se añaden a la caché bajo el mismo
+    `lock`, así ambos ven los mensajes en el mismo orden. Un usuario que no está
+    en caché se carga desde SQLite en la primera lectura; si escribe mientras se
+    carga, esa carga se descarta (quedaría sin su mensaje nuevo).
+    """
+
+    def __init__(self, max_usuarios: int, max_mensajes: int):
+        self.max_usuarios = max_usuarios
+        self.max_mensajes = max_mensajes
+        self.lock = threading.Lock()
+        self._usuarios: "OrderedDict[int, deque]" = OrderedDict()
+        self._cargando: Dict[int, int] = {}  # user_id -> escrituras durante su carga
+        self.aciertos = 0
+        self.fallos = 0
+
+    def agregar(self, user_id: int, mensajes: List[Tuple[str, str]]):
+        """Llamar con `lock` tomado, junto con el encolado en el buffer."""
+        recientes = self._usuarios.get(user_id)
+        if recientes is not None:
+            recientes.extend(mensajes)
+            self._usuarios.move_to_end(user_id)
+        elif user_id in self._cargando:
+            self._cargando[user_id] += 1
+
+    def recientes(self, user_id: int, limit: int) -> List[Tuple[str, str]]:
+        if limit > self.max_mensajes:
+            return _leer_historial(user_id, limit)
+
+        with self.lock:
+            recientes = self._usuarios.get(user_id)
+            if recientes is not None:
+                self._usuarios.move_to_end(user_id)
+                self.aciertos += 1
+                return list(recientes)[-limit:] if limit > 0 else []
+            self.fallos += 1
+            escrituras = self._cargando.setdefault(user_id, 0)
+
+        mensajes = _leer_historial(user_id, self.max_mensajes)
+        with self.lock:
+            if self._cargando.pop(user_id, None) == escrituras:
+                self._usuarios[user_id] = deque(mensajes, maxlen=self.max_mensajes)
+                while len(self._usuarios) > self.max_usuarios:
+                    self._usuarios.popitem(last=False)
+        return mensajes[-limit:] if limit > 0 else []
+
+    def invalidar(self, user_id: int):
+        with self.lock:
+            self._usuarios.pop(user_id, None)
+            self._cargando.pop(user_id, None)
+
+    def metricas(self) -> dict:
+        with self.lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "usuarios": len(self._usuarios),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+_cache = _CacheHistorial(HISTORY_CACHE_USERS, HISTORY_CACHE_MESSAGES)
+
+
+def _conexion() -> sqlite3.Connection:
+    """Conexión del hilo actual, creada y configurada la primera vez (o tras un close_database)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "generacion", None) != _generacion:
+        conn = sqlite3.connect(CHAT_DB_PATH, timeout=CHAT_DB_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=128, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')  # Lectores no bloquean al escritor
+        conn.execute('PRAGMA synchronous=NORMAL')  # En WAL sigue siendo seguro ante caídas del proceso
+        conn.execute(f'PRAGMA cache_size=-{CHAT_DB_CACHE_KB}')
+        conn.execute(f'PRAGMA busy_timeout={CHAT_DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        _local.conn = conn
+        _local.generacion = _generacion
+        with _conexiones_lock:
+            _conexiones.append(conn)
+    return conn
+
+
+def init_database():
+    """Inicializa la base de datos SQLite para el historial de conversaciones."""
+    os.makedirs(os.path.dirname(CHAT_DB_PATH) or ".", exist_ok=True)
+    with _conexion() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                role TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_preferences (
+                user_id INTEGER PRIMARY KEY,
+                preferences TEXT,
+                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    _migrar()
+    _buffer.iniciar()
+
+
+def _migrar():
+    """Aplica las migraciones pendientes según PRAGMA user_version."""
+    conn = _conexion()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for numero, sentencia in enumerate(_MIGRACIONES[version:], start=version + 1):
+        with conn:
+            conn.execute(sentencia)
+            conn.execute(f'PRAGMA user_version = {numero}')
+        print(f"[DEBUG] Migración {numero} de chat_history aplicada")
+
+
+def _ahora() -> str:
+    # Mismo formato y zona (UTC) que CURRENT_TIMESTAMP: la hora real del mensaje, no la del volcado
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
 
 def save_message(user_id: int, message: str, role: str):
-    """Guarda un mensaje en el historial."""
-    conn = sqlite3.connect('data/chat_history.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO chat_history (user_id, message, role) VALUES (?, ?, ?)',
-        (user_id, message, role)
-    )
-    conn.commit()
-    conn.close()
+    """Guarda un mensaje en el historial (se escribe en el próximo volcado)."""
+    with _cache.lock:
+        _buffer.agregar([(user_id, message, role, _ahora())])
+        _cache.agregar(user_id, [(message, role)])
+
+
+def save_exchange(user_id: int, user_message: str, assistant_message: str, keep_last: int = HISTORY_KEEP_LAST):
+    """
+    Guarda pregunta y respuesta; se escriben juntas en el próximo volcado. El
+    historial antiguo se poda cada HISTORY_PRUNE_EVERY escrituras del usuario,
+    no en cada mensaje.
+    """
+    ahora = _ahora()
+    podar = (user_id, keep_last) if _toca_podar(user_id, 2) else None
+    with _cache.lock:
+        _buffer.agregar(
+            [(user_id, user_message, "user", ahora), (user_id, assistant_message, "assistant", ahora)],
+            podar=podar,
+        )
+        _cache.agregar(user_id, [(user_message, "user"), (assistant_message, "assistant")])
+
+
+def flush_pending() -> int:
+    """Vuelca ya los mensajes en buffer. Retorna cuántos escribió."""
+    return _buffer.volcar()
+
+
+def _toca_podar(user_id: int, nuevas: int) -> bool:
+    with _escrituras_lock:
+        total = _escrituras.get(user_id, 0) + nuevas
+        if total >= HISTORY_PRUNE_EVERY:
+            _escrituras.pop(user_id, None)
+            return True
+        _escrituras[user_id] = total
+        return False
 
 
 def get_chat_history(user_id: int, limit: int = 10) -> str:
-    """Obtiene el historial reciente de un usuario."""
-    conn = sqlite3.connect('data/chat_history.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT message, role, timestamp 
-        FROM chat_history 
-        WHERE user_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT ?
-    ''', (user_id, limit))
-    messages = cursor.fetchall()
-    conn.close()
-    
-    # Invertir para tener orden cronológico
-    messages.reverse()
-    
+    """Obtiene el historial reciente de un usuario (de memoria si su conversación está activa)."""
+    return _formatear_historial(_cache.recientes(user_id, limit))
+
+
+def history_cache_stats() -> dict:
+    """Usuarios en caché y aciertos/fallos de `get_chat_history`."""
+    return _cache.metricas()
+
+
+def get_recent_messages(user_id: int, limit: int = HISTORY_CACHE_MESSAGES) -> List[Tuple[str, str]]:
+    """Últimos `limit` (message, role) del usuario en orden cronológico, sin formatear."""
+    return _cache.recientes(user_id, limit)
+
+
+def get_messages_after(user_id: int, after_id: int) -> List[Tuple[int, str, str]]:
+    """(id, message, role) del usuario posteriores a `after_id`, ya volcados a SQLite."""
+    flush_pending()
+    return _conexion().execute(
+        'SELECT id, message, role FROM chat_history WHERE user_id = ? AND id > ? ORDER BY id',
+        (user_id, after_id),
+    ).fetchall()
+
+
+def count_messages_after(user_id: int, after_id: int) -> int:
+    """Cuántos mensajes del usuario son posteriores a `after_id`, incluidos los que siguen en buffer."""
+    while True:
+        generacion, pendientes = _buffer.pendientes_de(user_id)
+        total = _conexion().execute(
+            'SELECT COUNT(*) FROM chat_history WHERE user_id = ? AND id > ?', (user_id, after_id)
+        ).fetchone()[0]
+        # Si hubo un volcado mientras tanto, lo pendiente podría estar contado dos veces
+        if _buffer.pendientes_de(user_id)[0] == generacion:
+            return total + len(pendientes)
+
+
+def get_summary(user_id: int) -> Tuple[str, int]:
+    """(resumen, id del último mensaje que cubre) del usuario, o ("", 0) si aún no tiene."""
+    fila = _conexion().execute(
+        'SELECT summary, last_message_id FROM chat_summaries WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return (fila[0], fila[1]) if fila else ("", 0)
+
+
+def save_summary(user_id: int, summary: str, last_message_id: int):
+    """Guarda el resumen acumulado del usuario."""
+    with _conexion() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO chat_summaries (user_id, summary, last_message_id, updated_at) '
+            'VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+            (user_id, summary, last_message_id),
+        )
+
+
+def _leer_historial(user_id: int, limit: int) -> List[Tuple[str, str]]:
+    """Últimos `limit` (message, role) desde SQLite, incluidos los mensajes aún en buffer."""
+    while True:
+        generacion, pendientes = _buffer.pendientes_de(user_id)
+        pendientes = [(message, role) for _, message, role, _ in pendientes][-limit:] if limit > 0 else []
+        messages = []
+        if len(pendientes) < limit:
+            messages = _conexion().execute(_SQL_HISTORIAL, (user_id, limit - len(pendientes))).fetchall()
+        # Si hubo un volcado mientras tanto, el mismo mensaje podría estar en ambos lados
+        if _buffer.pendientes_de(user_id)[0] == generacion:
+            break
+    # Invertir para tener orden cronológico; lo pendiente siempre es más reciente
+    return [(message, role) for message, role, *_ in reversed(messages)] + pendientes
+
+
+def _formatear_historial(messages: List[Tuple]) -> str:
     # Formatear para el agente
     formatted_history = []
-    for msg, role, timestamp in messages:
+    for msg, role, *_ in messages:
         if role == "user":
             formatted_history.append(f"Usuario: {msg}")
         else:
             formatted_history.append(f"CAL-E: {msg}")
-    
+
     return "\n".join(formatted_history)
 
 
-def clear_old_history(user_id: int, keep_last: int = 50):
+def clear_old_history(user_id: int, keep_last: int = HISTORY_KEEP_LAST):
     """Limpia el historial antiguo, manteniendo solo los últimos N mensajes."""
-    conn = sqlite3.connect('data/chat_history.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM chat_history 
-        WHERE user_id = ? 
-        AND id NOT IN (
-            SELECT id FROM chat_history 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        )
-    ''', (user_id, user_id, keep_last))
-    conn.commit()
-    conn.close()
+    with _conexion() as conn:
+        conn.execute(_SQL_LIMPIAR, (user_id, user_id, keep_last))
+
+
+def purge_old_history(keep_last: int = HISTORY_KEEP_LAST) -> int:
+    """Retención en bloque: deja los últimos N mensajes de cada usuario. Retorna cuántos borró."""
+    with _conexion() as conn:
+        return conn.execute(_SQL_RETENCION, (keep_last,)).rowcount
 
 
 def delete_user_history(user_id: int) -> int:
-    """Borra todo el historial de un usuario. Retorna el número de registros eliminados."""
-    conn = sqlite3.connect('data/chat_history.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM chat_history WHERE user_id = ?', (user_id,))
-    deleted_count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    return deleted_count
+    """Borra todo el historial (y el resumen) de un usuario. Retorna el número de mensajes eliminados."""
+    with _escrituras_lock:
+        _escrituras.pop(user_id, None)
+    # Con flush_lock ningún volcado en curso puede reescribir mensajes del usuario después del DELETE
+    with _buffer.flush_lock:
+        descartados = _buffer.descartar_usuario(user_id)
+        with _conexion() as conn:
+            borrados = conn.execute(_SQL_BORRAR_USUARIO, (user_id,)).rowcount
+            conn.execute(_SQL_BORRAR_RESUMEN, (user_id,))
+        # Después del DELETE: también descarta cargas que leyeron el historial viejo
+        _cache.invalidar(user_id)
+    return borrados + descartados
+
+
+def close_database():
+    """Vuelca lo pendiente, espera las operaciones en curso y cierra todas las conexiones (al apagar el bot)."""
+    global _generacion
+    _buffer.cerrar()
+    _executor.shutdown(wait=True)
+    with _conexiones_lock:
+        for conn in _conexiones:
+            conn.close()
+        _conexiones.clear()
+        _generacion += 1
+    # Las referencias de otros hilos se descartan en su próximo _conexion() al ver la generación nueva
+    _local.conn = None
+
+
+# Si el proceso termina sin pasar por close_database, lo pendiente igual se escribe
+atexit.register(_buffer.cerrar)
+
+
+# --- API asíncrona: misma semántica, ejecutada en el hilo de la base de datos ---
+
+async def _en_executor(funcion, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(funcion, *args, **kwargs))
+
+
+async def asave_message(user_id: int, message: str, role: str):
+    save_message(user_id, message, role)  # Solo encola en memoria, no toca el disco
+
+
+async def asave_exchange(user_id: int, user_message: str, assistant_message: str, keep_last: int = HISTORY_KEEP_LAST):
+    save_exchange(user_id, user_message, assistant_message, keep_last)
+
+
+async def aget_chat_history(user_id: int, limit: int = 10) -> str:
+    return await _en_executor(get_chat_history, user_id, limit)
+
+
+async def aclear_old_history(user_id: int, keep_last: int = HISTORY_KEEP_LAST):
+    await _en_executor(clear_old_history, user_id, keep_last)
+
+
+async def apurge_old_history(keep_last: int = HISTORY_KEEP_LAST) -> int:
+    return await _en_executor(purge_old_history, keep_last)
+
+
+async def retention_loop(interval: float = HISTORY_RETENTION_INTERVAL, keep_last: int = HISTORY_KEEP_LAST):
+    """Tarea de fondo: cada `interval` segundos aplica la retención a todos los usuarios."""
+    while True:
+        try:
+            borrados = await apurge_old_history(keep_last)
+            if borrados:
+                print(f"[DEBUG] Retención de historial: {borrados} mensajes antiguos borrados")
+        except Exception as e:
+            print(f"[ERROR] Falló la retención del historial: {e}")
+        await asyncio.sleep(interval)
+
+
+async def adelete_user_history(user_id: int) -> int:
+    return await _en_executor(delete_user_history, user_id)
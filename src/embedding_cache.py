@@ -0,0 +1,190 @@
+"""
+Etapa de embeddings por lotes para la ingesta, con caché persistente en disco.
+
+Los vectores se guardan en un `vectors.npy` abierto como memmap y un pequeño
+`index.json` (hash del texto -> fila). Así, una ingesta que se interrumpe o se
+vuelve a ejecutar reutiliza todo lo que ya se había calculado.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+VECTORS_NAME = "vectors.npy"
+INDEX_NAME = "index.json"
+CAPACIDAD_INICIAL = 1024
+SEGUNDOS_ENTRE_GUARDADOS = 5.0
+
+
+def hash_texto(texto: str) -> str:
+    """Hash estable de un texto; clave de la caché y id de los documentos en el índice."""
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Caché de vectores de embeddings en disco, indexada por hash de texto."""
+
+    def __init__(self, directorio: Path):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._filas: Dict[str, int] = {}
+        self._vectores = None
+        self.dim: Optional[int] = None
+
+        index_path = self.directorio / INDEX_NAME
+        vectors_path = self.directorio / VECTORS_NAME
+        if index_path.exists() and vectors_path.exists():
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._vectores = np.load(vectors_path, mmap_mode="r+")
+                self._filas = data["rows"]
+                self.dim = data["dim"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Caché de embeddings ilegible ({e}). Se empezará una nueva.")
+                self._filas, self._vectores, self.dim = {}, None, None
+
+    def __len__(self) -> int:
+        return len(self._filas)
+
+    def obtener(self, claves: List[str]) -> Dict[str, np.ndarray]:
+        """Retorna {clave: vector} para las claves que ya están en la caché."""
+        return {c: np.array(self._vectores[self._filas[c]]) for c in claves if c in self._filas}
+
+    def agregar(self, claves: List[str], vectores: np.ndarray):
+        """Añade vectores nuevos (no se persisten en el índice hasta llamar a `guardar`)."""
+        vectores = np.asarray(vectores, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectores.shape[1]
+        nuevas = [(c, v) for c, v in zip(claves, vectores) if c not in self._filas]
+        if not nuevas:
+            return
+        self._asegurar_capacidad(len(self._filas) + len(nuevas))
+        for clave, vector in nuevas:
+            fila = len(self._filas)
+            self._vectores[fila] = vector
+            self._filas[clave] = fila
+
+    def guardar(self):
+        """Escribe primero los vectores y después el índice, de forma atómica."""
+        if self._vectores is None:
+            return
+        self._vectores.flush()
+        tmp = self.directorio / (INDEX_NAME + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim, "rows": self._filas}, f)
+        os.replace(tmp, self.directorio / INDEX_NAME)
+
+    def _asegurar_capacidad(self, necesarias: int):
+        capacidad = 0 if self._vectores is None else self._vectores.shape[0]
+        if necesarias <= capacidad:
+            return
+        nueva_capacidad = max(CAPACIDAD_INICIAL, capacidad * 2, necesarias)
+        tmp = self.directorio / (VECTORS_NAME + ".tmp")
+        nuevos = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32,
+                                           shape=(nueva_capacidad, self.dim))
+        if self._vectores is not None:
+            nuevos[:len(self._filas)] = self._vectores[:len(self._filas)]
+        nuevos.flush()
+        del nuevos
+        self._vectores = None  # En Windows no se puede reemplazar un archivo mapeado
+        os.replace(tmp, self.directorio / VECTORS_NAME)
+        self._vectores = np.load(self.directorio / VECTORS_NAME, mmap_mode="r+")
+
+
+# --- Workers del pool de procesos (un modelo por proceso) ---
+_modelo_worker = None
+
+
+def _iniciar_worker(model_name: str, hilos: int):
+    global _modelo_worker
+    try:
+        import torch
+        torch.set_num_threads(hilos)  # Evita que cada proceso intente usar todos los núcleos
+    except ImportError:
+        pass
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _modelo_worker = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_lote_worker(textos: List[str]) -> np.ndarray:
+    return np.asarray(_modelo_worker.embed_documents(textos), dtype=np.float32)
+
+
+def calcular_embeddings(textos: List[str], embeddings_model, cache: Optional[EmbeddingCache] = None,
+                        batch_size: int = 64, workers: int = 0, model_name: Optional[str] = None) -> np.ndarray:
+    """
+    Calcula los embeddings de `textos` por lotes y retorna una matriz float32 (n x dim).
+
+    Los textos que ya están en la caché no se recalculan. Con `workers > 0` los
+    lotes se reparten en un pool de procesos (cada uno carga `model_name`); si no,
+    se usa `embeddings_model` en este proceso. La caché se guarda periódicamente
+    para que una interrupción no pierda el trabajo hecho.
+    """
+    if not textos:
+        return np.empty((0, (cache.dim if cache else None) or 0), dtype=np.float32)
+
+    claves = [hash_texto(t) for t in textos]
+    vectores: Dict[str, np.ndarray] = cache.obtener(claves) if cache else {}
+    desde_cache = len(vectores)
+
+    # Textos únicos que faltan por calcular, en orden de aparición
+    faltantes = list(dict.fromkeys(c for c in claves if c not in vectores))
+    texto_por_clave = dict(zip(claves, textos))
+    lotes = [faltantes[i:i + batch_size] for i in range(0, len(faltantes), batch_size)]
+
+    total = len(faltantes)
+    print(f"   🧮 Embeddings: {desde_cache} desde caché, {total} por calcular "
+          f"(lotes de {batch_size}, {'%d procesos' % workers if workers else 'un proceso'}).")
+
+    hechos = 0
+    ultimo_guardado = time.monotonic()
+    inicio = time.monotonic()
+
+    def registrar(lote_claves: List[str], lote_vectores: np.ndarray):
+        nonlocal hechos, ultimo_guardado
+        vectores.update(zip(lote_claves, lote_vectores))
+        hechos += len(lote_claves)
+        if cache is not None:
+            cache.agregar(lote_claves, lote_vectores)
+            if time.monotonic() - ultimo_guardado > SEGUNDOS_ENTRE_GUARDADOS:
+                cache.guardar()
+                ultimo_guardado = time.monotonic()
+        velocidad = hechos / max(time.monotonic() - inicio, 1e-9)
+        print(f"   🔄 {hechos}/{total} embeddings calculados ({velocidad:.0f} textos/s)", end="\r")
+
+    try:
+        if workers and lotes:
+            hilos = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker,
+                                     initargs=(model_name, hilos)) as pool:
+                # Ventana deslizante: como mucho 2 lotes en vuelo por proceso
+                en_vuelo = deque()
+                for lote in lotes:
+                    en_vuelo.append((lote, pool.submit(_embed_lote_worker, [texto_por_clave[c] for c in lote])))
+                    if len(en_vuelo) >= workers * 2:
+                        lote_listo, futuro = en_vuelo.popleft()
+                        registrar(lote_listo, futuro.result())
+                while en_vuelo:
+                    lote_listo, futuro = en_vuelo.popleft()
+                    registrar(lote_listo, futuro.result())
+        else:
+            for lote in lotes:
+                lote_vectores = np.asarray(
+                    embeddings_model.embed_documents([texto_por_clave[c] for c in lote]), dtype=np.float32
+                )
+                registrar(lote, lote_vectores)
+    finally:
+        if cache is not None:
+            cache.guardar()
+        if total:
+            print()
+
+    return np.stack([vectores[c] for c in claves]).astype(np.float32, copy=False)
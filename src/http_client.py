@@ -0,0 +1,161 @@
+"""
+Cliente HTTP compartido por las herramientas de Places y Weather.
+
+Una sola `requests.Session` con pool de conexiones keep-alive (se evita abrir
+TCP+TLS en cada llamada), reintentos con backoff ante 429/5xx y contadores de
+latencia y errores por endpoint.
+
+`arequest`/`aget`/`apost` hacen lo mismo sobre un `httpx.AsyncClient`
+compartido, para las herramientas que corren en el event loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # Hosts distintos con pool propio
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))  # Conexiones reutilizables por host
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))  # segundos
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.3"))  # 0.3s, 0.6s, 1.2s...
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+def _crear_sesion() -> requests.Session:
+    reintentos = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=ESTADOS_REINTENTABLES,
+        allowed_methods=frozenset({"GET", "POST"}),  # searchText es una consulta, se puede repetir
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                            max_retries=reintentos)
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+_sesion = _crear_sesion()
+_metricas = {}
+_metricas_lock = threading.Lock()
+
+
+_cliente_async: Optional[httpx.AsyncClient] = None
+
+
+def _registrar(endpoint: str, segundos: float, error: bool):
+    with _metricas_lock:
+        m = _metricas.setdefault(endpoint, {"peticiones": 0, "errores": 0, "segundos_total": 0.0, "segundos_max": 0.0})
+        m["peticiones"] += 1
+        m["errores"] += int(error)
+        m["segundos_total"] += segundos
+        m["segundos_max"] = max(m["segundos_max"], segundos)
+
+
+def _nombre_endpoint(url: str) -> str:
+    partes = urlsplit(url)
+    return f"{partes.netloc}{partes.path}"
+
+
+def request(method: str, url: str, endpoint: str = None, timeout: float = HTTP_TIMEOUT, **kwargs) -> requests.Response:
+    """Hace la petición con la sesión compartida y registra su latencia bajo `endpoint`."""
+    endpoint = endpoint or _nombre_endpoint(url)
+    inicio = time.monotonic()
+    try:
+        respuesta = _sesion.request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        _registrar(endpoint, time.monotonic() - inicio, error=True)
+        raise
+    _registrar(endpoint, time.monotonic() - inicio, error=respuesta.status_code >= 400)
+    return respuesta
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def _cliente() -> httpx.AsyncClient:
+    """Cliente async compartido; se crea dentro del event loop que lo usa."""
+    global _cliente_async
+    if _cliente_async is None or _cliente_async.is_closed:
+        _cliente_async = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                                max_keepalive_connections=HTTP_POOL_MAXSIZE),
+            timeout=HTTP_TIMEOUT,
+        )
+    return _cliente_async
+
+
+def _espera_reintento(respuesta: Optional[httpx.Response], intento: int) -> float:
+    """Retry-After si la API lo manda; si no, el mismo backoff exponencial que la sesión síncrona."""
+    if respuesta is not None:
+        try:
+            return float(respuesta.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+    return HTTP_BACKOFF * (2 ** intento)
+
+
+async def arequest(method: str, url: str, endpoint: str = None, timeout: float = HTTP_TIMEOUT, **kwargs) -> httpx.Response:
+    """Versión async de `request`: mismos reintentos ante 429/5xx y mismas métricas."""
+    endpoint = endpoint or _nombre_endpoint(url)
+    inicio = time.monotonic()
+    for intento in range(HTTP_MAX_RETRIES + 1):
+        try:
+            respuesta = await _cliente().request(method, url, timeout=timeout, **kwargs)
+        except httpx.TransportError:
+            if intento == HTTP_MAX_RETRIES:
+                _registrar(endpoint, time.monotonic() - inicio, error=True)
+                raise
+            await asyncio.sleep(_espera_reintento(None, intento))
+            continue
+        if respuesta.status_code not in ESTADOS_REINTENTABLES or intento == HTTP_MAX_RETRIES:
+            break
+        await asyncio.sleep(_espera_reintento(respuesta, intento))
+    _registrar(endpoint, time.monotonic() - inicio, error=respuesta.status_code >= 400)
+    return respuesta
+
+
+async def aget(url: str, **kwargs) -> httpx.Response:
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url: str, **kwargs) -> httpx.Response:
+    return await arequest("POST", url, **kwargs)
+
+
+async def cerrar_async():
+    """Cierra el cliente async (al apagar el bot)."""
+    global _cliente_async
+    if _cliente_async is not None:
+        await _cliente_async.aclose()
+        _cliente_async = None
+
+
+def metricas() -> dict:
+    """Peticiones, errores y latencia media/máxima (ms) por endpoint."""
+    with _metricas_lock:
+        return {
+            endpoint: {
+                "peticiones": m["peticiones"],
+                "errores": m["errores"],
+                "latencia_media_ms": round(1000 * m["segundos_total"] / m["peticiones"], 1),
+                "latencia_max_ms": round(1000 * m["segundos_max"], 1),
+            }
+            for endpoint, m in _metricas.items()
+        }
@@ -0,0 +1,121 @@
+"""
+Recuperación híbrida para `buscar_info_visitcali`: BM25 + FAISS con fusión RRF.
+
+La búsqueda densa entiende paráfrasis ("dónde ver el atardecer") y la léxica
+acierta nombres exactos ("Gato del Río"). Ambas listas se combinan con
+reciprocal-rank fusion y, opcionalmente, se reordenan con un re-ranker barato.
+"""
+import asyncio
+import os
+from typing import Any, Callable, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from bm25_index import tokenizar
+
+
+RRF_K = 60  # Constante estándar de reciprocal-rank fusion
+RAG_RERANKER = os.getenv("RAG_RERANKER", "frase")  # frase | cross-encoder | ninguno
+CROSS_ENCODER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Multilingüe
+
+
+def _clave(doc: Document) -> str:
+    return doc.id or doc.page_content
+
+
+def reranker_frase(consulta: str, documentos: List[Document], puntajes: List[float]) -> List[Document]:
+    """
+    Re-ranker léxico casi gratuito: premia los documentos que contienen la frase
+    de la consulta completa (sin tildes ni stopwords) o la mayoría de sus palabras.
+    """
+    terminos = tokenizar(consulta)
+    if not terminos:
+        return documentos
+    frase = " ".join(terminos)
+    maximo = max(puntajes) or 1.0
+
+    def puntaje(par):
+        doc, rrf = par
+        tokens = tokenizar(doc.page_content)
+        texto = " ".join(tokens)
+        cobertura = len(set(terminos) & set(tokens)) / len(set(terminos))
+        bonus = (1.0 if f" {frase} " in f" {texto} " else 0.0) + cobertura
+        return rrf / maximo + 0.5 * bonus
+
+    return [doc for doc, _ in sorted(zip(documentos, puntajes), key=puntaje, reverse=True)]
+
+
+def crear_reranker(nombre: str = RAG_RERANKER) -> Optional[Callable]:
+    """Crea el re-ranker configurado; None para usar solo el orden de la fusión."""
+    nombre = (nombre or "ninguno").lower()
+    if nombre == "frase":
+        return reranker_frase
+    if nombre == "cross-encoder":
+        try:
+            from sentence_transformers import CrossEncoder
+            modelo = CrossEncoder(CROSS_ENCODER_MODEL)
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el cross-encoder ({e}). Se usará el re-ranker por frase.")
+            return reranker_frase
+
+        def reranker_cross_encoder(consulta, documentos, puntajes):
+            scores = modelo.predict([(consulta, d.page_content) for d in documentos])
+            return [d for _, d in sorted(zip(scores, documentos), key=lambda p: p[0], reverse=True)]
+
+        return reranker_cross_encoder
+    return None
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever de LangChain que fusiona FAISS y BM25 con reciprocal-rank fusion."""
+
+    vector_store: Any
+    bm25: Optional[Any] = None
+    reranker: Optional[Callable] = None
+    k: int = 2
+    k_candidatos: int = 10
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._fusionar(query, self._densos(query), self._lexicos(query))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # FAISS y BM25 son independientes: en paralelo y fuera del event loop
+        densos, lexicos = await asyncio.gather(
+            asyncio.to_thread(self._densos, query),
+            asyncio.to_thread(self._lexicos, query),
+        )
+        return self._fusionar(query, densos, lexicos)
+
+    def _densos(self, query: str) -> List[Document]:
+        return self.vector_store.similarity_search(query, k=self.k_candidatos)
+
+    def _lexicos(self, query: str) -> List[Document]:
+        if self.bm25 is None:
+            return []
+        documentos = []
+        for posicion, _ in self.bm25.buscar(query, k=self.k_candidatos):
+            doc_id = self.vector_store.index_to_docstore_id[posicion]
+            doc = self.vector_store.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            doc.id = doc.id or doc_id
+            documentos.append(doc)
+        return documentos
+
+    def _fusionar(self, query: str, densos: List[Document], lexicos: List[Document]) -> List[Document]:
+        fusion = {}
+        documentos = {}
+        for lista in (densos, lexicos):
+            for rango, doc in enumerate(lista, start=1):
+                clave = _clave(doc)
+                documentos.setdefault(clave, doc)
+                fusion[clave] = fusion.get(clave, 0.0) + 1.0 / (RRF_K + rango)
+
+        ordenadas = sorted(fusion, key=fusion.get, reverse=True)
+        candidatos = [documentos[c] for c in ordenadas]
+        if self.reranker is not None and len(candidatos) > 1:
+            candidatos = self.reranker(query, candidatos, [fusion[c] for c in ordenadas])
+        return candidatos[:self.k]
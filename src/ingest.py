@@ -1,105 +1,328 @@
+"""
+Ingesta del conocimiento de CAL-E (JSONL de VisitCali + PDFs) en el índice FAISS.
+
+La ingesta es incremental: junto al índice se guarda un manifiesto con el hash
+de cada registro JSONL y de cada trozo de página PDF, de modo que en cada ejecución solo
+se calculan embeddings de los documentos nuevos o modificados y se eliminan del
+índice los que ya no existen. Usa `--full` para forzar una reconstrucción completa.
+
+Los PDFs se extraen en paralelo y se parten en trozos solapados que caben en la
+ventana del modelo de embeddings (ver `pdf_pipeline.py`).
+
+Los embeddings se calculan por lotes (`--batch-size`), opcionalmente en varios
+procesos (`--workers`), y se guardan en una caché en disco para no recalcularlos.
+
+Con `--index-type` se puede construir un índice IVF-Flat, IVF-PQ o HNSW en lugar
+del plano; en ese caso se informa el recall@k frente a la búsqueda exacta.
+"""
+import argparse
 import json
 import os
+import shutil
+import time
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings # <-- Corregido: paquete actualizado
-from langchain_community.document_loaders import PyPDFLoader
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, calcular_embeddings, hash_texto
+from pdf_pipeline import MAX_TOKENS_CHUNK, SOLAPAMIENTO_TOKENS, iterar_trozos_pdf
+from vector_index import (
+    DOCSTORE_NAME, INDEX_NAME, MANIFEST_NAME, MUESTRA_ENTRENAMIENTO, PUNTERO_NAME, TIPOS_INDICE, VERSIONES_DIR,
+    aplicar_parametros_busqueda, cadena_factory, cargar_vector_store, construir_indice, crear_vector_store,
+    guardar_vector_store, leer_manifest, medir_recall, parametros_busqueda, resolver_indice, tamano_indice,
+)
 
 load_dotenv()
 
-# --- 1. Configura el modelo de Embeddings ---
-print("Cargando modelo de embeddings local (esto puede tardar la primera vez)...")
-try:
-    embeddings_model = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2" # Modelo local, rápido y gratis
-    )
-    print("Modelo de embeddings cargado.")
-except Exception as e:
-    print(f"Error al cargar el modelo de embeddings. Asegúrate de tener 'pip install langchain-huggingface sentence-transformers'. Error: {e}")
-    exit()
+FILE_PATH = "data/visitcali_scraping.jsonl"
+DATA_DIR = Path("data")
+INDEX_PATH = Path("data/faiss_index_cali")
+MANIFEST_VERSION = 2  # 2: trozos de PDF por tokens y solapados; otra versión en disco fuerza la reconstrucción
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = Path("data/embedding_cache") / EMBEDDING_MODEL_NAME
 
-documents = []
 
-# --- 2. Procesar archivo JSONL ---
-FILE_PATH = "data/visitcali_scraping.jsonl"
-print(f"\n📄 Leyendo el archivo {FILE_PATH}...")
+def leer_jsonl(path: str, estricto: bool = False) -> dict:
+    """
+    Lee el JSONL de VisitCali. Retorna {doc_id: (texto, metadata)} por registro útil.
 
-try:
-    with open(FILE_PATH, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip(): # Evita líneas vacías
+    Con `estricto=True` cualquier error de lectura (archivo faltante, línea
+    inválida) se relanza en vez de retornar lo leído hasta ese punto.
+    """
+    documentos = {}
+    print(f"\n📄 Leyendo el archivo {path}...")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for num_linea, line in enumerate(f, start=1):
+                if not line.strip(): # Evita líneas vacías
+                    continue
                 data = json.loads(line)
-                
-                # --- 3. Crea el "documento" de texto ---
+
                 # Combinamos título y descripción para un contexto más rico.
                 title = data.get('title', '').replace(' - CALI ES DONDE DEBES ESTAR', '') # Limpiamos el título
                 description = data.get('description', '')
                 url = data.get('url', '')
-                
+
                 # Solo añadimos el documento si tiene una descripción útil
                 if description and description.strip():
                     text_content = f"Título: {title}\nDescripción: {description}\nFuente: {url}"
-                    documents.append(text_content)
+                    metadata = {"source": "visitcali", "url": url, "line": num_linea}
+                    documentos[hash_texto(text_content)] = (text_content, metadata)
 
-    print(f"✅ Se procesaron {len(documents)} documentos del archivo JSONL.")
+        print(f"✅ Se procesaron {len(documentos)} documentos del archivo JSONL.")
 
-except FileNotFoundError:
-    print(f"⚠️ No se encontró el archivo '{FILE_PATH}'.")
-except json.JSONDecodeError as e:
-    print(f"❌ Error al leer el JSON en una de las líneas. Revisa el archivo. Error: {e}")
-except Exception as e:
-    print(f"❌ Ocurrió un error inesperado al leer JSONL: {e}")
+    except FileNotFoundError:
+        print(f"⚠️ No se encontró el archivo '{path}'.")
+        if estricto:
+            raise
+    except json.JSONDecodeError as e:
+        print(f"❌ Error al leer el JSON en una de las líneas. Revisa el archivo. Error: {e}")
+        if estricto:
+            raise
+    except Exception as e:
+        print(f"❌ Ocurrió un error inesperado al leer JSONL: {e}")
+        if estricto:
+            raise
 
-# --- 3. Procesar archivos PDF ---
-DATA_DIR = Path("data")
-pdf_files = list(DATA_DIR.glob("*.pdf"))
-
-if pdf_files:
-    print(f"\n📚 Encontrados {len(pdf_files)} archivos PDF. Procesando...")
-    
-    for pdf_path in pdf_files:
-        try:
-            print(f"   - Procesando: {pdf_path.name}")
-            loader = PyPDFLoader(str(pdf_path))
-            pdf_documents = loader.load()
-            
-            # Agregar información del archivo al contenido
-            for doc in pdf_documents:
-                # Agregar metadatos al contenido
-                text_with_source = f"Fuente PDF: {pdf_path.name}\n{doc.page_content}"
-                documents.append(text_with_source)
-            
-            print(f"     ✅ {len(pdf_documents)} páginas procesadas de {pdf_path.name}")
-            
-        except Exception as e:
-            print(f"     ❌ Error al procesar {pdf_path.name}: {e}")
-    
-    print(f"✅ Total de documentos de PDFs: {len(pdf_documents) if pdf_files else 0}")
-else:
-    print(f"\nℹ️ No se encontraron archivos PDF en la carpeta 'data'.")
-
-# --- 4. Verificar que hay documentos para procesar ---
-if not documents:
-    print("\n❌ ERROR: No se encontraron documentos válidos para crear el índice.")
-    print("Asegúrate de tener el archivo JSONL o archivos PDF en la carpeta 'data'.")
-    exit()
-
-print(f"\n📊 Total de documentos a indexar: {len(documents)}")
-
-# --- 5. Crea y guarda la Base de Datos Vectorial ---
-try:
-    print("\n🔄 Creando índice vectorial con FAISS (esto puede tardar unos segundos)...")
-    
-    # `from_texts` toma la lista de strings y crea los embeddings y el índice
-    vector_store = FAISS.from_texts(documents, embeddings_model)
-    
-    # Guarda el índice localmente
-    vector_store.save_local("data/faiss_index_cali")
-    
-    print("\n✅ ¡Éxito! Índice FAISS 'faiss_index_cali' creado y guardado.")
-    print(f"   📁 Ubicación: data/faiss_index_cali")
-    print(f"   📝 Documentos indexados: {len(documents)}")
-    
-except Exception as e:
-    print(f"\n❌ Ocurrió un error al crear el índice: {e}")
\ No newline at end of file
+    return documentos
+
+
+def leer_pdfs(data_dir: Path, workers=None, max_tokens: int = MAX_TOKENS_CHUNK,
+              solapamiento: int = SOLAPAMIENTO_TOKENS, estricto: bool = False) -> dict:
+    """Lee todos los PDFs de `data_dir`. Retorna {doc_id: (texto, metadata)} por trozo de página."""
+    documentos = {}
+    for text_with_source, metadata in iterar_trozos_pdf(data_dir, workers, max_tokens, solapamiento, estricto):
+        documentos[hash_texto(text_with_source)] = (text_with_source, metadata)
+
+    if documentos:
+        print(f"✅ Total de trozos de PDFs: {len(documentos)}")
+    return documentos
+
+
+def cargar_manifest(index_path: Path):
+    """Carga el manifiesto del índice existente, o None si no hay uno compatible."""
+    index_path = resolver_indice(index_path)
+    manifest_path = index_path / MANIFEST_NAME
+    if not (index_path / INDEX_NAME).exists() or not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ No se pudo leer el manifiesto ({e}). Se reconstruirá el índice completo.")
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        print("⚠️ Manifiesto de una versión anterior. Se reconstruirá el índice completo.")
+        return None
+    if manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        print("⚠️ El índice usa otro modelo de embeddings. Se reconstruirá el índice completo.")
+        return None
+    return manifest
+
+
+def guardar_indice_atomico(vector_store, manifest: dict, destino: Path):
+    """
+    Guarda índice y manifiesto en una versión nueva (`destino/versiones/<id>`)
+    y la publica reemplazando el puntero `destino/ACTUAL` con un solo
+    `os.replace`. Quien abra el índice (`main.py`, otro worker) ve la versión
+    anterior completa o la nueva completa: nunca un directorio faltante ni a
+    medio escribir.
+
+    Se conservan la versión nueva y la anterior (puede haber lectores
+    abriéndola); las demás, y los archivos del formato sin versiones, se borran.
+    """
+    anterior = resolver_indice(destino)
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    nueva = destino / VERSIONES_DIR / version
+
+    guardar_vector_store(vector_store, nueva)
+    with open(nueva / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+    puntero_tmp = destino / (PUNTERO_NAME + ".tmp")
+    with open(puntero_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(puntero_tmp, destino / PUNTERO_NAME)
+
+    for directorio in (destino / VERSIONES_DIR).iterdir():
+        if directorio not in (nueva, anterior):
+            shutil.rmtree(directorio, ignore_errors=True)
+    if anterior != destino:
+        # Formato anterior (archivos sueltos en `destino`): ya pasaron dos versiones, nadie los usa
+        for nombre in (INDEX_NAME, DOCSTORE_NAME, MANIFEST_NAME, "index.pkl"):
+            (destino / nombre).unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea o actualiza el índice FAISS de CAL-E.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignora el manifiesto y reconstruye el índice completo.")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Textos por lote de embeddings (por defecto 64).")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Procesos para calcular embeddings en paralelo (0 = solo este proceso).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No usa ni actualiza la caché de embeddings en disco.")
+    parser.add_argument("--pdf-workers", type=int, default=None,
+                        help="Procesos para extraer PDFs en paralelo (por defecto, uno por núcleo).")
+    parser.add_argument("--chunk-tokens", type=int, default=MAX_TOKENS_CHUNK,
+                        help=f"Tokens máximos por trozo de PDF (por defecto {MAX_TOKENS_CHUNK}).")
+    parser.add_argument("--chunk-overlap", type=int, default=SOLAPAMIENTO_TOKENS,
+                        help=f"Tokens de solapamiento entre trozos (por defecto {SOLAPAMIENTO_TOKENS}).")
+    parser.add_argument("--index-type", choices=TIPOS_INDICE, default=None,
+                        help="Tipo de índice FAISS (por defecto, el que ya hay en disco o 'flat'). "
+                             "Cambiar de tipo o de parámetros de construcción requiere reconstruir.")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="Listas invertidas de los índices IVF (por defecto ~4*sqrt(n)).")
+    parser.add_argument("--nprobe", type=int, default=None,
+                        help="Listas a revisar por búsqueda en IVF; más = mejor recall (por defecto 8).")
+    parser.add_argument("--pq-m", type=int, default=16,
+                        help="Subvectores de la cuantización PQ; debe dividir la dimensión (por defecto 16).")
+    parser.add_argument("--pq-bits", type=int, default=8, help="Bits por subvector PQ (por defecto 8).")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="Vecinos por nodo en HNSW (por defecto 32).")
+    parser.add_argument("--ef-search", type=int, default=None,
+                        help="Amplitud de búsqueda de HNSW; más = mejor recall (por defecto 64).")
+    parser.add_argument("--train-sample", type=int, default=MUESTRA_ENTRENAMIENTO,
+                        help=f"Vectores usados para entrenar índices IVF (por defecto {MUESTRA_ENTRENAMIENTO}).")
+    parser.add_argument("--recall-k", type=int, default=10,
+                        help="k para el recall@k que se informa al construir (por defecto 10).")
+    args = parser.parse_args()
+
+    # --- 1. Configura el modelo de Embeddings ---
+    print("Cargando modelo de embeddings local (esto puede tardar la primera vez)...")
+    try:
+        embeddings_model = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME # Modelo local, rápido y gratis
+        )
+        print("Modelo de embeddings cargado.")
+    except Exception as e:
+        print(f"Error al cargar el modelo de embeddings. Asegúrate de tener 'pip install langchain-huggingface sentence-transformers'. Error: {e}")
+        exit()
+
+    # --- 2. Leer JSONL y PDFs ---
+    manifest = None if args.full else cargar_manifest(INDEX_PATH)
+    # En modo incremental lo que no se pudo leer se daría por eliminado del índice: cualquier error cancela
+    incremental = manifest is not None
+    documentos = {}
+    try:
+        documentos.update(leer_jsonl(FILE_PATH, estricto=incremental))
+        documentos.update(leer_pdfs(DATA_DIR, args.pdf_workers, args.chunk_tokens, args.chunk_overlap,
+                                    estricto=incremental))
+    except Exception as e:
+        print(f"\n❌ No se pudo leer todo el corpus ({e}).")
+        print("Se cancela la actualización incremental para no borrar del índice los documentos que faltan. "
+              "Corrige el archivo o usa --full para reconstruir con lo que se pueda leer.")
+        exit(1)
+
+    # --- 3. Verificar que hay documentos para procesar ---
+    if not documentos:
+        print("\n❌ ERROR: No se encontraron documentos válidos para crear el índice.")
+        print("Asegúrate de tener el archivo JSONL o archivos PDF en la carpeta 'data'.")
+        exit()
+
+    print(f"\n📊 Total de documentos en el corpus: {len(documentos)}")
+
+    info_anterior = manifest.get("index", {"type": "flat"}) if manifest else {}
+    # Sin --index-type se conserva el tipo del índice en disco, también con --full o con un manifiesto viejo
+    tipo = args.index_type or leer_manifest(INDEX_PATH).get("index", {}).get("type", "flat")
+    nuevo_manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "documents": {doc_id: metadata for doc_id, (_, metadata) in documentos.items()},
+    }
+    cache = None if args.no_cache else EmbeddingCache(EMBEDDING_CACHE_DIR)
+
+    def embeber(ids):
+        textos = [documentos[i][0] for i in ids]
+        vectores = calcular_embeddings(textos, embeddings_model, cache=cache, batch_size=args.batch_size,
+                                       workers=args.workers, model_name=EMBEDDING_MODEL_NAME)
+        return textos, vectores
+
+    def construir_completo():
+        ids = list(documentos)
+        textos, vectores = embeber(ids)
+        factory = cadena_factory(tipo, len(ids), vectores.shape[1], args.nlist, args.pq_m, args.pq_bits, args.hnsw_m)
+        search_params = parametros_busqueda(tipo, args.nprobe, args.ef_search)
+        print(f"\n🔄 Creando índice vectorial FAISS '{factory}' desde cero...")
+        index = construir_indice(vectores, factory, search_params, args.train_sample)
+
+        info = {"type": tipo, "factory": factory, "search_params": search_params,
+                "trained_on": len(ids), "added_since_training": 0}
+        if tipo != "flat":
+            recall = medir_recall(index, vectores, k=args.recall_k)
+            bytes_plano = vectores.nbytes
+            bytes_indice = tamano_indice(index)
+            info["recall_at_k"] = {"k": args.recall_k, "recall": round(recall, 4)}
+            print(f"   🎯 Recall@{args.recall_k} frente al índice plano: {recall:.3f}")
+            print(f"   💾 Tamaño: {bytes_indice / 1e6:.1f} MB (plano: {bytes_plano / 1e6:.1f} MB)")
+        metadatas = [documentos[i][1] for i in ids]
+        return crear_vector_store(index, textos, metadatas, ids, embeddings_model), info
+
+    # --- 4. Crea o actualiza la Base de Datos Vectorial ---
+    try:
+        if manifest is not None and tipo != info_anterior.get("type", "flat"):
+            print(f"\n⚠️ El índice en disco es '{info_anterior.get('type', 'flat')}' y se pidió '{tipo}'. Se reconstruirá.")
+            manifest = None
+
+        if manifest is None:
+            vector_store, info = construir_completo()
+        else:
+            indexados = manifest["documents"]
+            nuevos = [i for i in documentos if i not in indexados]
+            eliminados = [i for i in indexados if i not in documentos]
+            # Mismo texto en otra línea del JSONL: solo se actualiza la metadata, sin recalcular embeddings
+            movidos = [i for i in documentos if i in indexados and indexados[i] != documentos[i][1]]
+            print(f"\n🔄 Actualización incremental: {len(nuevos)} nuevos/modificados, "
+                  f"{len(eliminados)} eliminados, {len(movidos)} con metadata nueva, "
+                  f"{len(documentos) - len(nuevos)} sin cambios.")
+
+            info = dict(info_anterior, type=tipo)
+            info["added_since_training"] = info.get("added_since_training", 0) + len(nuevos)
+            if args.nprobe is not None or args.ef_search is not None:
+                info["search_params"] = parametros_busqueda(tipo, args.nprobe, args.ef_search)
+
+            if not nuevos and not eliminados and not movidos and info == info_anterior:
+                print("\n✅ El índice ya está actualizado. No hay nada que hacer.")
+                return
+
+            if tipo != "flat" and eliminados:
+                # HNSW no permite borrar vectores, e IVF conserva sus etiquetas tras `remove_ids` mientras
+                # LangChain renumera las posiciones 0..n-1: solo el plano admite borrados in situ
+                print(f"   ℹ️ El índice {tipo} no admite borrados. Se reconstruirá completo.")
+                vector_store, info = construir_completo()
+            elif tipo.startswith("ivf") and info["added_since_training"] > info.get("trained_on", 0):
+                # Los centroides se entrenaron con un corpus que ya no es representativo
+                print("   ℹ️ El corpus creció más del doble desde el entrenamiento. Se reentrenará el índice.")
+                vector_store, info = construir_completo()
+            else:
+                vector_store = cargar_vector_store(INDEX_PATH, embeddings_model, mmap=False)
+                aplicar_parametros_busqueda(vector_store.index, info.get("search_params"))
+                for doc_id in movidos:
+                    vector_store.docstore.search(doc_id).metadata = documentos[doc_id][1]
+                if eliminados:
+                    vector_store.delete(eliminados)
+                if nuevos:
+                    textos, vectores = embeber(nuevos)
+                    vector_store.add_embeddings(
+                        list(zip(textos, vectores)),
+                        metadatas=[documentos[i][1] for i in nuevos],
+                        ids=nuevos,
+                    )
+
+        nuevo_manifest["index"] = info
+        guardar_indice_atomico(vector_store, nuevo_manifest, INDEX_PATH)
+
+        print(f"\n✅ ¡Éxito! Índice FAISS '{INDEX_PATH.name}' guardado.")
+        print(f"   📁 Ubicación: {INDEX_PATH}")
+        print(f"   📝 Documentos indexados: {len(documentos)}")
+
+    except Exception as e:
+        print(f"\n❌ Ocurrió un error al crear el índice: {e}")
+
+
+if __name__ == "__main__":
+    main()
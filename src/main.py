@@ -1,10 +1,8 @@
 import os
 from dotenv import load_dotenv
 import asyncio
+import time
 from datetime import datetime
-import tempfile
-import whisper
-from pydub import AudioSegment
 import subprocess
 import sys
 '''
@@ -31,12 +29,11 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Otra Bot API (p. ej. la falsa de bench/fakes); por defecto la de Telegram
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
 
 # --- Importaciones de LangChain y Google ---
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.agents import AgentExecutor, create_react_agent
-from langchain_community.vectorstores import FAISS
 from langchain.prompts import PromptTemplate
 from langchain.tools.retriever import create_retriever_tool
 
@@ -45,73 +42,149 @@ from telegram import Update, constants
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
 # --- Importaciones de módulos propios ---
-from database import init_database, save_message, get_chat_history, clear_old_history, delete_user_history
+from database import init_database, close_database, asave_exchange, retention_loop
 from weather_tools import tool_clima_por_lugar
 from places_tools import tool_google_places
 from prompts import AGENT_PROMPT_TEMPLATE
+from vector_index import cargar_indice_lexico, cargar_vector_store, resolver_indice
+from hybrid_retriever import HybridRetriever, crear_reranker
+from answer_cache import SemanticAnswerCache
+from memory import ConversationMemory
+from router import FastPathResponder, IntentRouter
+import voice_pipeline
+import telegram_stream
+from telegram_stream import MensajeProgresivo, transmitir_agente
+import http_client
+from concurrency import CONCURRENT_UPDATES, LimitedChatGoogleGenerativeAI, en_orden_por_chat
+from audio_decode import AudioDemasiadoLargo, SAMPLE_RATE, VOICE_MAX_SECONDS, decodificar_audio, validar_nota
+import transcription
+from startup import Arranque
 
-# --- Inicializa la base de datos al arrancar ---
-init_database()
+# --- Arranque: los componentes pesados cargan en paralelo (o en su primer uso) después de importar main ---
+arranque = Arranque()
+INDEX_PATH = "data/faiss_index_cali"
 
-# --- Cargar modelo Whisper (una sola vez al inicio) ---
-print("Cargando modelo Whisper para transcripción de voz...")
-try:
-    whisper_model = whisper.load_model("tiny")  # tiny es 10x más rápido que base
-    print("Modelo Whisper cargado (tiny - optimizado para velocidad).")
-except Exception as e:
-    print(f"Error al cargar Whisper: {e}")
-    whisper_model = None
 
 # --- 1. Inicializa el Cerebro (LLM) ---
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", 
-    google_api_key=GOOGLE_API_KEY,
-    temperature=0.5  # Aumentado de 0.3 a 0.5 para respuestas más rápidas y directas
-)
+def load_llm():
+    # Con tope global de llamadas en curso (LLM_MAX_CONCURRENCY), compartido por agente, ruta rápida y resúmenes
+    return LimitedChatGoogleGenerativeAI(
+        model="gemini-2.5-flash", 
+        google_api_key=GOOGLE_API_KEY,
+        temperature=0.5  # Aumentado de 0.3 a 0.5 para respuestas más rápidas y directas
+    )
+
 
 # --- 2. Define las Herramientas (Tools) ---
 
 # --- Herramienta 1: RAG (Conocimiento Estático de VisitCali) ---
-print("Cargando índice FAISS y modelo de embeddings local...")
-try:
-    embeddings_model = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2"
-    )
-    vector_store = FAISS.load_local("data/faiss_index_cali", embeddings_model, allow_dangerous_deserialization=True)
-    retriever = vector_store.as_retriever(search_kwargs={"k": 2})  # Reducido de 3 a 2 documentos
-    print("Índice FAISS cargado.")
-except Exception as e:
-    print(f"Error al cargar el índice FAISS: {e}")
-    print("Asegúrate de haber corrido 'python ingest.py' primero.")
-    exit()
-
-
-# Crea una "herramienta" automática desde el retriever
-tool_visitcali_rag = create_retriever_tool(
-    retriever,
-    "buscar_info_visitcali",
-    "Busca información sobre atracciones turísticas, cultura, historia y recomendaciones de Cali. Úsalo para preguntas sobre lugares como Cristo Rey, Gato del Río, o qué hacer."
-)
+def load_embeddings():
+    # Importar langchain_huggingface ya trae torch: también se hace fuera del camino crítico
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+
+
+def load_retriever():
+    try:
+        # Carga el índice que haya en disco (plano, IVF o HNSW) con sus parámetros de búsqueda
+        vector_store = cargar_vector_store(arranque.obtener("ruta_indice"), arranque.obtener("embeddings"))
+        # Búsqueda híbrida: FAISS + BM25 fusionados con RRF, para acertar nombres exactos a la primera
+        return HybridRetriever(
+            vector_store=vector_store,
+            bm25=arranque.obtener("bm25"),
+            reranker=arranque.obtener("reranker"),
+            k=2,  # Reducido de 3 a 2 documentos
+        )
+    except Exception as e:
+        print(f"Error al cargar el índice FAISS: {e}")
+        print("Asegúrate de haber corrido 'python ingest.py' primero.")
+        raise
 
-# --- Lista de todas nuestras herramientas ---
-tools = [tool_visitcali_rag, tool_google_places, tool_clima_por_lugar]
 
 # --- 3. Define el Prompt (Instrucciones) del Agente ---
 agent_prompt = PromptTemplate.from_template(AGENT_PROMPT_TEMPLATE)
 
+
 # --- 4. Crea el Agente y el Ejecutor ---
-agent = create_react_agent(llm, tools, agent_prompt)
-agent_executor = AgentExecutor(
-    agent=agent, 
-    tools=tools, 
-    verbose=True,  # ¡MUY IMPORTANTE para debugging!
-    handle_parsing_errors=True,
-    max_iterations=8,  # Reducido de 10 a 8 para evitar búsquedas excesivas
-    max_execution_time=45  # Reducido de 120 a 45 segundos
-)
+def load_agent():
+    # Crea una "herramienta" automática desde el retriever
+    tool_visitcali_rag = create_retriever_tool(
+        arranque.obtener("retriever"),
+        "buscar_info_visitcali",
+        "Busca información sobre atracciones turísticas, cultura, historia y recomendaciones de Cali. Úsalo para preguntas sobre lugares como Cristo Rey, Gato del Río, o qué hacer."
+    )
+    
+    # --- Lista de todas nuestras herramientas ---
+    tools = [tool_visitcali_rag, tool_google_places, tool_clima_por_lugar]
+    
+    agent = create_react_agent(arranque.obtener("llm"), tools, agent_prompt)
+    return AgentExecutor(
+        agent=agent, 
+        tools=tools, 
+        verbose=True,  # ¡MUY IMPORTANTE para debugging!
+        handle_parsing_errors=True,
+        return_intermediate_steps=True,  # La caché de respuestas necesita saber qué herramientas se usaron
+        max_iterations=8,  # Reducido de 10 a 8 para evitar búsquedas excesivas
+        max_execution_time=45  # Reducido de 120 a 45 segundos
+    )
+
+
+# --- Memoria: historial acotado por tokens con resumen incremental en segundo plano ---
+def load_memory():
+    arranque.obtener("base_datos")
+    return ConversationMemory(arranque.obtener("llm"))
+
+
+arranque.registrar("base_datos", init_database)
+arranque.registrar("llm", load_llm)
+arranque.registrar("embeddings", load_embeddings)
+# La versión vigente del índice se resuelve una vez: FAISS y BM25 siempre de la misma
+arranque.registrar("ruta_indice", lambda: resolver_indice(INDEX_PATH))
+arranque.registrar("bm25", lambda: cargar_indice_lexico(arranque.obtener("ruta_indice")))
+arranque.registrar("reranker", crear_reranker)
+arranque.registrar("retriever", load_retriever)
+arranque.registrar("agente", load_agent)
+arranque.registrar("memoria", load_memory)
+# Caché semántica de respuestas (reutiliza el mismo modelo de embeddings)
+arranque.registrar("cache_respuestas", lambda: SemanticAnswerCache(arranque.obtener("embeddings")))
+# --- Ruta rápida: intenciones claras van directo a su herramienta, sin el ciclo ReAct ---
+arranque.registrar("router", lambda: IntentRouter(arranque.obtener("embeddings")))
+arranque.registrar("ruta_rapida", lambda: FastPathResponder(arranque.obtener("llm"), arranque.obtener("retriever")))
+
+# Lo que necesita responder un mensaje (texto o voz); /start no necesita nada y /olvidar solo la memoria
+COMPONENTES_MENSAJE = ("memoria", "cache_respuestas", "router", "ruta_rapida", "agente")
 
 # --- 5. Define los Handlers (Manejadores) de Telegram ---
 
+def herramientas_usadas(resultado: dict) -> list:
+    """Nombres de las herramientas que llamó el agente (según sus intermediate_steps)."""
+    return [accion.tool for accion, _ in resultado.get("intermediate_steps", [])]
+
+
+async def try_fast_path(user_text: str, chat_history_str: str, question_vector):
+    """Responde por la ruta rápida si la intención es clara; None para seguir con el agente."""
+    router, fast_path, answer_cache = (arranque.valor(nombre) for nombre in ("router", "ruta_rapida", "cache_respuestas"))
+    intent, reason = await asyncio.to_thread(router.clasificar, user_text, question_vector)
+    print(f"[ROUTER] {intent or 'agente'} ({reason}): {user_text!r}")
+    if not intent:
+        return None
+    
+    started = time.monotonic()
+    try:
+        response = await fast_path.responder(intent, user_text, chat_history_str)
+    except Exception as e:
+        print(f"[ROUTER] La ruta '{intent}' falló, se usa el agente: {e}")
+        return None
+    if not response:
+        return None
+    
+    elapsed = time.monotonic() - started
+    router.registrar(intent, elapsed)
+    answer_cache.guardar(user_text, response, elapsed, question_vector, historial=chat_history_str,
+                         herramientas=fast_path.herramientas(intent))
+    return response
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Manejador para el comando /start"""
     user_name = update.effective_user.first_name
@@ -127,12 +200,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "¡Pregúntame lo que quieras!"
     )
 
+@en_orden_por_chat
+@arranque.requiere("memoria")
 async def forget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Manejador para borrar el historial del usuario"""
     user_id = update.effective_user.id
+    memory = arranque.valor("memoria")
     
-    # Borrar todo el historial del usuario usando la función del módulo
-    deleted_count = delete_user_history(user_id)
+    # Borrar todo el historial y el resumen del usuario
+    deleted_count = await memory.aolvidar(user_id)
     
     if deleted_count > 0:
         await update.message.reply_text(
@@ -144,75 +220,69 @@ async def forget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "No hay historial que borrar. ¡Tu pizarra ya está limpia! ✨"
         )
 
+@en_orden_por_chat
+@arranque.requiere(*COMPONENTES_MENSAJE)
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Manejador para todos los mensajes de texto."""
     user_text = update.message.text
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
+    memory, answer_cache, router, agent_executor = (
+        arranque.valor(nombre) for nombre in ("memoria", "cache_respuestas", "router", "agente")
+    )
     
+    # Toda respuesta sale por este mensaje: se va editando a medida que llega el texto y mide el TTFT
+    reply = MensajeProgresivo(update.message)
     await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
     
-    # Obtener historial del usuario (reducido a 5 mensajes para respuestas más rápidas)
-    chat_history_str = get_chat_history(user_id, limit=5)
+    # Historial acotado por tokens: resumen + mensajes recientes que quepan
+    chat_history_str = await memory.ahistorial(user_id)
+    
+    # Caché semántica: una pregunta casi idéntica a otra reciente no pasa por el agente
+    cached_response, question_vector = await asyncio.to_thread(answer_cache.buscar, user_text)
+    if cached_response:
+        await asave_exchange(user_id, user_text, cached_response, keep_last=50)
+        memory.registrar(user_id)
+        print(f"[CACHE] Métricas: {answer_cache.metricas()}")
+        await reply.finalizar(cached_response)
+        return
+    
+    # Ruta rápida: saludo, clima, lugares o info turística con una sola llamada al LLM
+    fast_response = await try_fast_path(user_text, chat_history_str, question_vector)
+    if fast_response:
+        await asave_exchange(user_id, user_text, fast_response, keep_last=50)
+        memory.registrar(user_id)
+        await reply.finalizar(fast_response)
+        return
     
     # Reintentos en caso de sobrecarga del modelo
     max_retries = 3
     retry_count = 0
     
-    # Variable para controlar el mensaje de "estoy trabajando"
-    thinking_message = None
-    thinking_task = None
-    
-    async def send_thinking_message():
-        """Envía un mensaje después de 5 segundos si el agente aún está procesando"""
-        await asyncio.sleep(5)  # Reducido de 8 a 5 segundos
-        nonlocal thinking_message
-        thinking_message = await update.message.reply_text(
-            "🤔 Estoy buscando la mejor información para ti, dame un momento..."
-        )
+    # Si a los 5 segundos no hay texto de la respuesta, se avisa; el aviso se edita luego con la respuesta
+    reply.avisar_tras(5, "🤔 Estoy buscando la mejor información para ti, dame un momento...")
     
+    agent_started = time.monotonic()
     while retry_count < max_retries:
         try:
-            # Iniciar tarea para enviar mensaje de "estoy pensando"
-            thinking_task = asyncio.create_task(send_thinking_message())
-            
-            # --- Corregido: Usa asyncio.to_thread para correr código síncrono ---
-            response = await asyncio.to_thread(
-                agent_executor.invoke, # La función síncrona (bloqueante)
-                {"input": user_text, "chat_history": chat_history_str} # Los argumentos
+            # Los tokens de la "Final Answer" se van mostrando mientras Gemini los genera
+            response = await transmitir_agente(
+                agent_executor, {"input": user_text, "chat_history": chat_history_str}, reply
             )
             
-            # Cancelar el mensaje de "estoy pensando" si aún no se envió
-            if not thinking_task.done():
-                thinking_task.cancel()
-            
-            # Eliminar el mensaje de "estoy pensando" si se envió
-            if thinking_message:
-                try:
-                    await thinking_message.delete()
-                except:
-                    pass  # Ignorar errores al eliminar
-            
             bot_response = response['output']
+            router.registrar("agente", time.monotonic() - agent_started)
+            answer_cache.guardar(user_text, bot_response, time.monotonic() - agent_started, question_vector,
+                                 historial=chat_history_str, herramientas=herramientas_usadas(response))
             
-            # Guardar el mensaje del usuario y la respuesta del bot
-            save_message(user_id, user_text, "user")
-            save_message(user_id, bot_response, "assistant")
-            
-            # Limpiar historial antiguo (mantener solo últimos 50 mensajes)
-            clear_old_history(user_id, keep_last=50)
+            # Guardar pregunta y respuesta y limpiar historial antiguo (últimos 50) en una sola transacción
+            await asave_exchange(user_id, user_text, bot_response, keep_last=50)
+            memory.registrar(user_id)
             
             break  # Éxito, salimos del loop
             
         except Exception as e:
-            # Cancelar mensaje de "estoy pensando" en caso de error
-            if thinking_task and not thinking_task.done():
-                thinking_task.cancel()
-            if thinking_message:
-                try:
-                    await thinking_message.delete()
-                except:
-                    pass
+            reply.reiniciar()
             
             error_msg = str(e)
             print(f"Error procesando mensaje (intento {retry_count + 1}/{max_retries}): {error_msg}")
@@ -230,169 +300,235 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             bot_response = "Lo siento, el servidor está muy ocupado en este momento. 😥 Por favor, intenta de nuevo en unos segundos."
             break
     
-    # Limpiar markdown que Telegram no interpreta bien
-    # Reemplazar **texto** por texto plano
-    bot_response_cleaned = bot_response.replace('**', '')
-    
-    await update.message.reply_text(bot_response_cleaned)
+    # Versión definitiva (sin el markdown que Telegram no interpreta) en el mismo mensaje
+    await reply.finalizar(bot_response)
 
 
 # --- 5.2 Handler de Mensajes de Voz ---
+MENSAJE_OCUPADO = (
+    "🚦 Estoy procesando muchas notas de voz en este momento. "
+    "Por favor, intenta de nuevo en unos segundos o escríbeme tu pregunta."
+)
+
+
+def transcribir_audio(datos: bytes) -> str:
+    """Decodifica la nota en memoria y la transcribe con Whisper. Es bloqueante: corre en el pool de transcripción."""
+    audio = decodificar_audio(datos)
+    print(f"Transcribiendo {len(audio) / SAMPLE_RATE:.1f}s de audio con Whisper...")
+    # El servicio carga el modelo en la primera nota y agrupa las que llegan a la vez
+    return transcription.servicio.transcribir(audio)
+
+
+@en_orden_por_chat
+@arranque.requiere(*COMPONENTES_MENSAJE)
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Maneja mensajes de voz del usuario, transcribe con Whisper y procesa con el agente."""
-    if not whisper_model:
+    memory, answer_cache, router, agent_executor = (
+        arranque.valor(nombre) for nombre in ("memoria", "cache_respuestas", "router", "agente")
+    )
+    if not transcription.servicio.disponible():
         await update.message.reply_text("⚠️ La función de voz no está disponible en este momento.")
         return
     
+    voice_started = time.monotonic()
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
     
-    # Descargar el archivo de voz
+    # Backpressure: si la etapa de transcripción está llena, avisamos en vez de encolar sin límite
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
-        
-        voice_file = await update.message.voice.get_file()
-        
-        # Crear archivo temporal para OGG
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_audio:
-            temp_path_ogg = temp_audio.name
-        
-        # Crear archivo temporal para WAV (formato que Whisper entiende mejor)
-        temp_path_wav = temp_path_ogg.replace('.ogg', '.wav')
-        
-        # Descargar el audio
-        await voice_file.download_to_drive(temp_path_ogg)
-        print(f"Audio descargado en: {temp_path_ogg}")
-        
-        # Convertir OGG a WAV usando pydub (no requiere ffmpeg en PATH)
-        try:
-            audio = AudioSegment.from_file(temp_path_ogg, format="ogg")
-            audio.export(temp_path_wav, format="wav")
-            print(f"Audio convertido a WAV: {temp_path_wav}")
-        except Exception as conv_error:
-            print(f"Error convirtiendo audio: {conv_error}")
-            # Intentar directamente con el OGG
-            temp_path_wav = temp_path_ogg
-        
-        # Transcribir con Whisper
-        print("Transcribiendo audio con Whisper...")
-        result = whisper_model.transcribe(temp_path_wav, language="es", fp16=False)
-        user_text = result["text"].strip()
-        print(f"Texto transcrito: {user_text}")
-        
-        # Eliminar archivos temporales
-        try:
-            os.unlink(temp_path_ogg)
-            if temp_path_wav != temp_path_ogg:
-                os.unlink(temp_path_wav)
-        except:
-            pass
-        
-        if not user_text:
-            await update.message.reply_text("⚠️ No pude entender el audio. Por favor, intenta de nuevo.")
-            return
-        
-        # Mostrar el texto transcrito al usuario
-        await update.message.reply_text(f"🎤 Escuché: *{user_text}*", parse_mode='Markdown')
-        
-    except Exception as e:
-        print(f"Error procesando voz: {e}")
-        await update.message.reply_text("⚠️ Hubo un error procesando tu mensaje de voz. Por favor, intenta de nuevo.")
+        reserva = voice_pipeline.transcripcion.reservar()
+    except voice_pipeline.ColaLlena:
+        print(f"[VOZ] Transcripción llena, nota rechazada: {voice_pipeline.metricas()}")
+        await update.message.reply_text(MENSAJE_OCUPADO)
         return
     
-    # --- Procesar el texto transcrito con el agente (reutilizar lógica de handle_message) ---
-    max_retries = 3
-    retry_count = 0
-    bot_response = "Lo siento, hubo un error procesando tu solicitud."
-    
-    while retry_count < max_retries:
-        thinking_message = None
-        thinking_task = None
-        
+    # Descargar y transcribir el archivo de voz
+    with reserva:
         try:
             await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
             
-            # Mostrar mensaje de "pensando" si tarda más de 5 segundos
-            async def thinking_message_func():
-                await asyncio.sleep(5)  # Reducido de 8 a 5 segundos
-                return await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="🤔 Estoy buscando la mejor información para ti..."
+            voice = update.message.voice
+            # Notas demasiado largas se rechazan antes de descargarlas
+            try:
+                validar_nota(voice.duration, voice.file_size)
+            except AudioDemasiadoLargo as e:
+                print(f"[VOZ] Nota rechazada por tamaño: {e}")
+                await update.message.reply_text(
+                    f"⚠️ Tu nota de voz es muy larga. Envíame una de máximo {VOICE_MAX_SECONDS} segundos, por favor."
                 )
+                return
             
-            thinking_task = asyncio.create_task(thinking_message_func())
-            
-            # Obtener historial
-            history = get_chat_history(user_id)
-            
-            # Invocar agente
-            result = agent_executor.invoke(
-                {
-                    "input": user_text,
-                    "chat_history": history
-                }
-            )
-            bot_response = result.get("output", "Lo siento, no pude procesar tu solicitud.")
+            # Descargar el audio a memoria (sin archivos temporales)
+            voice_file = await voice.get_file()
+            audio_bytes = await voice_file.download_as_bytearray()
+            print(f"Audio descargado: {len(audio_bytes)} bytes, {voice.duration}s")
             
-            # Guardar en historial
-            save_message(user_id, "user", user_text)
-            save_message(user_id, "assistant", bot_response)
+            # Whisper corre en su propio pool, el event loop sigue atendiendo a los demás usuarios
+            user_text = await voice_pipeline.transcripcion.ejecutar(transcribir_audio, audio_bytes)
+            print(f"Texto transcrito: {user_text}")
             
-            # Cancelar mensaje de "pensando"
-            if thinking_task and not thinking_task.done():
-                thinking_task.cancel()
-            if thinking_message:
-                try:
-                    await thinking_message.delete()
-                except:
-                    pass
+            if not user_text:
+                await update.message.reply_text("⚠️ No pude entender el audio. Por favor, intenta de nuevo.")
+                return
             
-            break  # Éxito, salir del bucle
+            # Mostrar el texto transcrito al usuario
+            await update.message.reply_text(f"🎤 Escuché: *{user_text}*", parse_mode='Markdown')
             
         except Exception as e:
-            # Cancelar mensaje de "pensando"
-            if thinking_task and not thinking_task.done():
-                thinking_task.cancel()
-            if thinking_message:
-                try:
-                    await thinking_message.delete()
-                except:
-                    pass
-            
-            error_msg = str(e)
-            print(f"Error procesando mensaje de voz (intento {retry_count + 1}/{max_retries}): {error_msg}")
-            
-            # Si es error de sobrecarga (503) y aún hay reintentos, esperamos y reintentamos
-            if "503" in error_msg or "overloaded" in error_msg.lower():
-                retry_count += 1
-                if retry_count < max_retries:
-                    print(f"Reintentando en 2 segundos...")
-                    await asyncio.sleep(2)
-                    await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
-                    continue
-            
-            # Para cualquier otro error o si se agotaron los reintentos
-            bot_response = "Lo siento, el servidor está muy ocupado en este momento. 😥 Por favor, intenta de nuevo en unos segundos."
-            break
+            print(f"Error procesando voz: {e}")
+            await update.message.reply_text("⚠️ Hubo un error procesando tu mensaje de voz. Por favor, intenta de nuevo.")
+            return
+    
+    # --- Caché semántica (igual que en handle_message) ---
+    # El TTFT de la respuesta cuenta desde que llegó la nota, transcripción incluida
+    reply = MensajeProgresivo(update.message, inicio=voice_started)
+    cached_response, question_vector = await asyncio.to_thread(answer_cache.buscar, user_text)
+    if cached_response:
+        await asave_exchange(user_id, user_text, cached_response, keep_last=50)
+        memory.registrar(user_id)
+        print(f"[CACHE] Métricas: {answer_cache.metricas()}")
+        await reply.finalizar(cached_response)
+        return
+    
+    try:
+        reserva = voice_pipeline.agente.reservar()
+    except voice_pipeline.ColaLlena:
+        print(f"[VOZ] Agente lleno, nota rechazada: {voice_pipeline.metricas()}")
+        await update.message.reply_text(MENSAJE_OCUPADO)
+        return
     
-    # Limpiar markdown
-    bot_response_cleaned = bot_response.replace('**', '')
+    # --- Procesar el texto transcrito con el agente (reutilizar lógica de handle_message) ---
+    max_retries = 3
+    retry_count = 0
+    agent_started = time.monotonic()
+    bot_response = "Lo siento, hubo un error procesando tu solicitud."
     
-    await update.message.reply_text(bot_response_cleaned)
+    with reserva:
+        history = await memory.ahistorial(user_id)
+        
+        # Ruta rápida (con el cupo de la etapa "agente", igual que el agente)
+        fast_response = await voice_pipeline.agente.esperar(try_fast_path(user_text, history, question_vector))
+        if fast_response:
+            bot_response = fast_response
+            await asave_exchange(user_id, user_text, bot_response, keep_last=50)
+            memory.registrar(user_id)
+        else:
+            # Aviso si tarda más de 5 segundos; el mismo mensaje se edita luego con la respuesta
+            reply.avisar_tras(5, "🤔 Estoy buscando la mejor información para ti...")
+        
+        while not fast_response and retry_count < max_retries:
+            try:
+                await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
+                
+                # Agente async con el cupo de la etapa "agente", mostrando la respuesta mientras se genera
+                result = await voice_pipeline.agente.esperar(transmitir_agente(
+                    agent_executor,
+                    {
+                        "input": user_text,
+                        "chat_history": history
+                    },
+                    reply,
+                ))
+                bot_response = result.get("output", "Lo siento, no pude procesar tu solicitud.")
+                router.registrar("agente", time.monotonic() - agent_started)
+                answer_cache.guardar(user_text, bot_response, time.monotonic() - agent_started, question_vector,
+                                     historial=history, herramientas=herramientas_usadas(result))
+                
+                # Guardar en historial
+                await asave_exchange(user_id, user_text, bot_response, keep_last=50)
+                memory.registrar(user_id)
+                
+                break  # Éxito, salir del bucle
+                
+            except Exception as e:
+                reply.reiniciar()
+                
+                error_msg = str(e)
+                print(f"Error procesando mensaje de voz (intento {retry_count + 1}/{max_retries}): {error_msg}")
+                
+                # Si es error de sobrecarga (503) y aún hay reintentos, esperamos y reintentamos
+                if "503" in error_msg or "overloaded" in error_msg.lower():
+                    retry_count += 1
+                    if retry_count < max_retries:
+                        print(f"Reintentando en 2 segundos...")
+                        await asyncio.sleep(2)
+                        await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
+                        continue
+                
+                # Para cualquier otro error o si se agotaron los reintentos
+                bot_response = "Lo siento, el servidor está muy ocupado en este momento. 😥 Por favor, intenta de nuevo en unos segundos."
+                break
+    
+    print(f"[VOZ] Métricas: {voice_pipeline.metricas()} | Whisper: {transcription.servicio.metricas()}")
+    
+    # Versión definitiva (sin markdown) en el mismo mensaje
+    await reply.finalizar(bot_response)
 
 
 # --- 6. Inicia el Bot ---
-def main() -> None:
-    """Función principal para correr el bot."""
+retention_task = None
+
+
+async def start_retention() -> None:
+    await arranque.esperar("base_datos")
+    await retention_loop()
+
+
+async def on_startup(application: Application, retention: bool = True) -> None:
+    """Lanza la carga de componentes en segundo plano y la retención periódica del historial."""
+    global retention_task
+    # No se espera a los modelos: el bot empieza a recibir updates de inmediato
+    arranque.iniciar()
+    if retention:
+        retention_task = asyncio.create_task(start_retention())
+
+
+async def on_shutdown(application: Application) -> None:
+    """Detiene la retención y cierra la base de datos y el cliente HTTP cuando el bot se detiene."""
+    if retention_task:
+        retention_task.cancel()
+    print(f"[STREAM] Métricas: {telegram_stream.metricas()}")
+    await http_client.cerrar_async()
+    close_database()
+
+
+def build_application(with_updater: bool = True) -> Application:
+    """Application con los handlers del bot; sin Updater para los workers del modo webhook."""
     if not TELEGRAM_TOKEN:
         raise ValueError("TELEGRAM_TOKEN no encontrado. Revisa tu .env")
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Updates de chats distintos en paralelo; dentro de un chat, en orden (en_orden_por_chat)
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("olvidar", forget))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))  # Handler de mensajes de voz
+    return application
+
+
+def main() -> None:
+    """Función principal para correr el bot."""
+    if BOT_MODE == "webhook":
+        # Ingress HTTP + WEBHOOK_WORKERS procesos worker (2 por defecto), repartidos por chat_id
+        import webhook
+        if not TELEGRAM_TOKEN:
+            raise ValueError("TELEGRAM_TOKEN no encontrado. Revisa tu .env")
+        webhook.run(TELEGRAM_TOKEN, f"{TELEGRAM_API_URL}/bot" if TELEGRAM_API_URL else None)
+        return
+
+    application = build_application()
 
     print("\nBot de Telegram iniciado. Usando Polling...")
     print("Habla con tu bot en Telegram.")
@@ -0,0 +1,157 @@
+"""
+Memoria de conversación con presupuesto de tokens.
+
+`{chat_history}` se reenvía a Gemini en cada paso del ReAct, así que el
+historial se arma hasta HISTORY_TOKEN_BUDGET tokens: el resumen acumulado del
+usuario más los mensajes recientes que quepan (los largos, recortados) y que el
+resumen todavía no cubre. El resumen se actualiza en segundo plano cada
+SUMMARY_EVERY mensajes nuevos, nunca en el camino de la respuesta.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from cache_utils import TTLCache
+from database import (HISTORY_CACHE_USERS, adelete_user_history, count_messages_after, get_messages_after,
+                      get_recent_messages, get_summary, save_summary)
+from prompts import SUMMARY_PROMPT_TEMPLATE
+
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "150"))  # Recorte por mensaje
+SUMMARY_EVERY = int(os.getenv("SUMMARY_EVERY", "10"))  # Mensajes nuevos que disparan una actualización
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))  # Los más recientes van literales, no al resumen
+SUMMARY_MAX_WORDS = 120
+RESUMENES_TTL = 24 * 3600
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación de ~4 caracteres por token, suficiente para repartir el presupuesto."""
+    return math.ceil(len(texto) / 4)
+
+
+def recortar(texto: str, max_tokens: int) -> str:
+    max_caracteres = max_tokens * 4
+    return texto if len(texto) <= max_caracteres else texto[:max_caracteres].rstrip() + "…"
+
+
+def _linea(message: str, role: str, max_tokens: int) -> str:
+    texto = recortar(message, max_tokens)
+    return f"Usuario: {texto}" if role == "user" else f"CAL-E: {texto}"
+
+
+class ConversationMemory:
+    """Historial con presupuesto de tokens y resumen incremental por usuario."""
+
+    def __init__(self, llm, presupuesto: int = HISTORY_TOKEN_BUDGET,
+                 max_tokens_mensaje: int = HISTORY_MESSAGE_MAX_TOKENS,
+                 resumir_cada: int = SUMMARY_EVERY, recientes_literales: int = SUMMARY_KEEP_RECENT):
+        self.llm = llm
+        self.presupuesto = presupuesto
+        self.max_tokens_mensaje = max_tokens_mensaje
+        self.resumir_cada = resumir_cada
+        self.recientes_literales = recientes_literales
+        # user_id -> (resumen o "", mensajes posteriores a los que cubre el resumen)
+        self._resumenes = TTLCache(RESUMENES_TTL, HISTORY_CACHE_USERS)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resumen")
+        self._lock = threading.Lock()
+        self._nuevos: Dict[int, int] = {}  # Mensajes desde el último resumen
+        self._resumiendo = set()
+        self._generaciones: Dict[int, int] = {}  # Cambia con /olvidar: descarta resúmenes en curso
+
+    def _resumen(self, user_id: int) -> Tuple[str, int]:
+        """(resumen, cuántos mensajes posteriores a él hay)."""
+        entrada = self._resumenes.get(user_id)
+        if entrada is None:
+            resumen, ultimo_id = get_summary(user_id)
+            entrada = (resumen, count_messages_after(user_id, ultimo_id))
+            self._resumenes.set(user_id, entrada)
+        return entrada
+
+    def historial(self, user_id: int) -> str:
+        """Resumen + mensajes más recientes que quepan en el presupuesto, en orden cronológico."""
+        resumen, sin_resumir = self._resumen(user_id)
+        cabecera = f"Resumen de la conversación anterior: {resumen}" if resumen else ""
+        disponible = self.presupuesto - estimar_tokens(cabecera)
+
+        # Solo los mensajes que el resumen no cubre, para no repetirlos en el prompt
+        recientes = get_recent_messages(user_id)[-sin_resumir:] if sin_resumir else []
+        lineas = []
+        for message, role in reversed(recientes):
+            linea = _linea(message, role, self.max_tokens_mensaje)
+            costo = estimar_tokens(linea)
+            if costo > disponible:
+                break
+            disponible -= costo
+            lineas.append(linea)
+        lineas.reverse()
+
+        if cabecera:
+            lineas.insert(0, cabecera)
+        return "\n".join(lineas)
+
+    async def ahistorial(self, user_id: int) -> str:
+        # En un fallo de caché se consulta SQLite: fuera del event loop
+        return await asyncio.to_thread(self.historial, user_id)
+
+    def registrar(self, user_id: int, mensajes: int = 2):
+        """Cuenta los mensajes guardados y, cada `resumir_cada`, agenda la actualización del resumen."""
+        with self._lock:
+            entrada = self._resumenes.get(user_id)
+            if entrada is not None:
+                self._resumenes.set(user_id, (entrada[0], entrada[1] + mensajes))
+            nuevos = self._nuevos.get(user_id, 0) + mensajes
+            if nuevos < self.resumir_cada or user_id in self._resumiendo:
+                self._nuevos[user_id] = nuevos
+                return
+            self._nuevos.pop(user_id, None)
+            self._resumiendo.add(user_id)
+            generacion = self._generaciones.get(user_id, 0)
+        self._executor.submit(self._actualizar_resumen, user_id, generacion)
+
+    async def aolvidar(self, user_id: int) -> int:
+        """Borra historial y resumen del usuario (/olvidar). Retorna cuántos mensajes se borraron."""
+        with self._lock:
+            # Antes del borrado: un resumen en curso ya no se guardará
+            self._generaciones[user_id] = self._generaciones.get(user_id, 0) + 1
+            self._nuevos.pop(user_id, None)
+        borrados = await adelete_user_history(user_id)
+        self._resumenes.delete(user_id)  # Después: descarta lo que se haya leído mientras tanto
+        return borrados
+
+    def _actualizar_resumen(self, user_id: int, generacion: int):
+        try:
+            resumen, ultimo_id = get_summary(user_id)
+            mensajes = get_messages_after(user_id, ultimo_id)
+            mensajes = mensajes[:max(0, len(mensajes) - self.recientes_literales)]
+            if not mensajes:
+                return
+
+            inicio = time.monotonic()
+            respuesta = self.llm.invoke(SUMMARY_PROMPT_TEMPLATE.format(
+                resumen=resumen or "(todavía no hay resumen)",
+                mensajes="\n".join(_linea(message, role, 2 * self.max_tokens_mensaje) for _, message, role in mensajes),
+                max_palabras=SUMMARY_MAX_WORDS,
+            ))
+            nuevo = respuesta.content.strip()
+            if not nuevo:
+                return
+
+            with self._lock:
+                if self._generaciones.get(user_id, 0) != generacion:
+                    return  # El usuario usó /olvidar mientras se resumía
+                save_summary(user_id, nuevo, mensajes[-1][0])
+                entrada = self._resumenes.get(user_id)
+                if entrada is not None:
+                    self._resumenes.set(user_id, (nuevo, max(0, entrada[1] - len(mensajes))))
+            print(f"[MEMORIA] Resumen del usuario {user_id} actualizado con {len(mensajes)} mensajes "
+                  f"en {time.monotonic() - inicio:.1f}s ({estimar_tokens(nuevo)} tokens)")
+        except Exception as e:
+            print(f"[ERROR] No se pudo actualizar el resumen del usuario {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._resumiendo.discard(user_id)
@@ -0,0 +1,158 @@
+"""
+Extracción de PDFs en paralelo y troceado por tokens para la ingesta.
+
+Cada PDF se procesa en un proceso del pool y sus páginas se parten en trozos
+solapados que caben en la ventana del modelo de embeddings (all-MiniLM-L6-v2
+trunca a 256 tokens), conservando archivo, página y número de trozo.
+"""
+import math
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_TOKENS_CHUNK = 200  # Deja margen para el encabezado "Fuente PDF: ..." dentro de los 256 tokens
+SOLAPAMIENTO_TOKENS = 40
+
+_tokenizer = None
+
+
+def _obtener_tokenizer():
+    """Carga (una vez por proceso) el tokenizer del modelo; None si no está disponible."""
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+        except Exception as e:
+            print(f"⚠️ Tokenizer no disponible ({e}). Se estimarán los tokens por longitud de palabra.")
+            _tokenizer = False
+    return _tokenizer or None
+
+
+def _palabras_con_tokens(texto: str) -> List[Tuple[int, int, int]]:
+    """Retorna (inicio, fin, n_tokens) por cada palabra del texto."""
+    palabras = [(m.start(), m.end()) for m in re.finditer(r"\S+", texto)]
+    if not palabras:
+        return []
+
+    tokenizer = _obtener_tokenizer()
+    if tokenizer is None:
+        # Aproximación conservadora: ~1 token WordPiece por cada 4 caracteres
+        return [(ini, fin, max(1, math.ceil((fin - ini) / 4))) for ini, fin in palabras]
+
+    offsets = tokenizer(texto, add_special_tokens=False, return_offsets_mapping=True,
+                        verbose=False)["offset_mapping"]
+    costes = [0] * len(palabras)
+    j = 0
+    for ini_token, _ in offsets:
+        while j < len(palabras) - 1 and ini_token >= palabras[j][1]:
+            j += 1
+        costes[j] += 1
+    return [(ini, fin, max(1, coste)) for (ini, fin), coste in zip(palabras, costes)]
+
+
+def trocear_texto(texto: str, max_tokens: int = MAX_TOKENS_CHUNK,
+                  solapamiento: int = SOLAPAMIENTO_TOKENS) -> List[str]:
+    """Parte `texto` en trozos de como mucho `max_tokens` tokens, solapados `solapamiento` tokens."""
+    palabras = _palabras_con_tokens(texto)
+    trozos = []
+    i = 0
+    while i < len(palabras):
+        total, j = 0, i
+        while j < len(palabras) and (total + palabras[j][2] <= max_tokens or j == i):
+            total += palabras[j][2]
+            j += 1
+        trozos.append(texto[palabras[i][0]:palabras[j - 1][1]])
+        if j >= len(palabras):
+            break
+
+        # Retrocede desde el final del trozo para que el siguiente empiece solapado
+        k, acumulado = j, 0
+        while k - 1 > i and acumulado + palabras[k - 1][2] <= solapamiento:
+            k -= 1
+            acumulado += palabras[k][2]
+        i = k
+    return trozos
+
+
+def procesar_pdf(pdf_path: str, max_tokens: int = MAX_TOKENS_CHUNK,
+                 solapamiento: int = SOLAPAMIENTO_TOKENS) -> Tuple[str, List[Tuple[str, dict]], Optional[str]]:
+    """
+    Extrae y trocea un PDF. Retorna (nombre, [(texto, metadata)], error).
+    Se ejecuta dentro de los procesos del pool, por eso no lanza excepciones.
+    """
+    nombre = Path(pdf_path).name
+    trozos = []
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(pdf_path)
+        for num_pagina, pagina in enumerate(reader.pages, start=1):
+            texto = (pagina.extract_text() or "").strip()
+            if not texto:
+                continue
+            for num_trozo, trozo in enumerate(trocear_texto(texto, max_tokens, solapamiento), start=1):
+                text_with_source = f"Fuente PDF: {nombre} (pág. {num_pagina})\n{trozo}"
+                metadata = {"source": nombre, "page": num_pagina, "chunk": num_trozo}
+                trozos.append((text_with_source, metadata))
+        return nombre, trozos, None
+    except Exception as e:
+        return nombre, trozos, str(e)
+
+
+def iterar_trozos_pdf(data_dir: Path, workers: Optional[int] = None, max_tokens: int = MAX_TOKENS_CHUNK,
+                      solapamiento: int = SOLAPAMIENTO_TOKENS, estricto: bool = False) -> Iterator[Tuple[str, dict]]:
+    """
+    Generador de (texto, metadata) para todos los PDFs de `data_dir`.
+
+    Los archivos se procesan en paralelo (`workers` procesos; por defecto uno por
+    núcleo) y sus trozos se entregan a medida que cada archivo termina. Solo hay
+    `workers * 2` archivos en vuelo y cada resultado se suelta tras entregarlo,
+    así que nunca se mantienen todos los PDFs en memoria a la vez.
+
+    Con `estricto=True` un PDF que falla lanza RuntimeError en vez de aportar
+    solo los trozos que alcanzó a leer.
+    """
+    pdf_files = sorted(Path(data_dir).glob("*.pdf"))
+    if not pdf_files:
+        print(f"\nℹ️ No se encontraron archivos PDF en la carpeta '{data_dir}'.")
+        return
+
+    if workers is None:
+        workers = min(len(pdf_files), os.cpu_count() or 1)
+    print(f"\n📚 Encontrados {len(pdf_files)} archivos PDF. Procesando con {max(workers, 1)} proceso(s)...")
+
+    def reportar(nombre, trozos, error):
+        paginas = len({m["page"] for _, m in trozos})
+        if error and estricto:
+            raise RuntimeError(f"Error al procesar {nombre}: {error}")
+        if error:
+            print(f"     ❌ Error al procesar {nombre} (se conservan {len(trozos)} trozos): {error}")
+        else:
+            print(f"     ✅ {nombre}: {paginas} páginas, {len(trozos)} trozos")
+
+    if workers <= 1 or len(pdf_files) == 1:
+        for pdf_path in pdf_files:
+            nombre, trozos, error = procesar_pdf(str(pdf_path), max_tokens, solapamiento)
+            reportar(nombre, trozos, error)
+            yield from trozos
+        return
+
+    # Como mucho `workers * 2` PDFs en vuelo: cada futuro retiene todos sus trozos hasta que se suelta
+    pendientes = iter(pdf_files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        en_vuelo = {pool.submit(procesar_pdf, str(p), max_tokens, solapamiento)
+                    for p in islice(pendientes, workers * 2)}
+        while en_vuelo:
+            listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            # Se reponen antes de entregar, para que el pool no espere al consumidor
+            for pdf_path in islice(pendientes, len(listos)):
+                en_vuelo.add(pool.submit(procesar_pdf, str(pdf_path), max_tokens, solapamiento))
+            while listos:
+                nombre, trozos, error = listos.pop().result()
+                reportar(nombre, trozos, error)
+                yield from trozos
@@ -0,0 +1,116 @@
+"""
+Acceso a Google Places (places:searchText) con caché de respuestas.
+
+`buscar_google_places` y `clima_por_lugar` buscan lo mismo con distintas field
+masks. Las respuestas se cachean por consulta normalizada junto con la mask que
+se pidió, así una petición con menos campos se sirve desde una respuesta en
+caché más completa. Además se mantiene un índice nombre -> place_id -> ubicación
+para resolver coordenadas de lugares ya vistos sin llamar a la API.
+"""
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import http_client
+from cache_utils import AsyncSingleFlight, SingleFlight, TTLCache
+from texto import palabras
+
+
+GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
+PLACES_API_URL = os.getenv("PLACES_API_URL", "https://places.googleapis.com")  # Otra base para pruebas (bench/fakes)
+PLACES_SEARCH_URL = f"{PLACES_API_URL}/v1/places:searchText"
+
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", "3600"))  # segundos
+PLACES_CACHE_MAX = int(os.getenv("PLACES_CACHE_MAX", "256"))
+PLACES_CACHE_DB = os.getenv("PLACES_CACHE_DB")  # Opcional, para sobrevivir reinicios
+UBICACIONES_TTL = 7 * 24 * 3600  # Las coordenadas de un lugar prácticamente no cambian
+UBICACIONES_MAX = 4096
+
+_respuestas = TTLCache(PLACES_CACHE_TTL, PLACES_CACHE_MAX, db_path=PLACES_CACHE_DB, tabla="places_respuestas")
+_ubicaciones = TTLCache(UBICACIONES_TTL, UBICACIONES_MAX, db_path=PLACES_CACHE_DB, tabla="places_ubicaciones")
+_nombres = TTLCache(UBICACIONES_TTL, UBICACIONES_MAX, db_path=PLACES_CACHE_DB, tabla="places_nombres")
+_en_vuelo = SingleFlight()
+_en_vuelo_async = AsyncSingleFlight()
+
+
+def normalizar_consulta(texto: str) -> str:
+    """'  Restaurantes en San Antonio!' y 'restaurantes en san antonio' comparten clave."""
+    return " ".join(palabras(texto))
+
+
+def buscar_lugares(query: str, campos: Iterable[str], timeout: float = 15) -> List[dict]:
+    """
+    Busca `query` en Cali pidiendo al menos `campos` (p. ej. "places.location").
+
+    Lanza la excepción de `requests` si la API responde con error, igual que
+    `raise_for_status`; los errores no se cachean.
+    """
+    clave = normalizar_consulta(query)
+    places, mascara = _desde_cache(clave, campos)
+    if places is not None:
+        return places
+
+    def consultar():
+        response = http_client.post(PLACES_SEARCH_URL, timeout=timeout, endpoint="places.searchText",
+                                    **_peticion(query, mascara))
+        return _guardar_respuesta(clave, mascara, response)
+
+    return _en_vuelo.do((clave, tuple(mascara)), consultar)
+
+
+async def abuscar_lugares(query: str, campos: Iterable[str], timeout: float = 15) -> List[dict]:
+    """Versión async de `buscar_lugares` (misma caché); lanza `httpx.HTTPStatusError` si la API falla."""
+    clave = normalizar_consulta(query)
+    places, mascara = _desde_cache(clave, campos)
+    if places is not None:
+        return places
+
+    async def consultar():
+        response = await http_client.apost(PLACES_SEARCH_URL, timeout=timeout, endpoint="places.searchText",
+                                           **_peticion(query, mascara))
+        return _guardar_respuesta(clave, mascara, response)
+
+    return await _en_vuelo_async.do((clave, tuple(mascara)), consultar)
+
+
+def _desde_cache(clave: str, campos: Iterable[str]) -> Tuple[Optional[List[dict]], List[str]]:
+    """(places, None) si la caché cubre `campos`; si no, (None, field mask a pedir)."""
+    pedidos = set(campos)
+    cacheada = _respuestas.get(clave)
+    if cacheada and pedidos <= set(cacheada["campos"]):
+        print(f"[DEBUG] Places desde caché para '{clave}'")
+        return cacheada["places"], None
+    # Pide la unión con lo ya cacheado para que la nueva respuesta siga siendo el superconjunto
+    return None, sorted(pedidos | {"places.id"} | set(cacheada["campos"] if cacheada else ()))
+
+
+def _peticion(query: str, mascara: List[str]) -> dict:
+    return {
+        "json": {"textQuery": f"{query} en Cali"},
+        "headers": {"X-Goog-Api-Key": GOOGLE_PLACES_API_KEY, "X-Goog-FieldMask": ",".join(mascara)},
+    }
+
+
+def _guardar_respuesta(clave: str, mascara: List[str], response) -> List[dict]:
+    response.raise_for_status()
+    places = (response.json() or {}).get("places", [])
+    _respuestas.set(clave, {"campos": mascara, "places": places})
+    _indexar_ubicaciones(places)
+    return places
+
+
+def _indexar_ubicaciones(places: List[dict]):
+    for place in places:
+        place_id = place.get("id")
+        loc = place.get("location") or {}
+        if not place_id or loc.get("latitude") is None or loc.get("longitude") is None:
+            continue
+        nombre = place.get("displayName", {}).get("text", "")
+        _ubicaciones.set(place_id, {"nombre": nombre, "location": loc})
+        if nombre:
+            _nombres.set(normalizar_consulta(nombre), place_id)
+
+
+def ubicacion_por_nombre(nombre: str) -> Optional[dict]:
+    """{"nombre", "location"} de un lugar ya visto en alguna búsqueda, o None."""
+    place_id = _nombres.get(normalizar_consulta(nombre))
+    return _ubicaciones.get(place_id) if place_id else None
@@ -1,87 +1,148 @@
 """
 Herramientas para buscar lugares usando Google Places API.
 """
+import asyncio
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple
 from langchain.tools import Tool
-from weather_tools import obtener_clima_por_latlng
+import places_api
+from weather_tools import aobtener_clima_por_latlng, obtener_clima_por_latlng
 
 
-GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
+# Campos que pide la búsqueda completa (superconjunto de lo que necesita clima_por_lugar)
+CAMPOS_BUSQUEDA = (
+    "places.id",
+    "places.displayName",
+    "places.formattedAddress",
+    "places.rating",
+    "places.websiteUri",
+    "places.location",  # Incluimos location para obtener lat/lng
+)
+
+# El clima de cada lugar se consulta en paralelo con un plazo global: la
+# herramienta tarda lo que la consulta más lenta, no la suma de todas.
+PLACES_WEATHER_DEADLINE = float(os.getenv("PLACES_WEATHER_DEADLINE", "6"))  # segundos
+PLACES_WEATHER_WORKERS = int(os.getenv("PLACES_WEATHER_WORKERS", "10"))
+_clima_pool = ThreadPoolExecutor(max_workers=PLACES_WEATHER_WORKERS, thread_name_prefix="clima")
+_tareas_clima = set()  # Referencias a las tareas async de clima hasta que terminen
+
+MAX_LUGARES = 5
+SIN_RESULTADOS = "No encontré lugares que coincidan con esa búsqueda."
+
+
+def _clima_con_plazo(futuro) -> str:
+    """Texto del clima si la consulta (Future o Task) terminó a tiempo; si no, un aviso corto."""
+    if futuro is None:
+        return ""
+    if not futuro.done():
+        return "Clima: no disponible a tiempo ⏱️ (toca para ver más detalles)"
+    try:
+        return futuro.result()
+    except Exception as e:
+        print(f"Error consultando clima: {e}")
+        return "Clima: no disponible."
 
 
 def buscar_lugares_google(query: str) -> str:
     """Busca lugares en Google Places (restaurantes, bares, hoteles) y devuelve lista con clima."""
     print(f"Tool: buscar_lugares_google, Query: {query}")
     try:
-        url = "https://places.googleapis.com/v1/places:searchText"
-        full_query = f"{query} en Cali"
-
-        payload = {"textQuery": full_query}
-        headers = {
-            "X-Goog-Api-Key": GOOGLE_PLACES_API_KEY,
-            # Incluimos location para obtener lat/lng
-            "X-Goog-FieldMask": (
-                "places.id,"
-                "places.displayName,"
-                "places.formattedAddress,"
-                "places.rating,"
-                "places.websiteUri,"
-                "places.location"
-            )
-        }
-
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-
-        places = data.get('places', [])
+        # Búsquedas repetidas ("restaurantes en San Antonio") se sirven desde la caché
+        places = places_api.buscar_lugares(query, CAMPOS_BUSQUEDA, timeout=15)
+        if not places:
+            return SIN_RESULTADOS
+
+        places = places[:MAX_LUGARES]
+        # Lanza todas las consultas de clima a la vez (la caché evita repetir celdas cercanas)
+        climas = _consultas_clima(places, lambda lat, lng: _clima_pool.submit(obtener_clima_por_latlng, lat, lng))
+        wait([f for f in climas if f is not None], timeout=PLACES_WEATHER_DEADLINE)
+
+        return _formatear_lugares(places, climas)
+
+    except Exception as e:
+        return _error_places(e)
+
+
+async def abuscar_lugares_google(query: str) -> str:
+    """Versión async de `buscar_lugares_google`: el clima de los lugares se pide con tareas del event loop."""
+    print(f"Tool: abuscar_lugares_google, Query: {query}")
+    try:
+        places = await places_api.abuscar_lugares(query, CAMPOS_BUSQUEDA, timeout=15)
         if not places:
-            return "No encontré lugares que coincidan con esa búsqueda."
-
-        formatted_results = []
-        # Para no exceder cuotas, aplico clima a los primeros 3 (ajústalo si quieres)
-        for i, place in enumerate(places[:5], start=1):
-            nombre = place.get('displayName', {}).get('text', 'N/A')
-            direccion = place.get('formattedAddress', 'N/A')
-            rating = place.get('rating', 'N/A')
-            web = place.get('websiteUri', 'N/A')
-
-            # Clima (si hay lat/lng)
-            clima_txt = ""
-            google_maps_url = ""
-            loc = place.get('location') or {}
-            lat = loc.get('latitude')
-            lng = loc.get('longitude')
-            if lat is not None and lng is not None:
-                # Generar link de Google Maps con coordenadas
-                google_maps_url = f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
-                
-                # Solo a los primeros 3 para ahorrar llamadas
-                if i <= 3:
-                    clima_txt = obtener_clima_por_latlng(lat, lng)
-                else:
-                    clima_txt = "Clima: (toca para ver más detalles)"
-
-            formatted_results.append(
-                f"{i}. Nombre: {nombre}\n"
-                f"   Dirección: {direccion}\n"
-                f"   Rating: {rating}\n"
-                f"   Web: {web}\n"
-                f"   📍 Google Maps: {google_maps_url}\n"
-                f"   {clima_txt}\n"  # Sin "☀️ Pronóstico hoy:" para evitar redundancia
-            )
-
-        return "\n".join(formatted_results)
+            return SIN_RESULTADOS
+
+        places = places[:MAX_LUGARES]
+        climas = _consultas_clima(places, _tarea_clima)
+        pendientes = [t for t in climas if t is not None]
+        if pendientes:
+            await asyncio.wait(pendientes, timeout=PLACES_WEATHER_DEADLINE)
+
+        return _formatear_lugares(places, climas)
 
     except Exception as e:
-        print(f"Error en API Google Places: {e}")
-        return f"Error al contactar la API de Google Places: {e}"
+        return _error_places(e)
+
+
+def _consultas_clima(places: List[dict], lanzar: Callable) -> list:
+    """`lanzar(lat, lng)` por cada lugar con coordenadas (su Future o Task); None para los demás."""
+    climas = []
+    for place in places:
+        lat, lng = _coordenadas(place)
+        climas.append(lanzar(lat, lng) if lat is not None and lng is not None else None)
+    return climas
+
+
+def _tarea_clima(lat: float, lng: float) -> asyncio.Task:
+    tarea = asyncio.create_task(aobtener_clima_por_latlng(lat, lng))
+    # Las que no lleguen a tiempo siguen corriendo y dejan el clima en caché
+    _tareas_clima.add(tarea)
+    tarea.add_done_callback(_tareas_clima.discard)
+    return tarea
+
+
+def _error_places(e: Exception) -> str:
+    print(f"Error en API Google Places: {e}")
+    return f"Error al contactar la API de Google Places: {e}"
+
+
+def _coordenadas(place: dict) -> Tuple[Optional[float], Optional[float]]:
+    loc = place.get('location') or {}
+    return loc.get('latitude'), loc.get('longitude')
+
+
+def _formatear_lugares(places: List[dict], climas: list) -> str:
+    formatted_results = []
+    for i, (place, clima_futuro) in enumerate(zip(places, climas), start=1):
+        nombre = place.get('displayName', {}).get('text', 'N/A')
+        direccion = place.get('formattedAddress', 'N/A')
+        rating = place.get('rating', 'N/A')
+        web = place.get('websiteUri', 'N/A')
+
+        # Clima (si hay lat/lng y llegó antes del plazo)
+        clima_txt = _clima_con_plazo(clima_futuro)
+        google_maps_url = ""
+        lat, lng = _coordenadas(place)
+        if lat is not None and lng is not None:
+            # Generar link de Google Maps con coordenadas
+            google_maps_url = f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
+
+        formatted_results.append(
+            f"{i}. Nombre: {nombre}\n"
+            f"   Dirección: {direccion}\n"
+            f"   Rating: {rating}\n"
+            f"   Web: {web}\n"
+            f"   📍 Google Maps: {google_maps_url}\n"
+            f"   {clima_txt}\n"  # Sin "☀️ Pronóstico hoy:" para evitar redundancia
+        )
+
+    return "\n".join(formatted_results)
 
 
 # Crear la herramienta para el agente
 tool_google_places = Tool(
     name="buscar_google_places",
     func=buscar_lugares_google,
+    coroutine=abuscar_lugares_google,
     description="Busca restaurantes, bares, hoteles y otros lugares de interés en Cali. Útil para recomendaciones, direcciones y calificaciones."
 )
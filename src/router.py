@@ -0,0 +1,177 @@
+"""
+Ruta rápida delante de `agent_executor`.
+
+El agente ReAct necesita al menos dos llamadas a Gemini (elegir herramienta y
+redactar). Para intenciones claras (saludo, clima de un lugar, búsqueda de
+lugares, información turística) el router llama directo a la herramienta y
+redacta con una sola llamada al LLM. Lo ambiguo sigue yendo al agente.
+
+La intención se decide primero por palabras clave y, si ninguna aplica, por
+similitud del mensaje con frases prototipo usando el mismo MiniLM del RAG.
+"""
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from answer_cache import PATRON_CLIMA, PATRON_HISTORIAL
+from places_tools import abuscar_lugares_google, tool_google_places
+from prompts import FAST_PATH_PROMPT_TEMPLATE
+from texto import palabras
+from weather_tools import aclima_por_lugar, tool_clima_por_lugar
+
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.6"))  # Similitud mínima con un prototipo
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.08"))  # Ventaja mínima sobre la segunda intención
+ROUTER_MAX_WORDS = 25  # Mensajes más largos suelen combinar pedidos: van al agente
+
+SALUDO, CLIMA, LUGARES, INFO = "saludo", "clima", "lugares", "info"
+# Herramienta del agente que equivale a cada intención: la caché de respuestas la trata igual
+HERRAMIENTA_INTENCION = {CLIMA: tool_clima_por_lugar.name, LUGARES: tool_google_places.name}
+
+# Un saludo lleva al menos una de estas palabras; el resto del mensaje solo puede ser relleno
+PALABRAS_SALUDO = {"hola", "holi", "buenas", "buenos", "hey", "hi", "hello", "gracias", "thanks", "saludos"}
+RELLENO_SALUDO = {"dias", "tardes", "noches", "que", "mas", "muchas", "cal", "e", "cale", "como", "estas"}
+PATRON_LUGARES = re.compile(
+    r"\b(restaurantes?|bares?|hotel(es)?|hostal(es)?|cafes?|cafeterias?|discotecas?|panaderias?|heladerias?|"
+    r"donde (puedo )?(comer|cenar|almorzar|desayunar|tomar|dormir|hospedarme|bailar|rumbear))\b"
+)
+PATRON_INFO = re.compile(
+    r"\b(historia|hablame|cuentame|que es|quien fue|museos?|festival|feria|atracciones?|"
+    r"que hacer|que visitar|sitios turisticos|lugares turisticos)\b"
+)
+# Lo que queda entre la palabra de clima y el lugar: "clima hoy en el Cristo Rey" -> "Cristo Rey"
+PATRON_TIEMPO = re.compile(r"\b(hoy|ahora|mañana|manana|esta tarde|esta noche)\b", re.IGNORECASE)
+PATRON_RELLENO = re.compile(
+    r"^(\s*\b(en|de|del|para|por|el|la|los|las|hace|hay|va a|está|esta|estará|como|cómo)\b)+", re.IGNORECASE
+)
+
+PROTOTIPOS = {
+    SALUDO: ["hola", "buenos días", "hola, cómo estás", "buenas tardes", "muchas gracias", "hello"],
+    CLIMA: ["cómo está el clima en", "va a llover hoy en", "qué temperatura hace en", "pronóstico del tiempo en Cali",
+            "hace calor en"],
+    LUGARES: ["dónde puedo comer", "recomiéndame restaurantes en", "bares en San Antonio", "hoteles cerca de",
+              "dónde tomar café", "discotecas para bailar salsa"],
+    INFO: ["háblame de", "qué es el Gato del Río", "historia del Cristo Rey", "qué lugares turísticos visitar",
+           "cuéntame sobre la Feria de Cali", "qué hacer en Cali"],
+}
+
+
+def lugar_de_clima(texto: str) -> str:
+    """Extrae el lugar de una pregunta de clima; Cali si no menciona ninguno."""
+    coincidencias = list(PATRON_CLIMA.finditer(texto))
+    resto = texto[coincidencias[-1].end():] if coincidencias else texto
+    resto = PATRON_TIEMPO.sub(" ", resto).strip(" ?¿!.,")
+    lugar = PATRON_RELLENO.sub("", resto).strip(" ?¿!.,")
+    return lugar or "Cali"
+
+
+class IntentRouter:
+    """Clasifica el mensaje en una intención clara o None (va al agente) y lleva la latencia por ruta."""
+
+    def __init__(self, embeddings_model, umbral: float = ROUTER_THRESHOLD, margen: float = ROUTER_MARGIN):
+        self.embeddings_model = embeddings_model
+        self.umbral = umbral
+        self.margen = margen
+        self._prototipos: Optional[Dict[str, np.ndarray]] = None  # Se embeben en el primer uso
+        self._lock = threading.Lock()
+        self._rutas: Dict[str, Dict[str, float]] = {}
+
+    def _vectores_prototipo(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if self._prototipos is None:
+                prototipos = {}
+                for intencion, frases in PROTOTIPOS.items():
+                    vectores = np.asarray(self.embeddings_model.embed_documents(frases), dtype=np.float32)
+                    prototipos[intencion] = vectores / np.linalg.norm(vectores, axis=1, keepdims=True)
+                self._prototipos = prototipos
+            return self._prototipos
+
+    def clasificar(self, texto: str, vector: Optional[np.ndarray] = None) -> Tuple[Optional[str], str]:
+        """
+        Retorna (intención, motivo). `vector` es el embedding normalizado de la
+        pregunta si ya se calculó (p. ej. en la caché semántica).
+        """
+        if not ROUTER_ENABLED:
+            return None, "router desactivado"
+        terminos = palabras(texto)
+        normalizado = " ".join(terminos)
+        if not terminos or len(terminos) > ROUTER_MAX_WORDS:
+            return None, "mensaje largo"
+        if PATRON_HISTORIAL.search(texto):
+            return None, "depende del historial"
+
+        candidatas = set()
+        if (len(terminos) <= 5 and PALABRAS_SALUDO.intersection(terminos)
+                and all(p in PALABRAS_SALUDO or p in RELLENO_SALUDO for p in terminos)):
+            candidatas.add(SALUDO)
+        if PATRON_CLIMA.search(texto):
+            candidatas.add(CLIMA)
+        if PATRON_LUGARES.search(normalizado):
+            candidatas.add(LUGARES)
+        if PATRON_INFO.search(normalizado):
+            candidatas.add(INFO)
+        if len(candidatas) == 1:
+            return candidatas.pop(), "palabras clave"
+        if candidatas:
+            return None, f"ambigua ({', '.join(sorted(candidatas))})"
+
+        if vector is None:
+            vector = np.asarray(self.embeddings_model.embed_query(texto.strip().lower()), dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        puntajes = sorted(
+            ((float(np.max(prototipos @ vector)), intencion) for intencion, prototipos in self._vectores_prototipo().items()),
+            reverse=True,
+        )
+        (mejor, intencion), (segundo, _) = puntajes[0], puntajes[1]
+        if mejor >= self.umbral and mejor - segundo >= self.margen:
+            return intencion, f"prototipo ({mejor:.2f})"
+        return None, f"sin intención clara ({intencion} {mejor:.2f})"
+
+    def registrar(self, ruta: str, segundos: float):
+        """Acumula la latencia de una respuesta servida por `ruta` (una intención o "agente")."""
+        with self._lock:
+            r = self._rutas.setdefault(ruta, {"respuestas": 0, "segundos_total": 0.0})
+            r["respuestas"] += 1
+            r["segundos_total"] += segundos
+        print(f"[ROUTER] Ruta '{ruta}' respondió en {segundos:.2f}s")
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                ruta: {"respuestas": r["respuestas"], "latencia_media_s": round(r["segundos_total"] / r["respuestas"], 2)}
+                for ruta, r in self._rutas.items()
+            }
+
+
+class FastPathResponder:
+    """Llama directo a la herramienta de la intención y redacta con una sola llamada al LLM."""
+
+    def __init__(self, llm, retriever):
+        self.llm = llm
+        self.retriever = retriever
+
+    async def contexto(self, intencion: str, texto: str) -> str:
+        if intencion == CLIMA:
+            return await aclima_por_lugar(lugar_de_clima(texto))
+        if intencion == LUGARES:
+            return await abuscar_lugares_google(texto)
+        if intencion == INFO:
+            return "\n\n".join(doc.page_content for doc in await self.retriever.ainvoke(texto))
+        return ""
+
+    @staticmethod
+    def herramientas(intencion: str) -> list:
+        """Herramientas que usa la ruta de `intencion`, con los mismos nombres que el agente."""
+        return [HERRAMIENTA_INTENCION[intencion]] if intencion in HERRAMIENTA_INTENCION else []
+
+    async def responder(self, intencion: str, texto: str, historial: str) -> str:
+        prompt = FAST_PATH_PROMPT_TEMPLATE.format(
+            contexto=await self.contexto(intencion, texto) or "(no se necesita información adicional)",
+            chat_history=historial or "(sin historial)",
+            input=texto,
+        )
+        return (await self.llm.ainvoke(prompt)).content.strip()
@@ -0,0 +1,182 @@
+"""
+Arranque en paralelo y bajo demanda de los componentes pesados del bot.
+
+Antes, importar main.py cargaba en serie embeddings, índice FAISS, BM25,
+re-ranker y base de datos, y recién después arrancaba el polling. Ahora cada
+componente se registra con su función de carga y:
+
+- STARTUP_MODE=background: al iniciar el bot todos cargan a la vez, cada uno en
+  su hilo (las dependencias se piden con `obtener`, que espera a que estén).
+- STARTUP_MODE=lazy: cada componente carga la primera vez que se necesita.
+
+Los handlers esperan solo lo que usan (`requiere`): /start responde al
+instante y los mensajes quedan en cola hasta que su componente esté listo.
+Un componente se puede `inyectar` ya construido (p. ej. un LLM falso para
+benchmarks), y entonces no se carga.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")  # background | lazy
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", "180"))  # Espera máxima de un mensaje en cola
+
+PENDIENTE, CARGANDO, LISTO, ERROR = "pendiente", "cargando", "listo", "error"
+
+
+class ComponenteNoDisponible(RuntimeError):
+    """El componente falló al cargar o no estuvo listo a tiempo."""
+
+
+class _Componente:
+    def __init__(self, nombre: str, cargador: Optional[Callable]):
+        self.nombre = nombre
+        self.cargador = cargador
+        self.estado = PENDIENTE
+        self.futuro: Future = Future()
+        self.inicio: Optional[float] = None
+        self.segundos: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+
+class Arranque:
+    """Registro de componentes con estado de preparación y tiempos de carga."""
+
+    def __init__(self, modo: str = STARTUP_MODE, timeout: float = STARTUP_WAIT_TIMEOUT):
+        self.modo = modo
+        self.timeout = timeout
+        self._componentes: Dict[str, _Componente] = {}
+        self._lock = threading.Lock()
+        self._inicio: Optional[float] = None
+        self._fin: Optional[float] = None
+
+    def registrar(self, nombre: str, cargador: Callable):
+        """Agrega un componente; `cargador()` corre en un hilo propio y su resultado es el valor del componente."""
+        with self._lock:
+            if nombre not in self._componentes:
+                self._componentes[nombre] = _Componente(nombre, cargador)
+            elif self._componentes[nombre].estado == PENDIENTE:
+                self._componentes[nombre].cargador = cargador
+
+    def inyectar(self, nombre: str, valor):
+        """Deja el componente listo con `valor` sin ejecutar su cargador."""
+        with self._lock:
+            componente = self._componentes.setdefault(nombre, _Componente(nombre, None))
+            if componente.estado != PENDIENTE:
+                raise RuntimeError(f"El componente '{nombre}' ya está {componente.estado}")
+            componente.estado = LISTO
+            componente.segundos = 0.0
+        componente.futuro.set_result(valor)
+
+    def iniciar(self):
+        """Marca el inicio del arranque y, en modo background, lanza todas las cargas en paralelo."""
+        self._inicio = time.monotonic()
+        print(f"[ARRANQUE] Modo {self.modo}: {len(self._componentes)} componentes")
+        if self.modo != "lazy":
+            for nombre in list(self._componentes):
+                self._disparar(nombre)
+
+    def _disparar(self, nombre: str) -> _Componente:
+        with self._lock:
+            componente = self._componentes.get(nombre)
+            if componente is None:
+                raise KeyError(f"Componente no registrado: {nombre}")
+            if componente.estado != PENDIENTE:
+                return componente
+            componente.estado = CARGANDO
+            componente.inicio = time.monotonic()
+            if self._inicio is None:
+                self._inicio = componente.inicio
+            # En curso: cancelar a quien espera (p. ej. un timeout) no cancela la carga
+            componente.futuro.set_running_or_notify_cancel()
+        threading.Thread(target=self._cargar, args=(componente,), name=f"arranque-{nombre}", daemon=True).start()
+        return componente
+
+    def _cargar(self, componente: _Componente):
+        try:
+            valor = componente.cargador()
+        except BaseException as e:
+            componente.segundos = time.monotonic() - componente.inicio
+            componente.error = e
+            componente.estado = ERROR
+            print(f"[ERROR] No se pudo cargar '{componente.nombre}' ({componente.segundos:.1f}s): {e}")
+            componente.futuro.set_exception(e)
+        else:
+            componente.segundos = time.monotonic() - componente.inicio
+            componente.estado = LISTO
+            print(f"[ARRANQUE] '{componente.nombre}' listo en {componente.segundos:.1f}s")
+            componente.futuro.set_result(valor)
+        self._terminado()
+
+    def _terminado(self):
+        with self._lock:
+            if any(c.estado == CARGANDO for c in self._componentes.values()):
+                return
+            self._fin = time.monotonic()
+        if self.modo != "lazy" or all(c.estado != PENDIENTE for c in self._componentes.values()):
+            print(f"[ARRANQUE] Reporte: {self.reporte()}")
+
+    def obtener(self, nombre: str):
+        """Valor del componente, cargándolo si hace falta (bloquea; para hilos y cargadores)."""
+        componente = self._disparar(nombre)
+        try:
+            return componente.futuro.result()
+        except Exception as e:
+            raise ComponenteNoDisponible(f"'{nombre}' no está disponible: {e}") from e
+
+    async def esperar(self, *nombres: str):
+        """Versión async de `obtener` para varios componentes a la vez, con STARTUP_WAIT_TIMEOUT."""
+        futuros = [asyncio.wrap_future(self._disparar(nombre).futuro) for nombre in nombres]
+        try:
+            valores = await asyncio.wait_for(asyncio.gather(*futuros), self.timeout)
+        except asyncio.TimeoutError:
+            raise ComponenteNoDisponible(f"{', '.join(nombres)} no estuvo listo en {self.timeout:g}s")
+        except Exception as e:
+            raise ComponenteNoDisponible(str(e)) from e
+        return valores[0] if len(valores) == 1 else valores
+
+    def valor(self, nombre: str):
+        """Valor de un componente que ya está listo (p. ej. dentro de un handler con `requiere`)."""
+        return self._componentes[nombre].futuro.result(timeout=0)
+
+    def listo(self, *nombres: str) -> bool:
+        return all(self._componentes[nombre].estado == LISTO for nombre in nombres)
+
+    def requiere(self, *nombres: str, aviso: str = "⚠️ Estoy teniendo problemas para arrancar. Intenta de nuevo en un momento."):
+        """
+        Decorador para handlers de Telegram: el update queda en espera hasta que
+        `nombres` estén listos; si alguno falla, responde `aviso`.
+        """
+        def decorador(handler):
+            @functools.wraps(handler)
+            async def envoltura(update, context):
+                if not self.listo(*nombres):
+                    print(f"[ARRANQUE] Update en espera de {', '.join(nombres)}: {self.estados()}")
+                try:
+                    await self.esperar(*nombres)
+                except ComponenteNoDisponible as e:
+                    print(f"[ERROR] {e}")
+                    if update.effective_message:
+                        await update.effective_message.reply_text(aviso)
+                    return
+                return await handler(update, context)
+            return envoltura
+        return decorador
+
+    def estados(self) -> Dict[str, str]:
+        return {nombre: c.estado for nombre, c in self._componentes.items()}
+
+    def reporte(self) -> dict:
+        """Tiempo de carga de cada componente y del arranque completo (menor que la suma si hubo paralelismo)."""
+        componentes = {
+            nombre: {"estado": c.estado, "segundos": round(c.segundos, 2) if c.segundos is not None else None}
+            for nombre, c in self._componentes.items()
+        }
+        suma = sum(c.segundos or 0.0 for c in self._componentes.values())
+        total = (self._fin or time.monotonic()) - self._inicio if self._inicio is not None else 0.0
+        return {"modo": self.modo, "componentes": componentes, "total_s": round(total, 2), "suma_s": round(suma, 2)}
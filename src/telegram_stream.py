@@ -0,0 +1,230 @@
+"""
+Respuestas progresivas en Telegram.
+
+En vez de esperar a que termine el ciclo ReAct y mandar todo con un solo
+`reply_text`, los tokens de la "Final Answer" de Gemini se van mostrando en un
+mismo mensaje con `edit_message_text`, espaciando las ediciones para respetar
+los límites de Telegram (~1 edición por segundo por chat, RetryAfter si no).
+
+La métrica principal es el TTFT: desde que llega el mensaje del usuario hasta
+que ve el primer texto de la respuesta.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional
+
+from telegram import Message
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+
+STREAM_ENABLED = os.getenv("STREAM_ENABLED", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Segundos mínimos entre ediciones
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "40"))  # Texto nuevo mínimo para justificar una edición
+LIMITE_TELEGRAM = MessageLimit.MAX_TEXT_LENGTH  # 4096 caracteres por mensaje
+MARCADOR_RESPUESTA = "Final Answer:"
+
+_metricas = {"respuestas": 0, "ttft_total": 0.0, "ttft_max": 0.0, "ediciones": 0, "limitadas": 0}
+_metricas_lock = threading.Lock()
+
+
+def dividir(texto: str, limite: int = LIMITE_TELEGRAM) -> List[str]:
+    """Parte el texto en trozos de hasta `limite` caracteres, cortando en un salto de línea o espacio si se puede."""
+    partes = []
+    while len(texto) > limite:
+        corte = texto.rfind("\n", 0, limite)
+        if corte < limite // 2:
+            corte = texto.rfind(" ", 0, limite)
+        if corte < limite // 2:
+            corte = limite
+        partes.append(texto[:corte].rstrip())
+        texto = texto[corte:].lstrip()
+    partes.append(texto)
+    return partes
+
+
+class MensajeProgresivo:
+    """Respuesta a `origen` que se va escribiendo con ediciones espaciadas; si pasa de 4096 caracteres, sigue en otro mensaje."""
+
+    def __init__(self, origen: Message, inicio: Optional[float] = None,
+                 intervalo: float = STREAM_EDIT_INTERVAL, min_caracteres: int = STREAM_MIN_CHARS):
+        self.origen = origen
+        self.inicio = inicio if inicio is not None else time.monotonic()
+        self.intervalo = intervalo
+        self.min_caracteres = min_caracteres
+        self.texto = ""
+        self.ttft: Optional[float] = None
+        self._mensajes: List[Message] = []
+        self._mostrado: List[str] = []  # Texto visible en cada mensaje
+        self._proxima = 0.0  # Antes de este instante (monotonic) no se edita
+        self._lock = asyncio.Lock()
+        self._aviso: Optional[asyncio.Task] = None
+        self._ediciones = 0
+
+    def avisar_tras(self, segundos: float, texto: str):
+        """Si en `segundos` no hay respuesta, muestra `texto`; ese mismo mensaje se edita luego con la respuesta."""
+        async def avisar():
+            await asyncio.sleep(segundos)
+            async with self._lock:
+                if not self._mensajes:
+                    await self._enviar(texto)
+        self._aviso = asyncio.create_task(avisar())
+
+    async def agregar(self, delta: str):
+        self.texto += delta
+        await self._refrescar(final=False)
+
+    def reiniciar(self):
+        """Descarta el texto parcial (p. ej. antes de reintentar el agente); los mensajes ya enviados se reutilizan."""
+        self.texto = ""
+
+    async def finalizar(self, texto: Optional[str] = None):
+        """Deja el texto definitivo visible (esperando si Telegram lo pide) y registra las métricas."""
+        if self._aviso and not self._aviso.done():
+            self._aviso.cancel()
+        if texto is not None:
+            self.texto = texto
+        await self._refrescar(final=True)
+
+        total = time.monotonic() - self.inicio
+        ttft = self.ttft if self.ttft is not None else total
+        with _metricas_lock:
+            _metricas["respuestas"] += 1
+            _metricas["ttft_total"] += ttft
+            _metricas["ttft_max"] = max(_metricas["ttft_max"], ttft)
+        print(f"[STREAM] TTFT {ttft:.2f}s, total {total:.2f}s, {self._ediciones} ediciones, "
+              f"{len(self._mensajes)} mensaje(s)")
+
+    def _visible(self) -> str:
+        # Telegram no interpreta **negritas** sin parse_mode
+        return self.texto.replace("**", "").strip()
+
+    async def _refrescar(self, final: bool):
+        async with self._lock:
+            texto = self._visible()
+            if not texto:
+                return
+            if not final:
+                if time.monotonic() < self._proxima:
+                    return
+                if self.ttft is not None and len(texto) - sum(map(len, self._mostrado)) < self.min_caracteres:
+                    return
+
+            partes = dividir(texto)
+            for i, parte in enumerate(partes):
+                if i >= len(self._mensajes):
+                    if not await self._enviar(parte, final):
+                        return
+                elif self._mostrado[i] != parte:
+                    if not await self._editar(i, parte, final):
+                        return
+            if final:
+                # La versión definitiva salió más corta que lo transmitido
+                for mensaje in self._mensajes[len(partes):]:
+                    try:
+                        await mensaje.delete()
+                    except TelegramError:
+                        pass
+                del self._mensajes[len(partes):], self._mostrado[len(partes):]
+
+            if self.ttft is None:
+                self.ttft = time.monotonic() - self.inicio
+            self._proxima = time.monotonic() + self.intervalo
+
+    async def _enviar(self, parte: str, final: bool = True) -> bool:
+        while True:
+            try:
+                self._mensajes.append(await self.origen.reply_text(parte))
+                self._mostrado.append(parte)
+                return True
+            except RetryAfter as e:
+                if not await self._limitado(e, final):
+                    return False
+
+    async def _editar(self, i: int, parte: str, final: bool) -> bool:
+        while True:
+            try:
+                await self._mensajes[i].edit_text(parte)
+                self._mostrado[i] = parte
+                self._ediciones += 1
+                with _metricas_lock:
+                    _metricas["ediciones"] += 1
+                return True
+            except RetryAfter as e:
+                if not await self._limitado(e, final):
+                    return False
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    self._mostrado[i] = parte
+                    return True
+                if not final:
+                    print(f"[STREAM] No se pudo editar el mensaje: {e}")
+                    return False
+                # Mensaje borrado o inválido: la versión final va en uno nuevo
+                self._mensajes[i] = await self.origen.reply_text(parte)
+                self._mostrado[i] = parte
+                return True
+
+    async def _limitado(self, error: RetryAfter, final: bool) -> bool:
+        """Ante un RetryAfter: el texto final espera y reintenta; una edición intermedia simplemente se salta."""
+        segundos = error.retry_after.total_seconds() if hasattr(error.retry_after, "total_seconds") else error.retry_after
+        with _metricas_lock:
+            _metricas["limitadas"] += 1
+        print(f"[STREAM] Telegram pide esperar {segundos}s")
+        self._proxima = time.monotonic() + segundos
+        if final:
+            await asyncio.sleep(segundos)
+        return final
+
+
+async def transmitir_agente(agent_executor, entradas: dict, mensaje: MensajeProgresivo) -> dict:
+    """
+    Corre el agente ReAct pasando a `mensaje` los tokens que siguen a
+    "Final Answer:" a medida que Gemini los genera. Retorna la salida del
+    agente, igual que `ainvoke`; si el stream termina sin la salida de la
+    corrida raíz, lanza RuntimeError.
+    """
+    if not STREAM_ENABLED:
+        return await agent_executor.ainvoke(entradas)
+
+    raiz = None
+    salida = None
+    generado = ""  # Texto de la llamada al LLM en curso
+    emitido = 0  # Caracteres de su "Final Answer" ya pasados al mensaje
+    async for evento in agent_executor.astream_events(entradas, version="v2"):
+        tipo = evento["event"]
+        if raiz is None:
+            raiz = evento["run_id"]
+        if tipo == "on_chat_model_start":
+            # Cada paso del ReAct es una llamada nueva; si un paso anterior no terminó en respuesta, se descarta
+            generado, emitido = "", 0
+            mensaje.reiniciar()
+        elif tipo == "on_chat_model_stream":
+            contenido = evento["data"]["chunk"].content
+            generado += contenido if isinstance(contenido, str) else ""
+            posicion = generado.find(MARCADOR_RESPUESTA)
+            if posicion >= 0:
+                respuesta = generado[posicion + len(MARCADOR_RESPUESTA):].lstrip()
+                if len(respuesta) > emitido:
+                    await mensaje.agregar(respuesta[emitido:])
+                    emitido = len(respuesta)
+        elif tipo == "on_chain_end" and evento["run_id"] == raiz:
+            salida = evento["data"]["output"]
+    if salida is None:
+        # No se reintenta con ainvoke: volvería a correr el agente y sus herramientas
+        raise RuntimeError("El stream del agente terminó sin salida final")
+    return salida
+
+
+def metricas() -> dict:
+    with _metricas_lock:
+        respuestas = _metricas["respuestas"]
+        return {
+            "respuestas": respuestas,
+            "ttft_medio_s": round(_metricas["ttft_total"] / respuestas, 2) if respuestas else 0.0,
+            "ttft_max_s": round(_metricas["ttft_max"], 2),
+            "ediciones": _metricas["ediciones"],
+            "limitadas": _metricas["limitadas"],
+        }
@@ -0,0 +1,18 @@
+"""
+Normalización de texto compartida por el índice léxico, el router y la caché
+de Google Places: minúsculas, sin tildes y partido en palabras.
+"""
+import re
+import unicodedata
+from typing import List
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes, para que 'Río' y 'rio' coincidan."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras del texto normalizado, sin puntuación."""
+    return re.findall(r"\w+", normalizar(texto))
@@ -0,0 +1,178 @@
+"""
+Servicio de transcripción de notas de voz.
+
+- El modelo se carga la primera vez que llega una nota de voz (un despliegue que
+  solo recibe texto no paga ni el arranque ni la memoria de Whisper).
+- Usa faster-whisper con int8 si está instalado; si no, openai-whisper fijando
+  los hilos de torch.
+- Las notas que llegan casi a la vez se agrupan en un lote: con openai-whisper
+  los clips de hasta 30 s se decodifican juntos en una sola pasada del modelo.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+
+from audio_decode import SAMPLE_RATE
+
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")  # tiny | base | small | medium...
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "auto")  # auto | faster-whisper | openai-whisper
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", str(os.cpu_count() or 4)))
+WHISPER_BATCH_MAX = int(os.getenv("WHISPER_BATCH_MAX", "4"))
+WHISPER_BATCH_WINDOW_MS = int(os.getenv("WHISPER_BATCH_WINDOW_MS", "50"))  # Espera para juntar un lote
+IDIOMA = "es"
+SEGUNDOS_VENTANA = 30  # Whisper procesa ventanas de 30 s
+
+
+class TranscriptionService:
+    """Transcribe arrays float32 de 16 kHz en un hilo propio, agrupando pedidos concurrentes."""
+
+    def __init__(self, modelo: str = WHISPER_MODEL, backend: str = WHISPER_BACKEND,
+                 hilos: int = WHISPER_THREADS, lote_max: int = WHISPER_BATCH_MAX,
+                 ventana_ms: int = WHISPER_BATCH_WINDOW_MS):
+        self.nombre_modelo = modelo
+        self.backend_pedido = backend
+        self.hilos = hilos
+        self.lote_max = max(1, lote_max)
+        self.ventana = ventana_ms / 1000
+        self.backend = None  # Se conoce al cargar el modelo
+        self._modelo = None
+        self._error = None
+        self._cola: "queue.Queue[tuple]" = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._clips = 0
+        self._lotes = 0
+        self._segundos_audio = 0.0
+        self._segundos_proceso = 0.0
+
+    def disponible(self) -> bool:
+        """False solo si el modelo ya intentó cargarse y falló."""
+        return self._error is None
+
+    def transcribir(self, audio: np.ndarray) -> str:
+        """Bloquea hasta tener el texto de `audio`; pensado para llamarse desde un hilo del pipeline de voz."""
+        if self._error is not None:
+            raise RuntimeError(f"Whisper no está disponible: {self._error}")
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="whisper", daemon=True)
+                self._hilo.start()
+        futuro = Future()
+        self._cola.put((audio, futuro))
+        return futuro.result()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.ventana
+            while len(lote) < self.lote_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._procesar(lote)
+
+    def _procesar(self, lote: List[tuple]):
+        audios = [audio for audio, _ in lote]
+        try:
+            if self._modelo is None:
+                self._cargar()
+            inicio = time.monotonic()
+            if self.backend == "openai-whisper":
+                textos = self._transcribir_openai(audios)
+            else:
+                textos = [self._transcribir_faster(audio) for audio in audios]
+            duracion = time.monotonic() - inicio
+        except Exception as e:
+            if self._modelo is None:
+                self._error = e
+            print(f"[ERROR] Transcripción de {len(lote)} nota(s) falló: {e}")
+            for _, futuro in lote:
+                futuro.set_exception(e)
+            return
+
+        for (_, futuro), texto in zip(lote, textos):
+            futuro.set_result(texto)
+
+        segundos_audio = sum(len(audio) for audio in audios) / SAMPLE_RATE
+        with self._lock:
+            self._clips += len(lote)
+            self._lotes += 1
+            self._segundos_audio += segundos_audio
+            self._segundos_proceso += duracion
+        print(f"[WHISPER] Lote de {len(lote)}: {segundos_audio:.1f}s de audio en {duracion:.2f}s "
+              f"(RTF {duracion / max(segundos_audio, 1e-6):.2f})")
+
+    def _cargar(self):
+        inicio = time.monotonic()
+        print(f"Cargando modelo Whisper '{self.nombre_modelo}' para transcripción de voz...")
+        if self.backend_pedido in ("auto", "faster-whisper"):
+            try:
+                from faster_whisper import WhisperModel
+                self._modelo = WhisperModel(self.nombre_modelo, device="cpu", compute_type="int8",
+                                            cpu_threads=self.hilos)
+                self.backend = "faster-whisper"
+            except ImportError:
+                if self.backend_pedido == "faster-whisper":
+                    raise
+        if self._modelo is None:
+            import torch
+            import whisper
+            torch.set_num_threads(self.hilos)
+            self._modelo = whisper.load_model(self.nombre_modelo, device="cpu")
+            self.backend = "openai-whisper"
+        print(f"Modelo Whisper cargado ({self.nombre_modelo}, {self.backend}, {self.hilos} hilos) "
+              f"en {time.monotonic() - inicio:.1f}s.")
+
+    def _transcribir_faster(self, audio: np.ndarray) -> str:
+        segmentos, _ = self._modelo.transcribe(audio, language=IDIOMA, beam_size=1)
+        return " ".join(segmento.text.strip() for segmento in segmentos).strip()
+
+    def _transcribir_openai(self, audios: List[np.ndarray]) -> List[str]:
+        import torch
+        import whisper
+
+        textos = [None] * len(audios)
+        cortos = [i for i, audio in enumerate(audios) if len(audio) <= SEGUNDOS_VENTANA * SAMPLE_RATE]
+        if cortos:
+            # Un solo forward para todos los clips de una ventana: mels apilados en un batch
+            mels = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(audios[i]), self._modelo.dims.n_mels)
+                for i in cortos
+            ]).to(self._modelo.device)
+            opciones = whisper.DecodingOptions(language=IDIOMA, fp16=False, without_timestamps=True)
+            with torch.no_grad():
+                resultados = whisper.decode(self._modelo, mels, opciones)
+            for i, resultado in zip(cortos, resultados):
+                textos[i] = resultado.text.strip()
+
+        # Los clips de más de 30 s necesitan la ventana deslizante de transcribe()
+        for i, audio in enumerate(audios):
+            if textos[i] is None:
+                textos[i] = self._modelo.transcribe(audio, language=IDIOMA, fp16=False)["text"].strip()
+        return textos
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "modelo": self.nombre_modelo,
+                "backend": self.backend,
+                "clips": self._clips,
+                "lotes": self._lotes,
+                "clips_por_lote": round(self._clips / self._lotes, 2) if self._lotes else 0.0,
+                "segundos_audio": round(self._segundos_audio, 1),
+                "clips_por_segundo": round(self._clips / self._segundos_proceso, 2) if self._segundos_proceso else 0.0,
+                "rtf": round(self._segundos_proceso / self._segundos_audio, 3) if self._segundos_audio else 0.0,
+            }
+
+
+servicio = TranscriptionService()
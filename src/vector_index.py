@@ -0,0 +1,296 @@
+"""
+Tipos de índice FAISS para la base vectorial de CAL-E.
+
+Además del índice plano (búsqueda exacta), la ingesta puede construir índices
+IVF-Flat, IVF-PQ o HNSW, que ocupan menos memoria o buscan más rápido a cambio
+de algo de recall. El tipo y los parámetros de búsqueda quedan en el manifiesto
+del índice, y `cargar_vector_store` los aplica al cargar lo que haya en disco.
+
+En disco el índice es `index.faiss` + `docstore.sqlite` (sin pickle), de modo que
+el bot puede abrirlo con memory-mapping: varias réplicas en la misma máquina
+comparten las mismas páginas del sistema operativo y arrancan en tiempo constante.
+El mismo `docstore.sqlite` guarda el índice léxico BM25 de la búsqueda híbrida.
+
+La ingesta escribe cada índice en `versiones/<id>/` y lo publica reemplazando el
+archivo `ACTUAL` (el puntero a la versión vigente) con un solo `os.replace`;
+`resolver_indice` traduce el directorio del índice a esa versión.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from bm25_index import BM25Index, escribir_bm25
+
+
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "index.faiss"
+DOCSTORE_NAME = "docstore.sqlite"
+PUNTERO_NAME = "ACTUAL"  # Nombre de la versión vigente
+VERSIONES_DIR = "versiones"
+USAR_MMAP = os.getenv("VECTOR_INDEX_MMAP", "1") != "0"
+TIPOS_INDICE = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+MUESTRA_ENTRENAMIENTO = 50000
+PUNTOS_POR_CENTROIDE = 39  # Mínimo que FAISS recomienda para entrenar k-means sin avisos
+
+
+def cadena_factory(tipo: str, n: int, dim: int, nlist: Optional[int] = None, pq_m: int = 16,
+                   pq_bits: int = 8, hnsw_m: int = 32) -> str:
+    """Traduce el tipo de índice y sus parámetros a una cadena de `faiss.index_factory`."""
+    if tipo == "flat":
+        return "Flat"
+    if tipo == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if tipo not in ("ivf-flat", "ivf-pq"):
+        raise ValueError(f"Tipo de índice desconocido: {tipo}. Opciones: {', '.join(TIPOS_INDICE)}")
+
+    # Regla habitual: ~4*sqrt(n) listas, sin pasar de lo que el corpus permite entrenar
+    nlist = nlist or int(4 * math.sqrt(n))
+    nlist = max(1, min(nlist, n // PUNTOS_POR_CENTROIDE))
+    if tipo == "ivf-flat":
+        return f"IVF{nlist},Flat"
+
+    if dim % pq_m:
+        raise ValueError(f"pq_m={pq_m} debe dividir la dimensión de los embeddings ({dim}).")
+    if n < 2 ** pq_bits:
+        raise ValueError(f"IVF-PQ con {pq_bits} bits necesita al menos {2 ** pq_bits} documentos (hay {n}).")
+    return f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+
+
+def parametros_busqueda(tipo: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> dict:
+    """Parámetros de búsqueda (ajustan el recall) que se guardan con el índice."""
+    if tipo.startswith("ivf"):
+        return {"nprobe": nprobe or 8}
+    if tipo == "hnsw":
+        return {"efSearch": ef_search or 64}
+    return {}
+
+
+def aplicar_parametros_busqueda(index, params: dict):
+    """Aplica parámetros como `nprobe` o `efSearch` a un índice ya cargado."""
+    espacio = faiss.ParameterSpace()
+    for nombre, valor in (params or {}).items():
+        espacio.set_index_parameter(index, nombre, valor)
+
+
+def construir_indice(vectores: np.ndarray, factory: str, search_params: dict,
+                     muestra_entrenamiento: int = MUESTRA_ENTRENAMIENTO, semilla: int = 0):
+    """Crea el índice, lo entrena con una muestra del corpus si hace falta y añade todos los vectores."""
+    vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+    index = faiss.index_factory(vectores.shape[1], factory)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(semilla)
+        n_muestra = min(len(vectores), muestra_entrenamiento)
+        muestra = vectores[rng.choice(len(vectores), n_muestra, replace=False)]
+        inicio = time.monotonic()
+        index.train(muestra)
+        print(f"   🏋️ Índice {factory} entrenado con {n_muestra} vectores en {time.monotonic() - inicio:.1f}s.")
+
+    index.add(vectores)
+    aplicar_parametros_busqueda(index, search_params)
+    return index
+
+
+def medir_recall(index, vectores: np.ndarray, k: int = 10, n_consultas: int = 200, semilla: int = 0) -> float:
+    """Recall@k del índice frente a una búsqueda exacta, usando documentos del corpus como consultas."""
+    vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+    k = min(k, len(vectores))
+    referencia = faiss.IndexFlatL2(vectores.shape[1])
+    referencia.add(vectores)
+
+    rng = np.random.default_rng(semilla)
+    consultas = vectores[rng.choice(len(vectores), min(n_consultas, len(vectores)), replace=False)]
+    _, esperados = referencia.search(consultas, k)
+    _, obtenidos = index.search(consultas, k)
+
+    aciertos = sum(len(set(e) & (set(o) - {-1})) for e, o in zip(esperados, obtenidos))
+    return aciertos / (len(consultas) * k)
+
+
+def tamano_indice(index) -> int:
+    """Bytes que ocupa el índice serializado (aproxima su memoria residente)."""
+    return int(faiss.serialize_index(index).size)
+
+
+def crear_vector_store(index, textos: List[str], metadatas: List[dict], ids: List[str], embeddings_model) -> FAISS:
+    """Envuelve un índice FAISS ya poblado (en el mismo orden que `ids`) en un vector store de LangChain."""
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=texto, metadata=metadata)
+        for doc_id, texto, metadata in zip(ids, textos, metadatas)
+    })
+    return FAISS(embeddings_model, index, docstore, dict(enumerate(ids)))
+
+
+def resolver_indice(index_path) -> Path:
+    """Directorio con los archivos de la versión vigente; el propio `index_path` si no hay puntero (formato anterior)."""
+    index_path = Path(index_path)
+    try:
+        version = (index_path / PUNTERO_NAME).read_text(encoding='utf-8').strip()
+    except OSError:
+        return index_path
+    return index_path / VERSIONES_DIR / version
+
+
+def leer_manifest(index_path: Path) -> dict:
+    """Lee el manifiesto de la versión vigente del índice; {} si no existe (índices antiguos)."""
+    try:
+        with open(resolver_indice(index_path) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+class SqliteDocstore(Docstore):
+    """Docstore de solo lectura sobre `docstore.sqlite`; no carga los documentos en memoria."""
+
+    def __init__(self, path: Path):
+        # immutable=1: el archivo nunca se modifica en sitio (la ingesta reemplaza el directorio entero)
+        self._conn = sqlite3.connect(f"file:{Path(path).resolve().as_posix()}?mode=ro&immutable=1",
+                                     uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT page_content, metadata FROM documentos WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if fila is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=fila[0], metadata=json.loads(fila[1]))
+
+    def doc_id_por_posicion(self, posicion: int) -> Optional[str]:
+        with self._lock:
+            fila = self._conn.execute("SELECT doc_id FROM documentos WHERE pos = ?", (int(posicion),)).fetchone()
+        return fila[0] if fila else None
+
+    def contar(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+
+
+class _PosicionesSqlite(Mapping):
+    """`index_to_docstore_id` perezoso: posición FAISS -> doc_id consultando SQLite."""
+
+    def __init__(self, docstore: SqliteDocstore):
+        self._docstore = docstore
+        self._total = docstore.contar()
+
+    def __getitem__(self, posicion):
+        doc_id = self._docstore.doc_id_por_posicion(posicion)
+        if doc_id is None:
+            raise KeyError(posicion)
+        return doc_id
+
+    def __len__(self):
+        return self._total
+
+    def __iter__(self):
+        return iter(range(self._total))
+
+
+def guardar_vector_store(vector_store: FAISS, directorio: Path):
+    """Escribe `index.faiss` y `docstore.sqlite` (documentos por posición + índice BM25)."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(vector_store.index, str(directorio / INDEX_NAME))
+
+    conn = sqlite3.connect(directorio / DOCSTORE_NAME)
+    try:
+        conn.execute("DROP TABLE IF EXISTS documentos")
+        conn.execute("""
+            CREATE TABLE documentos (
+                pos INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+
+        textos = []
+
+        def filas():
+            for posicion, doc_id in vector_store.index_to_docstore_id.items():
+                doc = vector_store.docstore.search(doc_id)
+                textos.append((posicion, doc.page_content))
+                yield posicion, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)
+
+        conn.executemany("INSERT INTO documentos VALUES (?, ?, ?, ?)", filas())
+        escribir_bm25(conn, textos)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cargar_indice_lexico(index_path) -> Optional[BM25Index]:
+    """Abre el índice BM25 guardado junto al índice vectorial, o None si no existe."""
+    path = resolver_indice(index_path) / DOCSTORE_NAME
+    if not path.exists():
+        return None
+    try:
+        return BM25Index(path)
+    except sqlite3.Error as e:
+        print(f"⚠️ Índice BM25 no disponible ({e}). Se usará solo la búsqueda vectorial.")
+        return None
+
+
+def _leer_indice(path: Path, mmap: bool):
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            print(f"⚠️ No se pudo mapear el índice en memoria ({e}). Se cargará completo.")
+    return faiss.read_index(str(path))
+
+
+def cargar_vector_store(index_path, embeddings_model, mmap: bool = USAR_MMAP) -> FAISS:
+    """
+    Carga el índice guardado, sea del tipo que sea, con sus parámetros de búsqueda.
+
+    Con `mmap=True` (por defecto en el bot) el índice y los documentos se leen
+    directamente del disco bajo demanda y el resultado es de solo lectura; con
+    `mmap=False` (la ingesta) todo se carga en memoria y se puede modificar.
+    """
+    index_path = resolver_indice(index_path)  # Una sola vez: índice y documentos de la misma versión
+    inicio = time.monotonic()
+    if not (index_path / DOCSTORE_NAME).exists():
+        # Índices creados antes del formato sin pickle
+        vector_store = FAISS.load_local(str(index_path), embeddings_model, allow_dangerous_deserialization=True)
+    elif mmap:
+        index = _leer_indice(index_path / INDEX_NAME, mmap=True)
+        docstore = SqliteDocstore(index_path / DOCSTORE_NAME)
+        vector_store = FAISS(embeddings_model, index, docstore, _PosicionesSqlite(docstore))
+    else:
+        index = _leer_indice(index_path / INDEX_NAME, mmap=False)
+        documentos: Dict[str, Document] = {}
+        posiciones: Dict[int, str] = {}
+        conn = sqlite3.connect(index_path / DOCSTORE_NAME)
+        try:
+            for posicion, doc_id, texto, metadata in conn.execute(
+                "SELECT pos, doc_id, page_content, metadata FROM documentos ORDER BY pos"
+            ):
+                documentos[doc_id] = Document(id=doc_id, page_content=texto, metadata=json.loads(metadata))
+                posiciones[posicion] = doc_id
+        finally:
+            conn.close()
+        vector_store = FAISS(embeddings_model, index, InMemoryDocstore(documentos), posiciones)
+
+    info = leer_manifest(index_path).get("index", {})
+    aplicar_parametros_busqueda(vector_store.index, info.get("search_params"))
+    modo = "mmap" if mmap and (index_path / DOCSTORE_NAME).exists() else "memoria"
+    print(f"   🗂️ Índice {info.get('factory', 'Flat')} con {vector_store.index.ntotal} vectores "
+          f"({modo}, {time.monotonic() - inicio:.2f}s).")
+    return vector_store
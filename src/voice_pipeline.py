@@ -0,0 +1,120 @@
+"""
+Pipeline de notas de voz: transcripción y agente fuera del event loop.
+
+Cada etapa tiene su propio pool de hilos (concurrencia limitada) y un máximo de
+notas esperando. Si una etapa está llena, `reservar()` lanza `ColaLlena` y el
+bot responde "ocupado" en lugar de acumular trabajo sin límite.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+VOICE_TRANSCRIBE_WORKERS = int(os.getenv("VOICE_TRANSCRIBE_WORKERS", "4"))  # Decodifican y esperan al lote de Whisper
+VOICE_AGENT_WORKERS = int(os.getenv("VOICE_AGENT_WORKERS", "4"))
+VOICE_QUEUE_MAX = int(os.getenv("VOICE_QUEUE_MAX", "8"))  # Notas esperando por etapa
+
+
+class ColaLlena(Exception):
+    """La etapa ya tiene el máximo de trabajos en curso y en espera."""
+
+
+class _Reserva:
+    def __init__(self, etapa: "Etapa"):
+        self._etapa = etapa
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._etapa._pendientes -= 1
+        return False
+
+
+class Etapa:
+    """Etapa con `concurrencia` trabajos simultáneos y hasta `max_en_cola` esperando."""
+
+    def __init__(self, nombre: str, concurrencia: int, max_en_cola: int):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.capacidad = concurrencia + max_en_cola
+        self._semaforo = None  # Para `esperar`; se crea dentro del event loop
+        self._executor = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix=f"voz-{nombre}")
+        # Solo se modifican desde el event loop, no necesitan lock
+        self._pendientes = 0
+        self._profundidad_max = 0
+        self._completados = 0
+        self._rechazados = 0
+        self._segundos_espera = 0.0
+        self._segundos_ejecucion = 0.0
+
+    def reservar(self) -> _Reserva:
+        """Ocupa un lugar en la etapa (se libera al salir del `with`); lanza ColaLlena si no hay."""
+        if self._pendientes >= self.capacidad:
+            self._rechazados += 1
+            raise ColaLlena(self.nombre)
+        self._pendientes += 1
+        self._profundidad_max = max(self._profundidad_max, self._pendientes)
+        return _Reserva(self)
+
+    async def ejecutar(self, funcion, *args):
+        """Ejecuta `funcion(*args)` en el pool de la etapa y mide espera y ejecución."""
+        encolado = time.monotonic()
+        tiempos = {}
+
+        def medir():
+            inicio = time.monotonic()
+            tiempos["espera"] = inicio - encolado
+            try:
+                return funcion(*args)
+            finally:
+                tiempos["ejecucion"] = time.monotonic() - inicio
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, medir)
+        finally:
+            self._registrar(tiempos.get("espera", 0.0), tiempos.get("ejecucion", 0.0))
+
+    async def esperar(self, corrutina):
+        """Como `ejecutar`, para corrutinas (p. ej. el agente async): mismo límite de concurrencia, sin hilos."""
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrencia)
+        encolado = time.monotonic()
+        try:
+            await self._semaforo.acquire()
+        except asyncio.CancelledError:
+            corrutina.close()  # Nunca llegó a correr
+            raise
+        try:
+            inicio = time.monotonic()
+            try:
+                return await corrutina
+            finally:
+                self._registrar(inicio - encolado, time.monotonic() - inicio)
+        finally:
+            self._semaforo.release()
+
+    def _registrar(self, espera: float, ejecucion: float):
+        self._completados += 1
+        self._segundos_espera += espera
+        self._segundos_ejecucion += ejecucion
+        print(f"[VOZ] {self.nombre}: espera {espera:.2f}s, ejecución {ejecucion:.2f}s, en cola {self._pendientes}")
+
+    def metricas(self) -> dict:
+        return {
+            "en_cola": self._pendientes,
+            "profundidad_max": self._profundidad_max,
+            "completados": self._completados,
+            "rechazados": self._rechazados,
+            "espera_media_s": round(self._segundos_espera / self._completados, 2) if self._completados else 0.0,
+            "ejecucion_media_s": round(self._segundos_ejecucion / self._completados, 2) if self._completados else 0.0,
+        }
+
+
+transcripcion = Etapa("transcripcion", VOICE_TRANSCRIBE_WORKERS, VOICE_QUEUE_MAX)
+agente = Etapa("agente", VOICE_AGENT_WORKERS, VOICE_QUEUE_MAX)
+
+
+def metricas() -> dict:
+    return {"transcripcion": transcripcion.metricas(), "agente": agente.metricas()}
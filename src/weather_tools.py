@@ -2,126 +2,264 @@
 Herramientas relacionadas con el clima.
 """
 import os
-import requests
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 from langchain.tools import Tool
+import http_client
+import places_api
+from cache_utils import AsyncSingleFlight, SingleFlight, TTLCache
 
 
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://weather.googleapis.com")  # Otra base para pruebas (bench/fakes)
+WEATHER_URL = f"{WEATHER_API_URL}/v1/forecast/days:lookup"
+
+# --- Caché del pronóstico por celda geohash y día local ---
+# Lugares a pocos cientos de metros comparten el mismo pronóstico diario; una
+# celda de precisión 6 mide ~1.2 km x 0.6 km.
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "1800"))  # segundos
+WEATHER_CACHE_MAX = int(os.getenv("WEATHER_CACHE_MAX", "512"))
+WEATHER_CACHE_PRECISION = int(os.getenv("WEATHER_CACHE_PRECISION", "6"))
+WEATHER_CACHE_DB = os.getenv("WEATHER_CACHE_DB")  # p. ej. data/weather_cache.db para sobrevivir reinicios
+ZONA_CALI = timezone(timedelta(hours=-5))  # Colombia no tiene horario de verano
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+_clima_cache = TTLCache(WEATHER_CACHE_TTL, WEATHER_CACHE_MAX, db_path=WEATHER_CACHE_DB, tabla="clima")
+_clima_en_vuelo = SingleFlight()
+_clima_en_vuelo_async = AsyncSingleFlight()
+
+
+def geohash(lat: float, lng: float, precision: int = WEATHER_CACHE_PRECISION) -> str:
+    """Codifica lat/lng como geohash de `precision` caracteres."""
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    resultado, bits, valor, usar_lng = [], 0, 0, True
+    while len(resultado) < precision:
+        rango, coord = (rango_lng, lng) if usar_lng else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coord >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        usar_lng = not usar_lng
+        bits += 1
+        if bits == 5:
+            resultado.append(_GEOHASH_BASE32[valor])
+            bits, valor = 0, 0
+    return "".join(resultado)
+
+
+def _clave_clima(lat: float, lng: float) -> str:
+    return f"{geohash(lat, lng)}:{datetime.now(ZONA_CALI).date().isoformat()}"
 
 
 def obtener_clima_por_latlng(lat: float, lng: float) -> str:
-    """Consulta el pronóstico del clima para una ubicación y devuelve el del día actual."""
+    """Devuelve el pronóstico de hoy para una ubicación, usando la caché por celda y día."""
+    if not WEATHER_API_KEY:
+        return "⚠️ Clima no disponible (falta WEATHER_API_KEY)."
+
+    clave = _clave_clima(lat, lng)
+    clima = _clima_cache.get(clave)
+    if clima is not None:
+        print(f"[DEBUG] Clima desde caché para {clave}")
+        return clima
+
+    def consultar():
+        # Otro hilo pudo haber llenado la caché mientras esperábamos
+        clima = _clima_cache.get(clave)
+        if clima is None:
+            clima, cacheable = _consultar_clima_api(lat, lng)
+            if cacheable:
+                _clima_cache.set(clave, clima)
+        return clima
+
+    # Peticiones simultáneas para la misma celda comparten una sola llamada a la API
+    return _clima_en_vuelo.do(clave, consultar)
+
+
+async def aobtener_clima_por_latlng(lat: float, lng: float) -> str:
+    """Versión async de `obtener_clima_por_latlng` (misma caché)."""
+    if not WEATHER_API_KEY:
+        return "⚠️ Clima no disponible (falta WEATHER_API_KEY)."
+
+    clave = _clave_clima(lat, lng)
+    clima = _clima_cache.get(clave)
+    if clima is not None:
+        print(f"[DEBUG] Clima desde caché para {clave}")
+        return clima
+
+    async def consultar():
+        clima, cacheable = await _aconsultar_clima_api(lat, lng)
+        if cacheable:
+            _clima_cache.set(clave, clima)
+        return clima
+
+    return await _clima_en_vuelo_async.do(clave, consultar)
+
+
+def _parametros_clima(lat: float, lng: float) -> dict:
+    return {
+        "key": WEATHER_API_KEY,
+        "location.latitude": lat,
+        "location.longitude": lng,
+        "unitsSystem": "METRIC",
+        "days": "1" # Pedimos solo el pronóstico para el día actual
+    }
+
+
+def _error_clima(e: Exception) -> Tuple[str, bool]:
+    print(f"[ERROR] Error en API de Clima: {e}")
+    import traceback
+    traceback.print_exc()
+    return "Pronóstico no disponible.", False
+
+
+def _consultar_clima_api(lat: float, lng: float) -> Tuple[str, bool]:
+    """Consulta la Weather API. Retorna (texto, cacheable): los errores no se cachean."""
     try:
-        if not WEATHER_API_KEY:
-            return "⚠️ Clima no disponible (falta WEATHER_API_KEY)."
-
-        # URL corregida para usar el pronóstico diario según especificación
-        url = "https://weather.googleapis.com/v1/forecast/days:lookup"
-        params = {
-            "key": WEATHER_API_KEY,
-            "location.latitude": lat,
-            "location.longitude": lng,
-            "unitsSystem": "METRIC",
-            "days": "1" # Pedimos solo el pronóstico para el día actual
-        }
-        
         print(f"[DEBUG] Consultando clima para lat={lat}, lng={lng}")
-        resp = requests.get(url, params=params, timeout=10)
-        
-        print(f"[DEBUG] Status Code: {resp.status_code}")
-        print(f"[DEBUG] Response: {resp.text[:500]}")  # Primeros 500 caracteres
-        
-        if resp.status_code != 200:
-            # Intentamos decodificar el error por si Google nos da más detalles
-            try:
-                error_details = resp.json().get("error", {}).get("message", "")
-                print(f"[DEBUG] Error de API: {error_details}")
-                return f"Clima no disponible ({resp.status_code}): {error_details}"
-            except:
-                return f"Clima no disponible ({resp.status_code})."
-
-        data = resp.json() or {}
-        print(f"[DEBUG] Estructura de respuesta: {list(data.keys())}")
-        
-        # CORREGIDO: La respuesta viene en 'forecastDays', no en 'forecast.days'
-        forecast_days = data.get("forecastDays", [])
-        
-        if not forecast_days:
-            print(f"[DEBUG] No se encontraron días en forecastDays. Data completo: {data}")
-            return "No se encontró pronóstico del clima."
-
-        # Tomamos el primer día de la lista (el día actual)
-        today_forecast = forecast_days[0]
-        print(f"[DEBUG] Campos del pronóstico: {list(today_forecast.keys())}")
-        
-        # CORREGIDO: Los campos son maxTemperature y minTemperature (objetos con 'degrees')
-        temp_max_obj = today_forecast.get("maxTemperature", {})
-        temp_min_obj = today_forecast.get("minTemperature", {})
-        temp_max = temp_max_obj.get("degrees") if temp_max_obj else None
-        temp_min = temp_min_obj.get("degrees") if temp_min_obj else None
-        
-        # Obtenemos la condición del clima del pronóstico diurno
-        daytime = today_forecast.get("daytimeForecast", {})
-        weather_cond = daytime.get("weatherCondition", {})
-        cond = weather_cond.get("description", {}).get("text")
-        
-        # Obtenemos el viento del pronóstico diurno
-        wind_obj = daytime.get("wind", {})
-        wind_speed = wind_obj.get("speed", {})
-        wind = wind_speed.get("value") if wind_speed else None
-
-        partes = []
-        if temp_min is not None and temp_max is not None:
-            partes.append(f"{temp_min}°C - {temp_max}°C")
-        if cond:
-            partes.append(str(cond))
-        if wind is not None:
-            partes.append(f"viento {wind} km/h")
-
-        resultado = " | ".join(partes) if partes else "Pronóstico no disponible."
-        print(f"[DEBUG] Resultado final: {resultado}")
-        # Agregar emoji al principio para formato consistente
-        return f"☀️ {resultado}"
+        resp = http_client.get(WEATHER_URL, params=_parametros_clima(lat, lng), timeout=10)
+        return _interpretar_clima(resp)
     except Exception as e:
-        print(f"[ERROR] Error en API de Clima: {e}")
-        import traceback
-        traceback.print_exc()
-        return "Pronóstico no disponible."
-        return "Pronóstico no disponible."
+        return _error_clima(e)
+
+
+async def _aconsultar_clima_api(lat: float, lng: float) -> Tuple[str, bool]:
+    try:
+        print(f"[DEBUG] Consultando clima (async) para lat={lat}, lng={lng}")
+        resp = await http_client.aget(WEATHER_URL, params=_parametros_clima(lat, lng), timeout=10)
+        return _interpretar_clima(resp)
+    except Exception as e:
+        return _error_clima(e)
+
+
+def _interpretar_clima(resp) -> Tuple[str, bool]:
+    """Convierte la respuesta (de requests o httpx) en (texto, cacheable)."""
+    print(f"[DEBUG] Status Code: {resp.status_code}")
+    print(f"[DEBUG] Response: {resp.text[:500]}")  # Primeros 500 caracteres
+    
+    if resp.status_code != 200:
+        # Intentamos decodificar el error por si Google nos da más detalles
+        try:
+            error_details = resp.json().get("error", {}).get("message", "")
+            print(f"[DEBUG] Error de API: {error_details}")
+            return f"Clima no disponible ({resp.status_code}): {error_details}", False
+        except:
+            return f"Clima no disponible ({resp.status_code}).", False
+
+    data = resp.json() or {}
+    print(f"[DEBUG] Estructura de respuesta: {list(data.keys())}")
+    
+    # CORREGIDO: La respuesta viene en 'forecastDays', no en 'forecast.days'
+    forecast_days = data.get("forecastDays", [])
+    
+    if not forecast_days:
+        print(f"[DEBUG] No se encontraron días en forecastDays. Data completo: {data}")
+        return "No se encontró pronóstico del clima.", False
+
+    # Tomamos el primer día de la lista (el día actual)
+    today_forecast = forecast_days[0]
+    print(f"[DEBUG] Campos del pronóstico: {list(today_forecast.keys())}")
+    
+    # CORREGIDO: Los campos son maxTemperature y minTemperature (objetos con 'degrees')
+    temp_max_obj = today_forecast.get("maxTemperature", {})
+    temp_min_obj = today_forecast.get("minTemperature", {})
+    temp_max = temp_max_obj.get("degrees") if temp_max_obj else None
+    temp_min = temp_min_obj.get("degrees") if temp_min_obj else None
+    
+    # Obtenemos la condición del clima del pronóstico diurno
+    daytime = today_forecast.get("daytimeForecast", {})
+    weather_cond = daytime.get("weatherCondition", {})
+    cond = weather_cond.get("description", {}).get("text")
+    
+    # Obtenemos el viento del pronóstico diurno
+    wind_obj = daytime.get("wind", {})
+    wind_speed = wind_obj.get("speed", {})
+    wind = wind_speed.get("value") if wind_speed else None
+
+    partes = []
+    if temp_min is not None and temp_max is not None:
+        partes.append(f"{temp_min}°C - {temp_max}°C")
+    if cond:
+        partes.append(str(cond))
+    if wind is not None:
+        partes.append(f"viento {wind} km/h")
+
+    resultado = " | ".join(partes) if partes else "Pronóstico no disponible."
+    print(f"[DEBUG] Resultado final: {resultado}")
+    # Agregar emoji al principio para formato consistente
+    return f"☀️ {resultado}", bool(partes)
+
+
+# Campos de Places que necesita el clima de un lugar
+CAMPOS_UBICACION = ("places.displayName", "places.location")
+
+
+def _primer_lugar(places: list) -> Optional[dict]:
+    """Primer resultado de Places con la forma de `places_api.ubicacion_por_nombre`, o None."""
+    if not places:
+        return None
+    return {"nombre": places[0].get("displayName", {}).get("text", "Lugar"),
+            "location": places[0].get("location") or {}}
+
+
+def _aviso_lugar(lugar: Optional[dict]) -> Optional[str]:
+    """Mensaje para el usuario si el lugar no sirve para pedir el clima; None si sí."""
+    if lugar is None:
+        return "No encontré ese lugar para consultar su clima."
+    if lugar["location"].get("latitude") is None or lugar["location"].get("longitude") is None:
+        return "No pude obtener coordenadas de ese lugar."
+    return None
+
+
+def _pronostico_lugar(lugar: dict, clima: str) -> str:
+    return f"☀️ Pronóstico para hoy en {lugar['nombre']}: {clima}"
+
+
+def _error_clima_lugar(query: str, e: Exception) -> str:
+    print(f"[ERROR] No se pudo obtener el clima de {query!r}: {e}")
+    return "No logré obtener el clima del lugar."
 
 
 def clima_por_lugar(query: str) -> str:
     """Busca un lugar por texto y devuelve solo clima del primer match."""
     try:
-        # CORREGIDO: Usar la URL correcta de Google Places, NO de Weather
-        url = "https://places.googleapis.com/v1/places:searchText"
-        payload = {"textQuery": f"{query} en Cali"}
-        headers = {
-            "X-Goog-Api-Key": GOOGLE_PLACES_API_KEY,
-            "X-Goog-FieldMask": "places.displayName,places.location"
-        }
-        r = requests.post(url, json=payload, headers=headers, timeout=10)
-        r.raise_for_status()
-        places = (r.json() or {}).get("places", [])
-        if not places:
-            return "No encontré ese lugar para consultar su clima."
-
-        loc = places[0].get("location") or {}
-        lat, lng = loc.get("latitude"), loc.get("longitude")
-        if lat is None or lng is None:
-            return "No pude obtener coordenadas de ese lugar."
-
-        clima = obtener_clima_por_latlng(lat, lng)
-        nombre = places[0].get("displayName", {}).get("text", "Lugar")
-        return f"☀️ Pronóstico para hoy en {nombre}: {clima}"
+        # Si el lugar ya apareció en una búsqueda, sus coordenadas se conocen sin llamar a Places
+        lugar = places_api.ubicacion_por_nombre(query)
+        if lugar is None:
+            lugar = _primer_lugar(places_api.buscar_lugares(query, CAMPOS_UBICACION, timeout=10))
+        aviso = _aviso_lugar(lugar)
+        if aviso:
+            return aviso
+
+        loc = lugar["location"]
+        return _pronostico_lugar(lugar, obtener_clima_por_latlng(loc["latitude"], loc["longitude"]))
+    except Exception as e:
+        return _error_clima_lugar(query, e)
+
+
+async def aclima_por_lugar(query: str) -> str:
+    """Versión async de `clima_por_lugar` para el agente con `ainvoke`."""
+    try:
+        lugar = places_api.ubicacion_por_nombre(query)
+        if lugar is None:
+            lugar = _primer_lugar(await places_api.abuscar_lugares(query, CAMPOS_UBICACION, timeout=10))
+        aviso = _aviso_lugar(lugar)
+        if aviso:
+            return aviso
+
+        loc = lugar["location"]
+        return _pronostico_lugar(lugar, await aobtener_clima_por_latlng(loc["latitude"], loc["longitude"]))
     except Exception as e:
-        return "No logré obtener el clima del lugar."
+        return _error_clima_lugar(query, e)
 
 
 # Crear la herramienta para el agente
 tool_clima_por_lugar = Tool(
     name="clima_por_lugar",
     func=clima_por_lugar,
+    coroutine=aclima_por_lugar,
     description="Devuelve el pronóstico del clima para hoy en un lugar específico de Cali."
 )
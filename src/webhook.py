@@ -0,0 +1,226 @@
+"""
+Modo webhook con varios procesos (BOT_MODE=webhook).
+
+Con polling todo corre en un proceso: Whisper, embeddings y el event loop
+comparten un GIL. En modo webhook:
+
+- El ingress (aiohttp, proceso principal) recibe los updates que manda
+  Telegram, valida el secret token, responde 200 de inmediato y pasa cada
+  update a un worker según su chat_id. Un chat siempre cae en el mismo worker:
+  se conserva el orden de sus mensajes y sus cachés de historial y memoria.
+- Cada worker es un proceso con su propia Application de PTB sin Updater; los
+  updates le llegan por una multiprocessing.Queue y entran por
+  `application.update_queue`, con concurrent_updates y locks por chat como
+  en polling.
+
+Cada worker carga sus propios modelos (WEBHOOK_WORKERS copias en memoria; el
+índice FAISS se comparte con mmap), por eso son pocos. Si la cola de un worker
+se llena, el ingress responde 503 y Telegram reintenta el update más tarde.
+
+El ingress vigila los workers: uno que muere se vuelve a lanzar con la misma
+cola (como mucho una vez cada WEBHOOK_RESTART_INTERVAL segundos) y, mientras
+no está vivo, sus updates reciben 503 y `/salud` también responde 503.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from typing import List, Optional
+
+from aiohttp import web
+from telegram import Bot, Update
+
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL pública que se registra en Telegram, p. ej. https://bot.ejemplo.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # secret_token de setWebhook; Telegram lo manda en cada update
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))  # Cada uno con Whisper, embeddings y LLM propios
+WEBHOOK_RESTART_INTERVAL = float(os.getenv("WEBHOOK_RESTART_INTERVAL", "10"))  # Segundos mínimos entre reinicios
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "1000"))  # Updates pendientes por worker
+CABECERA_SECRETO = "X-Telegram-Bot-Api-Secret-Token"
+CAMPOS_CON_CHAT = ("message", "edited_message", "channel_post", "edited_channel_post",
+                   "business_message", "edited_business_message")
+
+
+def clave_chat(update: dict) -> int:
+    """chat_id del update (o el usuario, para updates sin chat); update_id como último recurso."""
+    for campo in CAMPOS_CON_CHAT:
+        if campo in update:
+            return update[campo]["chat"]["id"]
+    consulta = update.get("callback_query")
+    if consulta and consulta.get("message"):
+        return consulta["message"]["chat"]["id"]
+    for valor in update.values():
+        if isinstance(valor, dict):
+            usuario = valor.get("from") or valor.get("user")
+            if usuario:
+                return usuario["id"]
+    return update.get("update_id", 0)
+
+
+def worker_de(update: dict, workers: int) -> int:
+    return clave_chat(update) % workers
+
+
+# --- Worker ---
+
+def _worker(indice: int, cola: "multiprocessing.Queue"):
+    asyncio.run(_atender(indice, cola))
+
+
+async def _atender(indice: int, cola: "multiprocessing.Queue"):
+    import main
+
+    application = main.build_application(with_updater=False)
+    await application.initialize()
+    # La retención del historial recorre toda la base: basta con que la corra un worker
+    await main.on_startup(application, retention=indice == 0)
+    await application.start()
+    print(f"[WEBHOOK] Worker {indice} listo (pid {os.getpid()})")
+    try:
+        while True:
+            datos = await asyncio.to_thread(cola.get)
+            if datos is None:
+                break
+            await application.update_queue.put(Update.de_json(datos, application.bot))
+    finally:
+        await application.stop()
+        await main.on_shutdown(application)
+        await application.shutdown()
+        print(f"[WEBHOOK] Worker {indice} detenido")
+
+
+# --- Ingress ---
+
+class Ingress:
+    """Recibe los updates por HTTP y los reparte entre los workers por chat_id."""
+
+    def __init__(self, workers: int = WEBHOOK_WORKERS, max_en_cola: int = WEBHOOK_QUEUE_MAX):
+        self._contexto = multiprocessing.get_context("spawn")  # Sin fork: cada worker arranca limpio (torch, hilos)
+        self.colas: List[multiprocessing.Queue] = [self._contexto.Queue(max_en_cola) for _ in range(workers)]
+        self.procesos = [self._nuevo_proceso(i) for i in range(workers)]
+        self.recibidos = [0] * workers
+        self.reinicios = [0] * workers
+        self.rechazados = 0
+        self._ultimo_inicio = [0.0] * workers
+        self._deteniendo = False
+        self._inicio = time.monotonic()
+
+    def _nuevo_proceso(self, indice: int) -> multiprocessing.Process:
+        return self._contexto.Process(target=_worker, args=(indice, self.colas[indice]),
+                                      name=f"cal-e-worker-{indice}")
+
+    def iniciar(self):
+        for proceso in self.procesos:
+            proceso.start()
+        self._ultimo_inicio = [time.monotonic()] * len(self.procesos)
+        print(f"[WEBHOOK] {len(self.procesos)} workers iniciados")
+
+    def vigilar(self, indice: int) -> bool:
+        """True si el worker está vivo; si murió, lo relanza (respetando WEBHOOK_RESTART_INTERVAL)."""
+        proceso = self.procesos[indice]
+        if proceso.is_alive():
+            return True
+        if self._deteniendo or time.monotonic() - self._ultimo_inicio[indice] < WEBHOOK_RESTART_INTERVAL:
+            return False
+        print(f"[WEBHOOK] Worker {indice} (pid {proceso.pid}) murió con código {proceso.exitcode}, se relanza")
+        proceso = self._nuevo_proceso(indice)
+        proceso.start()
+        self.procesos[indice] = proceso
+        self.reinicios[indice] += 1
+        self._ultimo_inicio[indice] = time.monotonic()
+        return True
+
+    async def supervisar(self, intervalo: float = 5):
+        """Revisa los workers periódicamente, aunque no lleguen updates."""
+        while not self._deteniendo:
+            for indice in range(len(self.procesos)):
+                self.vigilar(indice)
+            await asyncio.sleep(intervalo)
+
+    def detener(self, timeout: float = 30):
+        self._deteniendo = True
+        for cola in self.colas:
+            cola.put(None)
+        for proceso in self.procesos:
+            proceso.join(timeout)
+            if proceso.is_alive():
+                proceso.terminate()
+
+    def despachar(self, update: dict) -> bool:
+        """Encola el update en el worker de su chat; False si esa cola está llena o el worker no está vivo."""
+        indice = worker_de(update, len(self.colas))
+        if not self.vigilar(indice):
+            self.rechazados += 1
+            print(f"[WEBHOOK] Worker {indice} caído, update {update.get('update_id')} rechazado")
+            return False
+        try:
+            self.colas[indice].put_nowait(update)
+        except queue.Full:
+            self.rechazados += 1
+            print(f"[WEBHOOK] Cola del worker {indice} llena, update {update.get('update_id')} rechazado")
+            return False
+        self.recibidos[indice] += 1
+        return True
+
+    async def recibir(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(CABECERA_SECRETO) != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        # 503: Telegram reintenta más tarde en vez de perder el update
+        return web.Response(status=200 if self.despachar(update) else 503)
+
+    async def salud(self, request: web.Request) -> web.Response:
+        metricas = self.metricas()
+        sano = all(worker["vivo"] for worker in metricas["workers"])
+        return web.json_response(metricas, status=200 if sano else 503)
+
+    def metricas(self) -> dict:
+        workers = []
+        for proceso, cola, recibidos, reinicios in zip(self.procesos, self.colas, self.recibidos, self.reinicios):
+            try:
+                en_cola: Optional[int] = cola.qsize()
+            except NotImplementedError:  # macOS
+                en_cola = None
+            workers.append({"pid": proceso.pid, "vivo": proceso.is_alive(), "recibidos": recibidos,
+                            "reinicios": reinicios, "en_cola": en_cola})
+        return {"workers": workers, "rechazados": self.rechazados,
+                "segundos_activo": round(time.monotonic() - self._inicio, 1)}
+
+
+def run(token: str, base_url: Optional[str] = None):
+    """Arranca los workers y sirve el webhook hasta Ctrl+C."""
+    ingress = Ingress()
+    ingress.iniciar()
+
+    async def registrar_webhook(app: web.Application):
+        if not WEBHOOK_URL:
+            print("[WEBHOOK] WEBHOOK_URL no definida: no se registra el webhook en Telegram")
+            return
+        async with Bot(token, base_url=base_url or "https://api.telegram.org/bot") as bot:
+            await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES,
+                                  max_connections=100)
+        print(f"[WEBHOOK] Webhook registrado en {WEBHOOK_URL}")
+
+    async def iniciar_supervision(app: web.Application):
+        app["supervision"] = asyncio.create_task(ingress.supervisar())
+
+    async def detener_workers(app: web.Application):
+        app["supervision"].cancel()
+        await asyncio.to_thread(ingress.detener)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, ingress.recibir)
+    app.router.add_get("/salud", ingress.salud)
+    app.on_startup.append(registrar_webhook)
+    app.on_startup.append(iniciar_supervision)
+    app.on_cleanup.append(detener_workers)
+
+    print(f"\nBot de Telegram iniciado. Usando webhook en {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}...")
+    web.run_app(app, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, print=None)